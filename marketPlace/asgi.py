@@ -5,6 +5,22 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Under ASGI the catalog read views (home, product list/detail and the JSON
+API) are served by the native async views in products/async_views.py, so a
+single worker process can keep many slow clients in flight. It is not faster:
+the database, cache and template cache I/O still block and run in threads,
+and `manage.py bench --asgi` measures the sync views under WSGI at 1.5-3x the
+throughput. Prefer WSGI unless you need many long-lived connections. Run it
+with e.g.
+
+    uvicorn marketPlace.asgi:application --workers 4
+    daphne marketPlace.asgi:application
+
+With several workers keep the default shared cache (files or REDIS_URL), not
+CACHE_BACKEND=locmem, so catalog invalidations reach every worker.
+
+Set ASYNC_VIEWS=0 to serve the regular sync views instead.
 """
 
 import os
@@ -12,5 +28,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'marketPlace.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,36 @@
+"""
+Database helpers shared by the apps.
+
+SQLite starts transactions DEFERRED: a transaction that reads and then writes
+has to upgrade its lock, and when another connection is writing at that point
+SQLite fails at once with "database is locked" instead of waiting on
+busy_timeout. Blocks that read and then write open with write_atomic(),
+which begins them IMMEDIATE (taking the write lock up front, waiting on
+busy_timeout). Every other transaction, read-only ones included, stays
+DEFERRED and never waits for the write lock.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+@contextmanager
+def write_atomic(using=None):
+    """transaction.atomic() that takes SQLite's write lock when the transaction starts"""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # other databases lock rows as they go; a nested block shares the outer transaction
+        with transaction.atomic(using=using):
+            yield
+        return
+    # connecting reads transaction_mode from the settings, so connect before overriding it
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # BEGIN IMMEDIATE has run, later transactions of this connection are unaffected
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
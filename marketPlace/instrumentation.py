@@ -0,0 +1,178 @@
+"""
+Per-request instrumentation: SQL count/time, template render time and total
+view time, reported through a ``Server-Timing`` header and a structured log
+line, with detection of repeated identical SQL (N+1 patterns) and optional
+per-view query budgets.
+
+Settings:
+    SERVER_TIMING          add the Server-Timing header (default True)
+    N_PLUS_ONE_THRESHOLD   repeats of one SQL statement that get flagged (default 5)
+    QUERY_BUDGETS          {'namespace:view_name': max_queries} for anonymous requests
+    QUERY_BUDGET_AUTH_ALLOWANCE  extra queries allowed when a session user is loaded (default 4)
+    QUERY_BUDGET_STRICT    raise QueryBudgetExceeded instead of logging (for tests)
+"""
+import contextvars
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+
+logger = logging.getLogger('marketPlace.perf')
+
+# stats of the request being handled in the current thread/task
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more SQL queries than its QUERY_BUDGETS entry allows"""
+
+
+class RequestStats:
+    """Counters collected while one request is handled"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: time every statement sent to the database
+        if _current.get() is not self:
+            # concurrent async requests can share one executor thread (and its
+            # connection); sync_to_async copies the context, so only count our own
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """SQL statements (with placeholders) executed at least threshold times"""
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+
+def current_stats():
+    """Stats of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+class InstrumentationMiddleware:
+    """Measure each request and report it via Server-Timing and the marketPlace.perf logger"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self._wrap_connections(stack, stats)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        authenticated = self.budget(request) is not None and getattr(request, 'user', None) is not None and request.user.is_authenticated
+        self.report(request, response, stats, total, authenticated)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        # async ORM calls run in the request's thread-sensitive executor thread,
+        # so the query wrappers have to be installed (and removed) there
+        stack = ExitStack()
+        await sync_to_async(self._wrap_connections)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        total = time.perf_counter() - start
+        authenticated = False
+        if self.budget(request) is not None and hasattr(request, 'auser'):
+            # request.user would query the session synchronously here
+            authenticated = (await request.auser()).is_authenticated
+        self.report(request, response, stats, total, authenticated)
+        return response
+
+    def _wrap_connections(self, stack, stats):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats.record_query))
+
+    def budget(self, request):
+        """QUERY_BUDGETS entry of the resolved view, if any"""
+        match = getattr(request, 'resolver_match', None)
+        return getattr(settings, 'QUERY_BUDGETS', {}).get(match.view_name if match else '')
+
+    def report(self, request, response, stats, total, authenticated=False):
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+                f'tpl;dur={stats.template_time * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ])
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else ''
+        logger.info(
+            'request method=%s path=%s view=%s status=%s total_ms=%.2f db_ms=%.2f queries=%d tpl_ms=%.2f',
+            request.method, request.path, view_name or '-', response.status_code,
+            total * 1000, stats.db_time * 1000, stats.queries, stats.template_time * 1000,
+        )
+
+        for sql, count in stats.repeated(getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)).items():
+            logger.warning('repeated-query view=%s path=%s count=%d sql=%s', view_name or '-', request.path, count, sql)
+
+        budget = self.budget(request)
+        if budget is not None and authenticated:
+            # loading the session and the user is not the view's cost
+            budget += getattr(settings, 'QUERY_BUDGET_AUTH_ALLOWANCE', 4)
+        if budget is not None and stats.queries > budget:
+            message = f"{view_name} ran {stats.queries} queries (budget {budget}) for {request.path}"
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning('query-budget-exceeded %s', message)
+
+
+class TimedTemplate(Template):
+    """Django template that adds its render time to the current request stats"""
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
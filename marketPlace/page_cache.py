@@ -0,0 +1,158 @@
+"""
+Full-page cache for anonymous GET requests of pages every visitor sees alike.
+
+Sits near the top of MIDDLEWARE, so a hit skips the session, auth, CSRF and
+messages middleware, the view and the template render: it is one cache read
+of the stored body and headers.
+
+A request is served from (and stored to) the cache only when it
+    - is a GET of one of the PAGE_CACHE_URLS pages,
+    - carries no session or messages cookie (logged-in users and pending
+      flash messages always get a fresh page),
+    - has no query parameters besides the page's known ones (tracking
+      parameters such as utm_* are ignored).
+A response is stored only when it is a plain 200 that sets no cookie, did not
+use a CSRF token and does not forbid caching. Keys include the catalog
+generation (products.cache), so any Product change purges every page.
+
+Settings:
+    PAGE_CACHE_TIMEOUT     seconds a page stays cached (default 600, 0 disables the cache)
+    PAGE_CACHE_ALIAS       cache alias the pages are stored in (default 'default')
+"""
+import hashlib
+from urllib.parse import parse_qsl, urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from products import cache as catalog_cache
+from products.facets import FILTER_PARAMS
+
+
+# URL name -> query parameters that change the page, of every cached page
+# (contactus:contact_us renders a CSRF token per visitor, so it cannot be shared)
+PAGE_CACHE_URLS = {
+    'home': [],
+    'products:product_list': ['after', 'before', *FILTER_PARAMS],
+    'aboutus:about_us': [],
+}
+# query parameters no view reads (analytics tags), left out of the key
+IGNORED_PARAM_PREFIXES = ('utm_', 'fbclid', 'gclid', 'mc_')
+# response headers never replayed from the cache
+UNCACHED_HEADERS = {'set-cookie', 'server-timing'}
+
+
+def _timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def _cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+class PageCacheMiddleware:
+    """Serve the anonymous home, product list and about pages from the cache"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self._pages = None
+
+    @property
+    def pages(self):
+        # {path: allowed query parameters}, reversed on first use when the URLconf is loaded;
+        # reverse() includes the script prefix, so requests are matched on request.path too
+        if self._pages is None:
+            self._pages = {reverse(name): set(params) for name, params in PAGE_CACHE_URLS.items()}
+        return self._pages
+
+    def cache_name(self, request):
+        """Key suffix of a cacheable request (without the generation), None if it must not be cached"""
+        if request.method != 'GET' or not _timeout():
+            return None
+        allowed = self.pages.get(request.path)
+        if allowed is None:
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES:
+            return None
+        params = []
+        for name, value in parse_qsl(request.META.get('QUERY_STRING', '')):
+            if name.startswith(IGNORED_PARAM_PREFIXES):
+                continue
+            if name not in allowed:
+                return None
+            params.append((name, value))
+        # ?page=2&q=x and ?q=x&page=2 are the same page
+        raw = f'{request.path}?{urlencode(sorted(params))}'
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = self.cache_name(request)
+        if name is None:
+            return self.get_response(request)
+        key = f'page:{catalog_cache.generation()}:{name}'
+        cached = _cache().get(key)
+        if cached is not None:
+            return self.replay(request, cached)
+        response = self.get_response(request)
+        entry = self.entry(request, response)
+        if entry is not None:
+            _cache().set(key, entry, _timeout())
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    async def __acall__(self, request):
+        name = self.cache_name(request)
+        if name is None:
+            return await self.get_response(request)
+        key = f'page:{await catalog_cache.ageneration()}:{name}'
+        cached = await _cache().aget(key)
+        if cached is not None:
+            return self.replay(request, cached)
+        response = await self.get_response(request)
+        entry = self.entry(request, response)
+        if entry is not None:
+            await _cache().aset(key, entry, _timeout())
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    def entry(self, request, response):
+        """(content, headers) to store for a response, None if it is not shareable"""
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return None
+        # the page embeds a CSRF token bound to this visitor's cookie
+        if request.META.get('CSRF_COOKIE_USED'):
+            return None
+        cache_control = response.get('Cache-Control', '')
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return None
+        headers = [(header, value) for header, value in response.items() if header.lower() not in UNCACHED_HEADERS]
+        return response.content, headers
+
+    def replay(self, request, cached):
+        """Response rebuilt from a cache entry, or a 304 when the client has it already"""
+        content, headers = cached
+        response = HttpResponse(content)
+        for header, value in headers:
+            response[header] = value
+        # the same conditional request handling as the view's (ETag lists, weak tags, *, dates)
+        last_modified = response.get('Last-Modified')
+        response = get_conditional_response(
+            request,
+            etag=response.get('ETag'),
+            last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+            response=response,
+        )
+        response['X-Page-Cache'] = 'HIT'
+        return response
@@ -39,9 +39,15 @@ INSTALLED_APPS = [
     'products',
     'contactus',
     'aboutus',
+    'taskqueue',
 ]
 
 MIDDLEWARE = [
+    # serves collected static files (DEBUG off) before any other middleware runs
+    'marketPlace.static_assets.StaticFilesMiddleware',
+    # anonymous home/product list/about pages, served before sessions and auth are loaded
+    'marketPlace.page_cache.PageCacheMiddleware',
+    'marketPlace.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,11 +57,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'marketPlace.urls'
+# ASGI deployments (marketPlace/asgi.py) serve the catalog read paths with
+# the native async views, everything else keeps the regular URLconf
+ROOT_URLCONF = 'marketPlace.urls_async' if os.environ.get('ASYNC_VIEWS') == '1' else 'marketPlace.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render time to the instrumentation middleware
+        'BACKEND': 'marketPlace.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],  
         'APP_DIRS': True,
         'OPTIONS': {
@@ -64,6 +73,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'products.context_processors.catalog',
             ],
         },
     },
@@ -90,20 +100,170 @@ if os.environ.get('USE_MYSQL') == '1':
             },
         }
     }
+    # MySQL has no partial unique indexes; the task queue checks dedup keys itself there
+    SILENCED_SYSTEM_CHECKS = ['models.W036']
 else:
+    # pragmas applied to every new SQLite connection. They only configure the
+    # connection and never write to the database file: synchronous=NORMAL is
+    # safe under WAL, busy_timeout waits for a lock instead of failing with
+    # "database is locked". WAL itself is stored in the file and is switched on
+    # once by `manage.py migrate` (products migration 0011)
+    SQLITE_PRAGMAS = {
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        # bytes of the database file read through mmap
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # negative = KiB of page cache per connection
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+        'temp_store': 'MEMORY',
+    }
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+                # transactions stay DEFERRED; blocks that read then write use
+                # marketPlace.db.write_atomic() to take the write lock up front
+            },
+            # tests run on a file, not the shared in-memory database: its table locks fail at
+            # once instead of waiting on busy_timeout, so concurrent-writer tests could not run
+            'TEST': {'NAME': os.environ.get('SQLITE_TEST_NAME', str(BASE_DIR / 'test_db.sqlite3'))},
         }
     }
 
+# Keep connections open between requests (seconds, 0 = one connection per
+# request) and check they are still usable before reusing one
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1'
+
 # HINT: MySQL provides better performance and scalability than SQLite
 # HINT: Use utf8mb4 charset for full Unicode support (including emojis)
 # HINT: STRICT_TRANS_TABLES ensures data integrity
 # HINT: Consider using environment variables for database credentials in production
 
 
+# Cache
+# The catalog, facet and page caches are invalidated by bumping a counter in
+# this cache, so it must be shared by every process (web workers, the task
+# worker and management commands) or they keep serving stale pages. Set
+# REDIS_URL to use Redis; otherwise the cache is kept in files under CACHE_DIR,
+# which every process on the host shares. CACHE_BACKEND=locmem gives a faster
+# per-process cache that is only correct with a single process (runserver).
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('CACHE_BACKEND') == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'marketplace',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / '.cache'),
+            # pages and facets are cached per filter combination, keep culling rare
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))},
+        }
+    }
+
+# Rendered product cards: their keys carry the product's pk, updated_at and image
+# digest, so a changed product never hits an old entry and nothing has to be
+# invalidated across processes; a per-process memory cache is enough (and far
+# cheaper to read than files)
+CACHES['fragments'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'marketplace-fragments',
+    'OPTIONS': {'MAX_ENTRIES': 20000},
+}
+
+# Seconds a versioned catalog read stays cached (it is also dropped on any Product change)
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 60 * 60))
+# count catalog cache hits and misses for `manage.py catalog_cache_stats` (one cache
+# write per read, so off by default)
+CATALOG_CACHE_STATS = os.environ.get('CATALOG_CACHE_STATS') == '1'
+
+
+# Seconds a rendered product card stays in the template fragment cache (0 disables it)
+PRODUCT_CARD_CACHE_TIMEOUT = int(os.environ.get('PRODUCT_CARD_CACHE_TIMEOUT', 600))
+
+# Seconds an anonymous full page stays cached (it is also dropped on any Product change, 0 disables it)
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 600))
+# Cache alias holding those pages. Their keys carry the catalog generation read
+# from the default cache, so a per-process memory cache stays correct across
+# processes; a hit from it costs a memory read instead of opening a file, while
+# with Redis the pages are shared by every process
+PAGE_CACHE_ALIAS = 'pages'
+CACHES['pages'] = CACHES['default'] if os.environ.get('REDIS_URL') else {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'marketplace-pages',
+    'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 2000))},
+}
+
+# Uploads: product images are checked from their first bytes while they stream
+# in (format, size, pixel count) before the usual memory/temp-file handlers see them
+FILE_UPLOAD_HANDLERS = [
+    'products.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_BYTES = int(os.environ.get('IMAGE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.environ.get('IMAGE_UPLOAD_MAX_PIXELS', 25_000_000))
+# Pillow format every accepted image is re-encoded to (e.g. WEBP), empty keeps uploads as they are
+IMAGE_UPLOAD_REENCODE = os.environ.get('IMAGE_UPLOAD_REENCODE', '')
+
+# Background tasks (taskqueue app, run by `manage.py worker`). TASK_QUEUE_EAGER=1
+# runs them inline after commit instead, for development without a worker
+TASK_QUEUE_EAGER = os.environ.get('TASK_QUEUE_EAGER') == '1'
+# Seconds after which a running task whose worker died is queued again
+TASK_QUEUE_LOCK_TIMEOUT = int(os.environ.get('TASK_QUEUE_LOCK_TIMEOUT', 600))
+
+# Product count from which the admin changelist switches to estimated counts
+ADMIN_LARGE_TABLE_ROWS = int(os.environ.get('ADMIN_LARGE_TABLE_ROWS', 100000))
+
+# Request instrumentation (see marketPlace/instrumentation.py)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+# repeats of one SQL statement within a request that are logged as a likely N+1
+N_PLUS_ONE_THRESHOLD = 5
+# per-view query budgets for anonymous requests on a cold cache, checked on every request
+QUERY_BUDGETS = {
+    'home': 2,
+    'products:home': 2,
+    'products:product_list': 3,
+    'products:product_detail': 2,  # the product and its related products
+    'products:product_search': 3,
+    'api:product_list': 1,
+}
+# extra queries allowed when the request loads a session user
+# (session, user, and the user and group permissions checked by the card links)
+QUERY_BUDGET_AUTH_ALLOWANCE = 4
+# raise instead of logging when a budget is exceeded (tests set this)
+QUERY_BUDGET_STRICT = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'marketPlace.perf': {
+            'handlers': ['console'],
+            # set PERF_LOG_LEVEL=INFO to log one line per request
+            'level': os.environ.get('PERF_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -142,6 +302,13 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# collectstatic writes content-hashed copies plus gzip/brotli variants, which
+# marketPlace.static_assets.StaticFilesMiddleware serves with far-future caching
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'marketPlace.static_assets.CompressedManifestStaticFilesStorage'},
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -0,0 +1,238 @@
+"""
+Static files served by the application itself, without a separate web server.
+
+``collectstatic`` copies every file to STATIC_ROOT under a content-hashed name
+(``styles.3b1f0e9c7a2d.css``) recorded in a manifest, and stores gzip and
+(when the ``brotli`` package is installed) brotli variants next to each
+compressible file. StaticFilesMiddleware then answers /static/ requests from
+STATIC_ROOT with the smallest variant the client accepts; hashed names never
+change content, so they are sent with a one-year ``immutable`` Cache-Control.
+
+Run ``python manage.py collectstatic`` after changing a static file.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+try:
+    import brotli
+except Exception:  # brotli is optional, gzip variants are always written
+    brotli = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# extensions worth compressing; images and fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot'}
+# files smaller than this (bytes) are not worth a compressed variant
+COMPRESS_MIN_SIZE = 256
+# a variant is only kept when it is at most this fraction of the original
+COMPRESS_MAX_RATIO = 0.95
+# (Content-Encoding, file suffix) of the variants, best first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+# Cache-Control of content-hashed files
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Cache-Control of files requested by their unhashed name
+REVALIDATE_CACHE_CONTROL = 'public, max-age=60'
+# files up to this size (bytes) are read into memory on async requests instead of being streamed
+ASYNC_IN_MEMORY_MAX = 1024 * 1024
+
+
+def compress_file(path):
+    """Write .gz (and .br) variants of a file when they are smaller, return the variants written"""
+    path = Path(path)
+    if path.suffix.lower() not in COMPRESSIBLE_EXTENSIONS:
+        return []
+    data = path.read_bytes()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return []
+    compressors = [('.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.insert(0, ('.br', lambda raw: brotli.compress(raw, quality=11)))
+    written = []
+    for suffix, compress in compressors:
+        variant = path.with_name(path.name + suffix)
+        compressed = compress(data)
+        if len(compressed) <= len(data) * COMPRESS_MAX_RATIO:
+            variant.write_bytes(compressed)
+            written.append(variant)
+        elif variant.exists():
+            variant.unlink()
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also precompresses every collected file.
+
+    Templates keep rendering before ``collectstatic`` has run (tests, a fresh
+    checkout): a name missing from the manifest falls back to its unhashed URL
+    instead of raising.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        # both the original and the hashed copy can be requested
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if not self.exists(name):
+                continue
+            for variant in compress_file(self.path(name)):
+                yield name, str(Path(name).with_name(variant.name)), True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # names already reported as missing from the manifest
+        self.missing = set()
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # an unhashed URL is served with a short max-age, so say once per name that it happened;
+            # without any manifest (tests, a fresh checkout) every name is missing and that is expected
+            if name not in self.missing:
+                self.missing.add(name)
+                level = logging.WARNING if self.hashed_files else logging.DEBUG
+                logger.log(level, "Static file %r is missing from the manifest, serving it unhashed (run collectstatic)", name)
+            return name
+
+
+def parse_accept_encoding(header):
+    """{content-coding: q} of an Accept-Encoding header; a coding with q=0 is refused"""
+    accepted = {}
+    for token in header.split(','):
+        coding, *params = [part.strip() for part in token.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+class StaticFile:
+    """One collected file and its compressed variants, as found at startup"""
+
+    def __init__(self, path, immutable):
+        stat = path.stat()
+        self.path = path
+        self.size = stat.st_size
+        self.last_modified = http_date(stat.st_mtime)
+        self.etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        self.immutable = immutable
+        # Content-Encoding -> (path, size) of the variants present on disk
+        self.variants = {}
+        for encoding, suffix in ENCODINGS:
+            variant = path.with_name(path.name + suffix)
+            if variant.is_file():
+                self.variants[encoding] = (variant, variant.stat().st_size)
+
+    def select(self, accept_encoding):
+        """(encoding or None, path, size) of the best variant for an Accept-Encoding header"""
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0
+        # ENCODINGS is ordered best first, so a later variant only wins with a strictly higher q
+        for encoding, _ in ENCODINGS:
+            q = accepted.get(encoding, accepted.get('*', 0))
+            if encoding in self.variants and q > best_q:
+                best, best_q = encoding, q
+        if best is None:
+            return None, self.path, self.size
+        return (best, *self.variants[best])
+
+
+class StaticFilesMiddleware:
+    """
+    Serve STATIC_ROOT at STATIC_URL with precompressed variants and far-future caching.
+
+    Goes first in MIDDLEWARE so a static request costs one dict lookup and no
+    session, auth or instrumentation work. The file index is built once per
+    process, so restart the server after ``collectstatic``. Not used while
+    DEBUG is on; runserver serves the source files itself then.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        prefix = settings.STATIC_URL or ''
+        if settings.DEBUG or not settings.STATIC_ROOT or '://' in prefix:
+            raise MiddlewareNotUsed
+        self.prefix = '/' + prefix.strip('/') + '/'
+        self.files = self.scan(Path(settings.STATIC_ROOT))
+
+    def scan(self, root):
+        """{url path: StaticFile} of everything collected into root"""
+        hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        files = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(suffixes) or filename == 'staticfiles.json':
+                    continue
+                path = Path(directory) / filename
+                name = path.relative_to(root).as_posix()
+                files[self.prefix + name] = StaticFile(path, immutable=name in hashed)
+        return files
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        return response if response is not None else self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.serve(request, in_memory=True)
+        return response if response is not None else await self.get_response(request)
+
+    def serve(self, request, in_memory=False):
+        """Response for a collected static file, None for anything else"""
+        static_file = self.files.get(request.path_info)
+        if static_file is None or request.method not in ('GET', 'HEAD'):
+            return None
+
+        encoding, path, size = static_file.select(request.headers.get('Accept-Encoding', ''))
+        etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+        if etag in (tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=static_file.content_type)
+        elif in_memory and size <= ASYNC_IN_MEMORY_MAX:
+            # a streamed file would be consumed through a thread on ASGI servers
+            response = HttpResponse(path.read_bytes(), content_type=static_file.content_type)
+        else:
+            response = FileResponse(path.open('rb'), content_type=static_file.content_type)
+            # FileResponse names the variant (styles.css.gz) in an inline disposition
+            del response['Content-Disposition']
+
+        if request.method == 'HEAD' or response.status_code == 200:
+            response['Content-Length'] = str(size)
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+        if static_file.variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Last-Modified'] = static_file.last_modified
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if static_file.immutable else REVALIDATE_CACHE_CONTROL
+        return response
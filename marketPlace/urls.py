@@ -53,6 +53,8 @@ urlpatterns = [
     path('', home, name='home'),
     # Namespaced products URLs
     path('', include(('products.urls', 'products'), namespace='products')),
+    # Read-only JSON catalog API
+    path('api/products/', include(('products.api_urls', 'api'), namespace='api')),
     # Auth URLs
     path('accounts/', include('django.contrib.auth.urls')),
     path('aboutus/', include(('aboutus.urls', 'aboutus'), namespace='aboutus')),
@@ -0,0 +1,36 @@
+"""
+URL configuration used under ASGI with ASYNC_VIEWS=1.
+
+The catalog read paths are served by the native async views in
+products/async_views.py under the same names and namespaces as in
+marketPlace/urls.py, so reverse(), {% url %} and QUERY_BUDGETS see the same
+view names; every other URL comes from marketPlace/urls.py unchanged.
+"""
+from django.urls import include, path
+
+from products import async_views
+from products import urls as product_urls
+from . import urls
+
+# async views listed first take precedence over the sync views of the same name
+product_patterns = [
+    path('', async_views.home, name='home'),
+    path('list/', async_views.product_list, name='product_list'),
+    path('<int:pk>/', async_views.product_detail, name='product_detail'),
+] + product_urls.urlpatterns
+
+api_patterns = [
+    path('', async_views.api_product_list, name='product_list'),
+    path('export.ndjson', async_views.api_product_export, name='product_export'),
+    path('<int:pk>/', async_views.api_product_detail, name='product_detail'),
+]
+
+urlpatterns = [
+    path('', async_views.home, name='home'),
+    path('', include((product_patterns, 'products'), namespace='products')),
+    path('api/products/', include((api_patterns, 'api'), namespace='api')),
+] + [
+    # the rest of the site, minus the routes replaced above
+    pattern for pattern in urls.urlpatterns
+    if getattr(pattern, 'name', None) != 'home' and getattr(pattern, 'namespace', None) not in ('products', 'api')
+]
@@ -1,5 +1,24 @@
-from django.contrib import admin
-from .models import Product
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.exceptions import DisallowedModelAdminLookup
+from django.contrib.admin.utils import prepare_lookup_value
+from django.contrib.admin.views.main import ALL_VAR, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, SEARCH_VAR, TO_FIELD_VAR
+from django.core.exceptions import BadRequest, FieldError, PermissionDenied, ValidationError
+from django.db import models, router, transaction
+from django.http import HttpResponseRedirect
+from django.urls import path, reverse
+from django.utils import timezone
+from marketPlace.db import write_atomic
+from . import cache as catalog_cache
+from .export import Workbook, csv_response, xlsx_response
+from .models import STATS_FIELDS, CatalogStats, Product, reserved_stock_error, stats_contribution
+from .pagination import EstimatedCountPaginator, estimated_count
+from .search import filter_queryset
+from .uploads import ValidatedImageField
+
+
+# changelist query parameters that are not field lookups
+EXPORT_IGNORED_PARAMS = {ALL_VAR, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, SEARCH_VAR, TO_FIELD_VAR}
 
 
 class ProductAdmin(admin.ModelAdmin):
@@ -7,10 +26,10 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'code', 'price', 'in_stock', 'stock_quantity', 'created_at']
     # list_filter to filter by in_stock, created_at, updated_at
     list_filter = ['in_stock', 'created_at', 'updated_at']
-    # search_fields to search by name, code, description (with db_index=True for performance)
+    # search_fields to show the search box (queries go through the full-text index, see get_search_results)
     search_fields = ['name', 'code', 'description']
-    # readonly_fields to make the code, created_at, updated_at fields read-only
-    readonly_fields = ['code', 'created_at', 'updated_at']
+    # readonly_fields to make the code, reserved_quantity, created_at, updated_at fields read-only
+    readonly_fields = ['code', 'reserved_quantity', 'created_at', 'updated_at']
     # list_editable to allow editing the price, in_stock, stock_quantity fields directly in the list view
     list_editable = ['price', 'in_stock', 'stock_quantity']
     # ordering to order by created_at (newest first)
@@ -22,9 +41,155 @@ class ProductAdmin(admin.ModelAdmin):
     # fieldsets to group the fields logically
     fieldsets = [
         ('Basic Info', {'fields': ['name', 'code', 'description']}),
-        ('Pricing & Stock', {'fields': ['price', 'in_stock', 'stock_quantity']}),
+        ('Pricing & Stock', {'fields': ['price', 'in_stock', 'stock_quantity', 'reserved_quantity']}),
         ('Media', {'fields': ['image']}),
         ('Timestamps', {'fields': ['created_at', 'updated_at']})
     ]
 
+    # report (and re-encode) images the same way ProductForm does
+    formfield_overrides = {models.ImageField: {'form_class': ValidatedImageField}}
+
+    # list_editable rows saved with one UPDATE per batch of this size
+    list_editable_batch_size = 500
+
+    def is_large_table(self):
+        """Large-table mode: estimated counts and no full COUNT(*) once the table passes ADMIN_LARGE_TABLE_ROWS"""
+        return estimated_count(self.model) >= getattr(settings, 'ADMIN_LARGE_TABLE_ROWS', 100000)
+
+    @property
+    def show_full_result_count(self):
+        # the "N total" next to filtered results is a second COUNT(*) over the whole table
+        return not self.is_large_table()
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if self.is_large_table():
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+    # actions exporting the selected products
+    actions = ['export_csv', 'export_xlsx']
+
+    def get_urls(self):
+        # export views for the whole filtered changelist, next to the default admin URLs
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path('export/csv/', self.admin_site.admin_view(self.export_csv_view), name='%s_%s_export_csv' % info),
+            path('export/xlsx/', self.admin_site.admin_view(self.export_xlsx_view), name='%s_%s_export_xlsx' % info),
+        ] + super().get_urls()
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # the XLSX export needs the optional openpyxl package
+        if Workbook is None:
+            actions.pop('export_xlsx', None)
+        return actions
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {'xlsx_export_available': Workbook is not None, **(extra_context or {})}
+        if not (request.method == 'POST' and '_save' in request.POST):
+            return super().changelist_view(request, extra_context)
+        # list_editable save: save_model() only collects the changed rows, which
+        # are written together before the surrounding transaction commits
+        request._list_editable_updates = []
+        with write_atomic(using=router.db_for_write(self.model)):
+            response = super().changelist_view(request, extra_context)
+            self._save_list_editable(request, request._list_editable_updates)
+        return response
+
+    def save_model(self, request, obj, form, change):
+        pending = getattr(request, '_list_editable_updates', None)
+        if pending is not None and change:
+            pending.append(obj)
+            return
+        super().save_model(request, obj, form, change)
+
+    def _save_list_editable(self, request, products):
+        if not products:
+            return
+        # the rows as they are now, locked until commit: the form validated against the
+        # values loaded for the page, and an order may have reserved units since
+        rows = Product.objects.select_for_update().filter(pk__in=[product.pk for product in products])
+        locked = {
+            pk: (reserved, stats_contribution(*values))
+            for pk, reserved, *values in rows.values_list('pk', 'reserved_quantity', *STATS_FIELDS)
+        }
+        # rows deleted meanwhile are dropped, rows now below their reserved units are reported
+        products = [product for product in products if product.pk in locked]
+        for product in [product for product in products if product.stock_quantity < locked[product.pk][0]]:
+            messages.error(request, f'{product} was not changed: {reserved_stock_error(locked[product.pk][0])}')
+            products.remove(product)
+        if not products:
+            return
+        # bulk_update() skips auto_now and post_save, so do their work here
+        now = timezone.now()
+        for product in products:
+            product.updated_at = now
+        Product.objects.bulk_update(
+            products, [*self.list_editable, 'updated_at'], batch_size=self.list_editable_batch_size
+        )
+        CatalogStats.apply_changes((locked[product.pk][1], product.stats_contribution()) for product in products)
+        transaction.on_commit(catalog_cache.invalidate)
+
+    def _changelist_queryset(self, request):
+        # same filters, search and ordering as the changelist page the export link came from,
+        # applied to get_queryset() directly: a ChangeList would also count the results
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        lookups = {}
+        for key, value in request.GET.items():
+            if key in EXPORT_IGNORED_PARAMS or key.startswith('_'):
+                continue
+            if not self.lookup_allowed(key, value, request):
+                raise DisallowedModelAdminLookup(f"Filtering by {key} not allowed")
+            lookups[key] = prepare_lookup_value(key, value)
+        try:
+            queryset = self.get_queryset(request).filter(**lookups)
+        except (ValueError, ValidationError, FieldError) as exc:
+            raise BadRequest(exc)
+        queryset, _ = self.get_search_results(request, queryset, request.GET.get(SEARCH_VAR, ''))
+        return queryset.order_by(*self._export_ordering(request))
+
+    def _export_ordering(self, request):
+        """The changelist's column sort (?o=2.-1), or the default ordering, with pk as tie-breaker"""
+        ordering = []
+        # the changelist counts the action checkbox as column 0
+        columns = ['action_checkbox', *self.get_list_display(request)]
+        for part in request.GET.get(ORDER_VAR, '').split('.'):
+            descending, _, index = part.rpartition('-')
+            if not index.isdigit() or not 0 < int(index) < len(columns):
+                continue
+            field_name = columns[int(index)]
+            if isinstance(field_name, str) and field_name in {field.name for field in self.model._meta.fields}:
+                ordering.append(f'{descending}{field_name}')
+        ordering = ordering or list(self.get_ordering(request))
+        if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+            ordering.append('-pk')
+        return ordering
+
+    @admin.action(description='Export selected products as CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        return csv_response(queryset)
+
+    @admin.action(description='Export selected products as XLSX', permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return xlsx_response(queryset)
+
+    def export_csv_view(self, request):
+        """Stream the filtered changelist as CSV"""
+        return csv_response(self._changelist_queryset(request))
+
+    def export_xlsx_view(self, request):
+        """Download the filtered changelist as XLSX"""
+        if Workbook is None:
+            self.message_user(request, 'XLSX export needs openpyxl (pip install openpyxl).', messages.ERROR)
+            info = self.opts.app_label, self.opts.model_name
+            return HttpResponseRedirect(f"{reverse('admin:%s_%s_changelist' % info)}?{request.GET.urlencode()}")
+        return xlsx_response(self._changelist_queryset(request))
+
+    def get_search_results(self, request, queryset, search_term):
+        """Answer the changelist search box from the full-text index"""
+        if not search_term.strip():
+            return queryset, False
+        return filter_queryset(queryset, search_term), False
+
 admin.site.register(Product, ProductAdmin)
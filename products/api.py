@@ -0,0 +1,150 @@
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.files.storage import default_storage
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+
+from .models import Product
+from .pagination import KeysetPaginator
+
+
+# fields a client may request with ?fields=
+API_FIELDS = ['id', 'code', 'name', 'price', 'description', 'image', 'in_stock', 'stock_quantity', 'created_at', 'updated_at']
+# fields returned when ?fields= is not given (description is opt-in)
+DEFAULT_FIELDS = ['id', 'code', 'name', 'price', 'image', 'in_stock', 'stock_quantity', 'updated_at']
+# page size limits for the list endpoint
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# rows fetched per round trip by the NDJSON export
+EXPORT_CHUNK_SIZE = 2000
+
+
+class ApiError(ValueError):
+    """Invalid query parameter, reported to the client as a 400"""
+
+
+def _fields(request):
+    raw = request.GET.get('fields')
+    if not raw:
+        return DEFAULT_FIELDS
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in API_FIELDS]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _decimal(request, name):
+    raw = request.GET.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        raise ApiError(f"{name} must be a number")
+    # NaN and Infinity parse, but no price compares to them
+    if not value.is_finite():
+        raise ApiError(f"{name} must be a number")
+    return value
+
+
+def _limit(request):
+    """Page size from ?limit=, clamped to 1..MAX_LIMIT"""
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _filtered_queryset(request):
+    qs = Product.objects.all()
+    in_stock = request.GET.get('in_stock')
+    if in_stock is not None:
+        if in_stock.lower() not in ('true', 'false', '1', '0'):
+            raise ApiError('in_stock must be true or false')
+        qs = qs.filter(in_stock=in_stock.lower() in ('true', '1'))
+    min_price = _decimal(request, 'min_price')
+    if min_price is not None:
+        qs = qs.filter(price__gte=min_price)
+    max_price = _decimal(request, 'max_price')
+    if max_price is not None:
+        qs = qs.filter(price__lte=max_price)
+    return qs
+
+
+def _projected(queryset, fields):
+    # values() only selects the requested columns (plus the cursor key) and skips model instances
+    columns = list(dict.fromkeys([*fields, 'id', 'created_at']))
+    return queryset.values(*columns)
+
+
+def serialize(row, fields):
+    """Turn a values() row into a JSON-ready dict with only the requested fields"""
+    data = {}
+    for name in fields:
+        value = row[name]
+        if name == 'price':
+            value = str(value)
+        elif name in ('created_at', 'updated_at'):
+            value = value.isoformat()
+        elif name == 'image':
+            value = default_storage.url(value) if value else None
+        data[name] = value
+    return data
+
+
+def _error(exc):
+    return JsonResponse({'error': str(exc)}, status=400)
+
+
+@require_safe
+def product_list(request):
+    """GET /api/products/?fields=&in_stock=&min_price=&max_price=&limit=&after=&before="""
+    try:
+        fields = _fields(request)
+        queryset = _projected(_filtered_queryset(request), fields)
+        limit = _limit(request)
+    except ApiError as exc:
+        return _error(exc)
+    page = KeysetPaginator(queryset, per_page=limit).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+    return JsonResponse({
+        'results': [serialize(row, fields) for row in page.object_list],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@require_safe
+def product_detail(request, pk):
+    """GET /api/products/<pk>/?fields="""
+    try:
+        fields = _fields(request)
+    except ApiError as exc:
+        return _error(exc)
+    row = _projected(Product.objects.filter(pk=pk), fields).first()
+    if row is None:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    return JsonResponse(serialize(row, fields))
+
+
+@require_safe
+def product_export(request):
+    """GET /api/products/export.ndjson: the whole (filtered) table, one JSON object per line"""
+    try:
+        fields = _fields(request)
+        queryset = _projected(_filtered_queryset(request), fields).order_by('id')
+    except ApiError as exc:
+        return _error(exc)
+
+    def rows():
+        # iterator() streams from a server-side cursor without filling the queryset cache
+        for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield json.dumps(serialize(row, fields), separators=(',', ':')) + '\n'
+
+    response = StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="products.ndjson"'
+    return response
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('', api.product_list, name='product_list'),  # Product list (JSON)
+    path('export.ndjson', api.product_export, name='product_export'),  # Streaming NDJSON export
+    path('<int:pk>/', api.product_detail, name='product_detail'),  # Product detail (JSON)
+]
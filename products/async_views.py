@@ -0,0 +1,151 @@
+"""
+Native async versions of the catalog read views.
+
+They are routed by marketPlace/urls_async.py when the site runs under ASGI
+with ASYNC_VIEWS=1 (see marketPlace/asgi.py). All database and cache access
+goes through the async ORM and cache APIs, and the session user and its
+permissions are loaded up front, so templates render without touching the
+database. They are slower than the sync views under WSGI (see
+marketPlace/asgi.py): the database and cache backends still do blocking I/O
+in threads.
+"""
+import json
+
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from . import api
+from . import cache as catalog_cache
+from .conditional import acatalog_etag, acatalog_last_modified, aproduct_etag, aproduct_last_modified
+from .facets import CatalogFilter, afacet_counts
+from .models import Product
+from .pagination import KeysetPaginator
+
+
+async def _load_user(request):
+    # resolve the session user and its permissions without blocking the event loop
+    user = await request.auser()
+    if user.is_authenticated:
+        # fills the backend permission caches that {{ perms }} reads
+        await user.aget_all_permissions()
+    request.user = user
+
+
+def _conditional(request, etag, last_modified, build):
+    """Answer 304/412 from the validators or build the response, like @condition does"""
+    etag = quote_etag(etag) if etag else None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = None
+    if request.method in ('GET', 'HEAD'):
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+    if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+        if etag and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if timestamp and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+# home view
+@require_safe
+async def home(request):
+    await _load_user(request)
+    etag, last_modified = await acatalog_etag(request), await acatalog_last_modified(request)
+    # get the 6 newest products that are in stock (served from the catalog cache)
+    products = await catalog_cache.alatest_in_stock(6)
+    return _conditional(request, etag, last_modified, lambda: render(request, 'products/home.html', {'products': products}))
+
+
+# product_list view
+@require_safe
+async def product_list(request):
+    await _load_user(request)
+    etag, last_modified = await acatalog_etag(request), await acatalog_last_modified(request)
+    catalog_filter = CatalogFilter(request.GET)
+    counts = await afacet_counts(catalog_filter)
+    # keyset paginator with 12 products per page, newest first
+    paginator = KeysetPaginator(catalog_filter.apply(Product.objects.all()), per_page=12, count=counts['total'])
+    page_obj = await paginator.aget_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    context = {
+        'page_obj': page_obj,
+        'filter_form': catalog_filter.form,
+        'filter_query': catalog_filter.querystring(),
+        'facets': catalog_filter.facets(counts),
+    }
+    return _conditional(
+        request, etag, last_modified, lambda: render(request, 'products/product_list.html', context)
+    )
+
+
+# product_detail view
+@require_safe
+async def product_detail(request, pk):
+    await _load_user(request)
+    # get the product by the primary key (served from the catalog cache)
+    product = await catalog_cache.aproduct(pk)
+    if product is None:
+        raise Http404('No Product matches the given query.')
+    related = await catalog_cache.arelated_products(pk)
+    etag, last_modified = await aproduct_etag(request, pk), await aproduct_last_modified(request, pk)
+    return _conditional(
+        request, etag, last_modified,
+        lambda: render(request, 'products/product_detail.html', {'product': product, 'related': related}),
+    )
+
+
+# JSON API views
+
+
+@require_safe
+async def api_product_list(request):
+    """Async version of api.product_list"""
+    try:
+        fields = api._fields(request)
+        queryset = api._projected(api._filtered_queryset(request), fields)
+        limit = api._limit(request)
+    except api.ApiError as exc:
+        return api._error(exc)
+    page = await KeysetPaginator(queryset, per_page=limit).aget_page(
+        after=request.GET.get('after'), before=request.GET.get('before'), with_total=False
+    )
+    return JsonResponse({
+        'results': [api.serialize(row, fields) for row in page.object_list],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@require_safe
+async def api_product_detail(request, pk):
+    """Async version of api.product_detail"""
+    try:
+        fields = api._fields(request)
+    except api.ApiError as exc:
+        return api._error(exc)
+    row = await api._projected(Product.objects.filter(pk=pk), fields).afirst()
+    if row is None:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    return JsonResponse(api.serialize(row, fields))
+
+
+@require_safe
+async def api_product_export(request):
+    """Async version of api.product_export, streamed from an async iterator"""
+    try:
+        fields = api._fields(request)
+        queryset = api._projected(api._filtered_queryset(request), fields).order_by('id')
+    except api.ApiError as exc:
+        return api._error(exc)
+
+    async def rows():
+        async for row in queryset.aiterator(chunk_size=api.EXPORT_CHUNK_SIZE):
+            yield json.dumps(api.serialize(row, fields), separators=(',', ':')) + '\n'
+
+    response = StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="products.ndjson"'
+    return response
@@ -0,0 +1,182 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CatalogStats, Product, RelatedProduct
+
+
+# cache key holding the catalog generation counter
+GENERATION_KEY = 'catalog:generation'
+# cache keys holding the hit/miss counters (kept only with CATALOG_CACHE_STATS, and
+# approximate: concurrent increments can be lost on backends without an atomic incr)
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+_MISSING = object()
+
+
+def _first_generation():
+    # a counter lost to eviction or culling restarts above any value it reached
+    # before, so keys cached under an old generation are never read again
+    return time.time_ns() // 1000
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def generation():
+    """Return the current catalog generation"""
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # add() is a no-op if another process initialised it first
+        first = _first_generation()
+        cache.add(GENERATION_KEY, first, None)
+        value = cache.get(GENERATION_KEY, first)
+    return value
+
+
+def invalidate():
+    """Bump the generation so every cached catalog read becomes stale"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # the counter was evicted, restart from a value no old key can use
+        cache.set(GENERATION_KEY, _first_generation(), None)
+
+
+def key(name):
+    """Versioned cache key for a catalog read"""
+    return f'catalog:{generation()}:{name}'
+
+
+def _stats_enabled():
+    # each count is a cache write (a file write on the default backend), so it is opt-in
+    return getattr(settings, 'CATALOG_CACHE_STATS', False)
+
+
+def _count(counter_key):
+    if not _stats_enabled():
+        return
+    try:
+        cache.incr(counter_key)
+    except ValueError:
+        cache.add(counter_key, 1, None)
+
+
+def get_or_set(name, loader, timeout=None):
+    """Return the cached value for name, calling loader() only after an invalidation"""
+    versioned = key(name)
+    value = cache.get(versioned, _MISSING)
+    if value is not _MISSING:
+        _count(HITS_KEY)
+        return value
+    _count(MISSES_KEY)
+    value = loader()
+    cache.set(versioned, value, timeout if timeout is not None else _timeout())
+    return value
+
+
+async def ageneration():
+    """Async version of generation()"""
+    value = await cache.aget(GENERATION_KEY)
+    if value is None:
+        first = _first_generation()
+        await cache.aadd(GENERATION_KEY, first, None)
+        value = await cache.aget(GENERATION_KEY, first)
+    return value
+
+
+async def akey(name):
+    """Async version of key()"""
+    return f'catalog:{await ageneration()}:{name}'
+
+
+async def _acount(counter_key):
+    if not _stats_enabled():
+        return
+    try:
+        await cache.aincr(counter_key)
+    except ValueError:
+        await cache.aadd(counter_key, 1, None)
+
+
+async def aget_or_set(name, loader, timeout=None):
+    """Async version of get_or_set(); loader is a coroutine function"""
+    versioned = await akey(name)
+    value = await cache.aget(versioned, _MISSING)
+    if value is not _MISSING:
+        await _acount(HITS_KEY)
+        return value
+    await _acount(MISSES_KEY)
+    value = await loader()
+    await cache.aset(versioned, value, timeout if timeout is not None else _timeout())
+    return value
+
+
+def stats():
+    """Hit/miss counters and the current generation"""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'generation': generation(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    """Reset the hit/miss counters"""
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def latest_in_stock(limit=6):
+    """The newest in-stock products shown on the home and index pages"""
+    return get_or_set(
+        f'latest_in_stock:{limit}',
+        lambda: list(Product.objects.filter(in_stock=True).order_by('-created_at')[:limit]),
+    )
+
+
+def product(pk):
+    """A single product by primary key, or None if it does not exist"""
+    return get_or_set(f'product:{pk}', lambda: Product.objects.filter(pk=pk).first())
+
+
+def _related_query(pk):
+    # one query on the (product, rank) unique index, joined to the neighbor products
+    return RelatedProduct.objects.filter(product_id=pk).select_related('related').order_by('rank')
+
+
+def related_products(pk):
+    """The precomputed related products of a product, most similar first"""
+    return get_or_set(f'related:{pk}', lambda: [row.related for row in _related_query(pk)])
+
+
+def catalog_stats():
+    """The CatalogStats totals (one primary key lookup, then cached until the next change)"""
+    return get_or_set('catalog_stats', CatalogStats.current)
+
+
+async def alatest_in_stock(limit=6):
+    """Async version of latest_in_stock()"""
+    async def load():
+        return [product async for product in Product.objects.filter(in_stock=True).order_by('-created_at')[:limit]]
+    return await aget_or_set(f'latest_in_stock:{limit}', load)
+
+
+async def aproduct(pk):
+    """Async version of product()"""
+    async def load():
+        return await Product.objects.filter(pk=pk).afirst()
+    return await aget_or_set(f'product:{pk}', load)
+
+
+async def arelated_products(pk):
+    """Async version of related_products()"""
+    async def load():
+        return [row.related async for row in _related_query(pk)]
+    return await aget_or_set(f'related:{pk}', load)
@@ -0,0 +1,111 @@
+import hashlib
+
+from django.db.models import Max
+
+from . import cache as catalog_cache
+from .models import Product
+
+
+# Helpers for django.views.decorators.http.condition on the catalog views.
+# Every value comes from Product.updated_at (a single indexed lookup or
+# aggregate, cached per catalog generation), never from loading the rows.
+#
+# Pages for signed-in users get no validators at all: they carry a CSRF token
+# and one-off flash messages that the catalog timestamps know nothing about,
+# so a 304 would replay a stale token and swallow the messages.
+
+
+def _personal(request):
+    # validators are None for these requests, which turns conditional handling off
+    return request.user.is_authenticated
+
+
+def _etag(request, *parts):
+    raw = '|'.join(str(part) for part in (request.get_full_path(), *parts))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    """Newest updated_at across the catalog"""
+    if _personal(request):
+        return None
+    return catalog_cache.get_or_set(
+        'latest_updated_at', lambda: Product.objects.aggregate(latest=Max('updated_at'))['latest']
+    )
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag for pages listing many products (home, product_list).
+
+    The generation counter is part of the tag because a deleted product does
+    not move max(updated_at).
+    """
+    if _personal(request):
+        return None
+    return _etag(request, catalog_last_modified(request), catalog_cache.generation())
+
+
+def _detail_parts(product, related):
+    # the page also lists the related products: an edited neighbor or a rebuilt list changes the tag
+    return (product.pk, product.updated_at.isoformat(), *(f"{item.pk}@{item.updated_at.isoformat()}" for item in related))
+
+
+def product_last_modified(request, pk):
+    """Newest updated_at of a product and its related products (None if it does not exist)"""
+    if _personal(request):
+        return None
+    product = catalog_cache.product(pk)
+    if product is None:
+        return None
+    return max([product.updated_at, *(item.updated_at for item in catalog_cache.related_products(pk))])
+
+
+def product_etag(request, pk):
+    """ETag for the product_detail page"""
+    if _personal(request):
+        return None
+    product = catalog_cache.product(pk)
+    if product is None:
+        return None
+    return _etag(request, *_detail_parts(product, catalog_cache.related_products(pk)))
+
+
+# Async versions for products.async_views (request.user must already be loaded)
+
+
+async def acatalog_last_modified(request, *args, **kwargs):
+    """Async version of catalog_last_modified()"""
+    if _personal(request):
+        return None
+
+    async def load():
+        return (await Product.objects.aaggregate(latest=Max('updated_at')))['latest']
+    return await catalog_cache.aget_or_set('latest_updated_at', load)
+
+
+async def acatalog_etag(request, *args, **kwargs):
+    """Async version of catalog_etag()"""
+    if _personal(request):
+        return None
+    return _etag(request, await acatalog_last_modified(request), await catalog_cache.ageneration())
+
+
+async def aproduct_last_modified(request, pk):
+    """Async version of product_last_modified()"""
+    if _personal(request):
+        return None
+    product = await catalog_cache.aproduct(pk)
+    if product is None:
+        return None
+    return max([product.updated_at, *(item.updated_at for item in await catalog_cache.arelated_products(pk))])
+
+
+async def aproduct_etag(request, pk):
+    """Async version of product_etag()"""
+    if _personal(request):
+        return None
+    product = await catalog_cache.aproduct(pk)
+    if product is None:
+        return None
+    return _etag(request, *_detail_parts(product, await catalog_cache.arelated_products(pk)))
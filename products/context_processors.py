@@ -0,0 +1,9 @@
+from django.conf import settings
+
+
+def catalog(request):
+    """Template settings shared by the catalog templates"""
+    return {
+        # seconds a rendered product card stays in the fragment cache (0 disables it)
+        'product_card_cache_timeout': getattr(settings, 'PRODUCT_CARD_CACHE_TIMEOUT', 600),
+    }
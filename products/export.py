@@ -0,0 +1,86 @@
+import csv
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+try:
+    from openpyxl import Workbook
+except Exception:  # openpyxl is optional, only the XLSX export needs it
+    Workbook = None  # type: ignore
+
+
+# (column, header) of every exported product column
+EXPORT_COLUMNS = [
+    ('id', 'ID'),
+    ('code', 'Code'),
+    ('name', 'Name'),
+    ('price', 'Price'),
+    ('in_stock', 'In Stock'),
+    ('stock_quantity', 'Stock Quantity'),
+    ('reserved_quantity', 'Reserved Quantity'),
+    ('description', 'Description'),
+    ('created_at', 'Created At'),
+    ('updated_at', 'Updated At'),
+]
+# rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Echo:
+    """File-like object whose write() returns the value, so csv.writer yields lines instead of buffering"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset):
+    """Stream the export columns as tuples, without building model instances"""
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    return queryset.values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def csv_response(queryset, filename='products.csv'):
+    """StreamingHttpResponse writing the queryset as CSV one row at a time"""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow([header for _, header in EXPORT_COLUMNS])
+        for row in export_rows(queryset):
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _xlsx_value(value):
+    # Excel has no time zones, write local wall-clock time
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def xlsx_response(queryset, filename='products.xlsx'):
+    """
+    Response with the queryset as an XLSX workbook.
+
+    The workbook is written in openpyxl's write-only mode, which flushes rows
+    to a temporary file instead of keeping them in memory; the finished file
+    is then streamed from disk.
+    """
+    if Workbook is None:
+        raise RuntimeError('openpyxl is not installed. Install it with: pip install openpyxl')
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Products')
+    sheet.append([header for _, header in EXPORT_COLUMNS])
+    for row in export_rows(queryset):
+        sheet.append([_xlsx_value(value) for value in row])
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
@@ -0,0 +1,138 @@
+import datetime
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import cache as catalog_cache
+from .forms import ProductFilterForm
+from .models import Product
+
+
+# [low, high) price ranges of the price histogram (None = no upper bound)
+PRICE_BUCKETS = [(0, 25), (25, 50), (50, 100), (100, 250), (250, None)]
+# query parameters owned by the filters (pagination cursors are not part of them)
+FILTER_PARAMS = list(ProductFilterForm.base_fields)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _bucket_q(low, high):
+    condition = Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+class CatalogFilter:
+    """
+    The product_list filters of one request.
+
+    Invalid values are ignored rather than rejected, so a hand-edited URL still
+    shows a page. The filter is split into its stock, price and date parts so
+    every facet can be counted under all the other filters but its own.
+    """
+
+    def __init__(self, params):
+        self.form = ProductFilterForm(params)
+        self.form.is_valid()
+        self.values = {name: value for name, value in self.form.cleaned_data.items() if value not in (None, '')}
+
+    def __bool__(self):
+        return bool(self.values)
+
+    def stock_q(self):
+        if 'in_stock' not in self.values:
+            return Q()
+        return Q(in_stock=self.values['in_stock'] == '1')
+
+    def price_q(self):
+        condition = Q()
+        if 'min_price' in self.values:
+            condition &= Q(price__gte=self.values['min_price'])
+        if 'max_price' in self.values:
+            condition &= Q(price__lte=self.values['max_price'])
+        return condition
+
+    def date_q(self):
+        condition = Q()
+        if 'created_from' in self.values:
+            condition &= Q(created_at__gte=_day_start(self.values['created_from']))
+        if 'created_to' in self.values:
+            # range on the raw column (not created_at__date) so the index is used
+            condition &= Q(created_at__lt=_day_start(self.values['created_to'] + datetime.timedelta(days=1)))
+        return condition
+
+    def apply(self, queryset):
+        """Restrict a Product queryset to the filtered rows"""
+        return queryset.filter(self.stock_q() & self.price_q() & self.date_q())
+
+    def cache_name(self):
+        """Stable name of this filter combination for cache keys"""
+        return urlencode(sorted((name, str(value)) for name, value in self.values.items()))
+
+    def querystring(self, **changes):
+        """URL query of the current filters with some values changed (None removes one)"""
+        params = {name: str(value) for name, value in self.values.items()}
+        for name, value in changes.items():
+            if value is None:
+                params.pop(name, None)
+            else:
+                params[name] = str(value)
+        return urlencode(params)
+
+    def aggregates(self):
+        """
+        Count expressions for every facet, evaluated together in one query.
+
+        The stock totals respect the price filter, the price buckets respect
+        the stock filter, and 'total' (the size of the filtered list) both.
+        """
+        stock_q, price_q = self.stock_q(), self.price_q()
+        expressions = {
+            'total': Count('pk', filter=stock_q & price_q),
+            'stock_in': Count('pk', filter=Q(in_stock=True) & price_q),
+            'stock_out': Count('pk', filter=Q(in_stock=False) & price_q),
+        }
+        for index, (low, high) in enumerate(PRICE_BUCKETS):
+            expressions[f'price_{index}'] = Count('pk', filter=_bucket_q(low, high) & stock_q)
+        return expressions
+
+    def facets(self, counts):
+        """Template data (label, count, link, selected) for the aggregated counts"""
+        selected_stock = self.values.get('in_stock')
+        stock = [
+            {'label': 'In stock', 'count': counts['stock_in'], 'selected': selected_stock == '1',
+             'query': self.querystring(in_stock='1')},
+            {'label': 'Out of stock', 'count': counts['stock_out'], 'selected': selected_stock == '0',
+             'query': self.querystring(in_stock='0')},
+        ]
+        prices = []
+        for index, (low, high) in enumerate(PRICE_BUCKETS):
+            # prices have two decimals, so <= high - 0.01 is the same range as < high
+            max_price = Decimal(high) - Decimal('0.01') if high is not None else None
+            prices.append({
+                'label': f'${low} – ${high}' if high is not None else f'${low}+',
+                'count': counts[f'price_{index}'],
+                'selected': self.values.get('min_price') == low and self.values.get('max_price') == max_price,
+                'query': self.querystring(min_price=low, max_price=max_price),
+            })
+        return {'total': counts['total'], 'stock': stock, 'prices': prices}
+
+
+def facet_counts(catalog_filter):
+    """Facet counts of a filter (one aggregate query, cached per catalog generation)"""
+    return catalog_cache.get_or_set(
+        f'facets:{catalog_filter.cache_name()}',
+        lambda: Product.objects.filter(catalog_filter.date_q()).aggregate(**catalog_filter.aggregates()),
+    )
+
+
+async def afacet_counts(catalog_filter):
+    """Async version of facet_counts()"""
+    async def load():
+        return await Product.objects.filter(catalog_filter.date_q()).aaggregate(**catalog_filter.aggregates())
+    return await catalog_cache.aget_or_set(f'facets:{catalog_filter.cache_name()}', load)
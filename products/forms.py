@@ -4,6 +4,7 @@ from django.urls import reverse
 import uuid
 import os
 from .models import Product
+from .uploads import ValidatedImageField, allowed_extensions, max_bytes
 
 # ProductForm class
 class ProductForm(forms.ModelForm):
@@ -13,6 +14,8 @@ class ProductForm(forms.ModelForm):
         model = Product
         # fields
         fields = ['name', 'price', 'description', 'image', 'in_stock', 'stock_quantity']
+        # the image is checked while it uploads (products.uploads.ImageUploadHandler)
+        field_classes = {'image': ValidatedImageField}
         # widgets
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter product name'}),
@@ -80,14 +83,46 @@ class ProductForm(forms.ModelForm):
         """Custom validation for image upload"""
         image = self.cleaned_data.get('image')
         if image:
-            # Check file size (limit to 5MB)
-            if image.size > 5 * 1024 * 1024:
-                raise forms.ValidationError('Image file size must be less than 5MB.')
+            # Check file size (uploads are already cut off at this size while streaming)
+            if image.size > max_bytes():
+                raise forms.ValidationError(f'Image file size must be less than {max_bytes() // (1024 * 1024)}MB.')
 
             # Check file extension
-            allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif']
             ext = os.path.splitext(image.name)[1].lower()
-            if ext not in allowed_extensions:
+            if ext not in allowed_extensions():
                 raise forms.ValidationError('Please upload a valid image file (JPG, PNG, GIF).')
 
         return image
+
+
+# ProductFilterForm class: the product_list filters (every field is optional)
+class ProductFilterForm(forms.Form):
+    # availability filter ('' means any)
+    in_stock = forms.ChoiceField(
+        required=False,
+        choices=[('', 'Any availability'), ('1', 'In stock'), ('0', 'Out of stock')],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    # price range (inclusive)
+    min_price = forms.DecimalField(
+        required=False, min_value=0, max_digits=10, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Min $', 'step': '0.01', 'min': '0'}),
+    )
+    max_price = forms.DecimalField(
+        required=False, min_value=0, max_digits=10, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Max $', 'step': '0.01', 'min': '0'}),
+    )
+    # created date range (inclusive, in the site time zone)
+    created_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    created_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+
+    def clean(self):
+        """Drop the upper bound of a range that ends before it starts (CatalogFilter ignores invalid values)"""
+        cleaned_data = super().clean()
+        min_price, max_price = cleaned_data.get('min_price'), cleaned_data.get('max_price')
+        if min_price is not None and max_price is not None and max_price < min_price:
+            self.add_error('max_price', 'Max price cannot be below the min price.')
+        created_from, created_to = cleaned_data.get('created_from'), cleaned_data.get('created_to')
+        if created_from and created_to and created_to < created_from:
+            self.add_error('created_to', 'The end date cannot be before the start date.')
+        return cleaned_data
@@ -0,0 +1,99 @@
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    from PIL import Image
+except Exception:  # Pillow might not be installed yet
+    Image = None  # type: ignore
+
+
+# widths (px) generated for every uploaded product image
+WIDTHS = (320, 640, 960)
+# (extension, Pillow format, mime type, save options) of every derivative format
+FORMATS = (
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+# storage directory the derivatives are written to
+DERIVATIVES_DIR = 'products/derivatives'
+
+
+def content_digest(data):
+    """Short content hash used to name the derivatives of an image"""
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def derivative_name(digest, width, ext):
+    """Storage name of one derivative"""
+    return f"{DERIVATIVES_DIR}/{digest}-{width}w.{ext}"
+
+
+def derivative_widths(source_width):
+    """
+    The WIDTHS a source image gets derivatives for.
+
+    Derivatives are never upscaled: the widths below the source width, then
+    one more holding the image at its own width when it is not wider than
+    every entry (stored under that width's name, see srcsets()). A source
+    width of 0 (unknown) means all of them.
+    """
+    if not source_width:
+        return list(WIDTHS)
+    widths = [width for width in WIDTHS if width < source_width]
+    if len(widths) < len(WIDTHS):
+        widths.append(WIDTHS[len(widths)])
+    return widths
+
+
+def derivative_names(digest, source_width=0):
+    """Storage names of the derivatives for a digest (all that may exist when the width is unknown)"""
+    return [derivative_name(digest, width, ext) for width in derivative_widths(source_width) for ext, _, _, _ in FORMATS]
+
+
+def generate_derivatives(image_name, storage=None):
+    """
+    Write the resized WebP/JPEG derivatives of a stored image, return (digest, source width).
+
+    Filenames are content-hashed, so derivatives that already exist are reused
+    and the same upload is never processed twice.
+    """
+    if Image is None:
+        raise RuntimeError('Pillow is not installed. Install it with: pip install Pillow')
+    storage = storage or default_storage
+    with storage.open(image_name, 'rb') as fh:
+        data = fh.read()
+    digest = content_digest(data)
+    with Image.open(BytesIO(data)) as source:
+        # opening only parses the header, the pixels are decoded by convert() below
+        source_width = source.width
+        missing = [name for name in derivative_names(digest, source_width) if not storage.exists(name)]
+        if not missing:
+            return digest, source_width
+        source = source.convert('RGB')
+        for width in derivative_widths(source_width):
+            resized = source.copy()
+            # thumbnail() keeps the aspect ratio and never upscales
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            for ext, fmt, _, save_options in FORMATS:
+                name = derivative_name(digest, width, ext)
+                if name not in missing:
+                    continue
+                buffer = BytesIO()
+                resized.save(buffer, format=fmt, **save_options)
+                storage.save(name, ContentFile(buffer.getvalue()))
+    return digest, source_width
+
+
+def srcsets(digest, source_width=0):
+    """Map of mime type to srcset value for a digest, each file labelled with its real width"""
+    widths = derivative_widths(source_width)
+    return {
+        mime: ', '.join(
+            f"{default_storage.url(derivative_name(digest, width, ext))} {min(width, source_width or width)}w"
+            for width in widths
+        )
+        for ext, _, mime, _ in FORMATS
+    }
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from products.models import Product
+from products.pagination import encode_cursor
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the catalog views in-process against a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Size of the seeded catalog')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per view')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per view before measuring')
+        parser.add_argument('--views', default=None, help='Comma separated subset of views to run')
+        parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', default=None, help='Compare against a JSON file written by --output')
+        parser.add_argument('--compare-card-cache', action='store_true', help='Also run product_list with the product card fragment cache disabled')
+        parser.add_argument('--asgi', action='store_true', help='Also compare WSGI threads against the async views under concurrent load')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight for --asgi')
+        parser.add_argument('--threshold', type=float, default=0.15, help='Allowed p95 slowdown vs the baseline (0.15 = 15%%)')
+
+    def handle(self, *args, **options):
+        # a throwaway test database keeps the real one untouched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], DEBUG=False):
+                results = self.run_benchmarks(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.report(results)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['baseline']:
+            self.compare(results, json.loads(Path(options['baseline']).read_text()), options['threshold'])
+
+    def scenarios(self):
+        """(name, url, needs_login) for every benchmarked view"""
+        newest = Product.objects.order_by('-created_at', '-id').first()
+        deep = Product.objects.order_by('created_at', 'id')[24:25].first() or newest
+        return [
+            ('home', reverse('home'), False),
+            ('product_list', reverse('products:product_list'), False),
+            ('product_list_deep', f"{reverse('products:product_list')}?after={encode_cursor(deep)}", False),
+            ('product_detail', reverse('products:product_detail', args=[newest.pk]), False),
+            ('product_search', f"{reverse('products:product_search')}?q=wireless", False),
+            ('api_product_list', reverse('api:product_list'), False),
+            ('product_create', reverse('products:product_create'), True),
+            ('admin_changelist', reverse('admin:products_product_changelist'), True),
+        ]
+
+    def run_benchmarks(self, options):
+        self.stdout.write(f"Seeding {options['products']} products...")
+        call_command('seed_products', count=options['products'], stdout=StringIO())
+        cache.clear()
+
+        user = get_user_model().objects.create_superuser('bench', 'bench@example.com', 'bench')
+        anonymous = Client()
+        staff = Client()
+        staff.force_login(user)
+
+        selected = set(options['views'].split(',')) if options['views'] else None
+        results = {'products': options['products'], 'requests': options['requests'], 'views': {}}
+        scenarios = self.scenarios()
+        for name, url, needs_login in scenarios:
+            if selected and name not in selected:
+                continue
+            client = staff if needs_login else anonymous
+            results['views'][name] = self.measure(name, client, url, options)
+
+        if options['compare_card_cache']:
+            url = next(url for name, url, _ in scenarios if name == 'product_list')
+            # the full-page cache would answer before any card is rendered
+            with override_settings(PAGE_CACHE_TIMEOUT=0):
+                results['views']['product_list_nopagecache'] = self.measure('product_list_nopagecache', anonymous, url, options)
+                with override_settings(PRODUCT_CARD_CACHE_TIMEOUT=0):
+                    results['views']['product_list_nocardcache'] = self.measure('product_list_nocardcache', anonymous, url, options)
+
+        if options['asgi']:
+            results['concurrency'] = {}
+            for name, url, needs_login in scenarios:
+                if needs_login or name == 'product_search' or (selected and name not in selected):
+                    continue
+                results['concurrency'][name] = {
+                    'wsgi_rps': self.measure_threads(url, options),
+                    'asgi_rps': self.measure_async(url, options),
+                }
+        return results
+
+    def measure_threads(self, url, options):
+        """Requests/s of the sync views with options['concurrency'] threads, like a threaded WSGI server"""
+        def worker(count):
+            client = Client()
+            for _ in range(count):
+                client.get(url)
+            connection.close()
+
+        per_worker = max(1, options['requests'] // options['concurrency'])
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            list(pool.map(worker, [per_worker] * options['concurrency']))
+        return round(per_worker * options['concurrency'] / (time.perf_counter() - started), 1)
+
+    def measure_async(self, url, options):
+        """Requests/s of the async views with options['concurrency'] requests in flight on one event loop"""
+        async def run(count):
+            client = AsyncClient()
+            for _ in range(count):
+                response = await client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"async {url} returned {response.status_code}")
+
+        async def main(per_worker):
+            await asyncio.gather(*(run(per_worker) for _ in range(options['concurrency'])))
+
+        per_worker = max(1, options['requests'] // options['concurrency'])
+        with override_settings(ROOT_URLCONF='marketPlace.urls_async'):
+            asyncio.run(main(1))
+            started = time.perf_counter()
+            asyncio.run(main(per_worker))
+            elapsed = time.perf_counter() - started
+        return round(per_worker * options['concurrency'] / elapsed, 1)
+
+    def measure(self, name, client, url, options):
+        """Time options['requests'] GETs of url after a warmup"""
+        for _ in range(options['warmup']):
+            client.get(url)
+
+        timings, queries, sizes, render = [], [], [], []
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as captured:
+                t0 = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - t0) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"{name}: {url} returned {response.status_code}")
+            queries.append(len(captured.captured_queries))
+            sizes.append(len(response.content))
+            render.append(self.template_ms(response))
+        elapsed = time.perf_counter() - started
+
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'rps': round(len(timings) / elapsed, 1),
+            'queries': round(statistics.mean(queries), 2),
+            'bytes': round(statistics.mean(sizes)),
+            'template_ms': round(statistics.mean(render), 3),
+        }
+
+    def template_ms(self, response):
+        """Template render time reported by the instrumentation middleware (0 if absent)"""
+        for metric in response.get('Server-Timing', '').split(','):
+            parts = dict(part.strip().split('=', 1) if '=' in part else (part.strip(), '') for part in metric.split(';'))
+            if 'tpl' in parts:
+                return float(parts.get('dur', 0))
+        return 0.0
+
+    def report(self, results):
+        header = f"{'view':<26} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'queries':>8} {'bytes':>9} {'tpl ms':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, row in results['views'].items():
+            self.stdout.write(
+                f"{name:<26} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+                f"{row['rps']:>9.1f} {row['queries']:>8.1f} {row['bytes']:>9} {row.get('template_ms', 0):>8.2f}"
+            )
+        cached, uncached = results['views'].get('product_list_nopagecache'), results['views'].get('product_list_nocardcache')
+        if cached and uncached:
+            saved = uncached['template_ms'] - cached['template_ms']
+            self.stdout.write(f"Card fragment cache saves {saved:.2f} ms of template time per product_list page")
+            page_cached = results['views'].get('product_list')
+            if page_cached:
+                self.stdout.write(f"Full-page cache serves product_list at p50 {page_cached['p50_ms']:.2f} ms vs {cached['p50_ms']:.2f} ms rendered")
+        if results.get('concurrency'):
+            self.stdout.write('')
+            self.stdout.write(f"{'view':<26} {'wsgi req/s':>11} {'asgi req/s':>11}")
+            for name, row in results['concurrency'].items():
+                self.stdout.write(f"{name:<26} {row['wsgi_rps']:>11.1f} {row['asgi_rps']:>11.1f}")
+
+    def compare(self, results, baseline, threshold):
+        """Fail when a view got slower than threshold or runs more queries than the baseline"""
+        regressions = []
+        for name, row in results['views'].items():
+            before = baseline.get('views', {}).get(name)
+            if before is None:
+                continue
+            change = (row['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+            self.stdout.write(f"{name:<26} p95 {before['p95_ms']:.2f} -> {row['p95_ms']:.2f} ms ({change:+.1%})")
+            if change > threshold:
+                regressions.append(f"{name}: p95 {change:+.1%}")
+            if row['queries'] > before['queries']:
+                regressions.append(f"{name}: queries {before['queries']} -> {row['queries']}")
+        if regressions:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,137 @@
+import random
+import re
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.management.commands.bench import percentile
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Measure catalog read throughput while concurrent writes are running, against a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=5000, help='Size of the seeded catalog')
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads')
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run')
+        parser.add_argument('--write-batch', type=int, default=50, help='Rows updated per write transaction')
+        parser.add_argument(
+            '--journal-modes', default='DELETE,WAL',
+            help='SQLite journal modes to compare, one run each (ignored on other databases)',
+        )
+
+    def handle(self, *args, **options):
+        sqlite = connection.vendor == 'sqlite'
+        tmpdir = None
+        if sqlite:
+            # WAL needs a real file, the default SQLite test database lives in memory
+            tmpdir = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST']['NAME'] = str(Path(tmpdir.name) / 'bench_db.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write(f"Seeding {options['products']} products...")
+            call_command('seed_products', count=options['products'], stdout=StringIO())
+            self.ids = list(Product.objects.values_list('pk', flat=True))
+            modes = options['journal_modes'].split(',') if sqlite else ['-']
+            results = [(mode, self.run(mode, options)) for mode in modes]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmpdir is not None:
+                tmpdir.cleanup()
+        self.report(results)
+
+    def use_journal_mode(self, mode):
+        # every thread opens its own connection, so the mode goes into init_command
+        options = connections.settings[connection.alias].setdefault('OPTIONS', {})
+        command = re.sub(r'PRAGMA journal_mode=\w+;?', '', options.get('init_command', '')).strip(';')
+        options['init_command'] = ';'.join(filter(None, [f'PRAGMA journal_mode={mode}', command]))
+        connections.close_all()
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={mode}')
+
+    def run(self, mode, options):
+        if mode != '-':
+            self.use_journal_mode(mode)
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'reads': [], 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+
+        def reader():
+            latencies, errors = [], 0
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        # the product_list page query plus a product_detail lookup
+                        list(Product.objects.order_by('-created_at', '-id')[:13])
+                        Product.objects.filter(pk=random.choice(self.ids)).first()
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                connections.close_all()
+            with lock:
+                stats['reads'].extend(latencies)
+                stats['read_errors'] += errors
+
+        def writer():
+            writes, errors = 0, 0
+            try:
+                while not stop.is_set():
+                    batch = random.sample(self.ids, min(options['write_batch'], len(self.ids)))
+                    try:
+                        with transaction.atomic():
+                            Product.objects.filter(pk__in=batch).update(
+                                stock_quantity=F('stock_quantity') + 1, updated_at=timezone.now()
+                            )
+                        writes += 1
+                    except OperationalError:
+                        errors += 1
+            finally:
+                connections.close_all()
+            with lock:
+                stats['writes'] += writes
+                stats['write_errors'] += errors
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        reads = stats['reads'] or [0.0]
+        return {
+            'reads_per_s': len(stats['reads']) / elapsed,
+            'writes_per_s': stats['writes'] / elapsed,
+            'p50_ms': percentile(reads, 50),
+            'p95_ms': percentile(reads, 95),
+            'p99_ms': percentile(reads, 99),
+            'read_errors': stats['read_errors'],
+            'write_errors': stats['write_errors'],
+        }
+
+    def report(self, results):
+        header = f"{'journal':<10} {'reads/s':>10} {'writes/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>8}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for mode, row in results:
+            self.stdout.write(
+                f"{mode:<10} {row['reads_per_s']:>10.1f} {row['writes_per_s']:>10.1f} {row['p50_ms']:>8.2f} "
+                f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['read_errors'] + row['write_errors']:>8}"
+            )
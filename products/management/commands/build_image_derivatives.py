@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from products import cache as catalog_cache
+from products.images import Image, generate_derivatives
+from products.models import Product
+
+
+def _render(item):
+    # runs in a worker process: returns (pk, (digest, width) or None, error)
+    pk, image_name = item
+    try:
+        return pk, generate_derivatives(image_name), None
+    except Exception as exc:
+        return pk, None, f"{image_name}: {exc}"
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG derivatives for existing product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products read and updated per batch')
+        parser.add_argument('--force', action='store_true', help='Rebuild products that already have derivatives')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            self.stderr.write(self.style.ERROR('Pillow is not installed. Install it with: pip install Pillow'))
+            return
+
+        qs = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            # derivatives built before the image width was recorded are picked up again (existing files are reused)
+            qs = qs.filter(Q(image_digest='') | Q(image_width=0))
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+
+        started = time.monotonic()
+        done = failed = 0
+        last_id = 0
+        chunk = options['batch_size']
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                # walk the table by primary key so no cursor stays open while writing
+                items = list(qs.filter(id__gt=last_id).order_by('id').values_list('id', 'image')[:chunk])
+                if not items:
+                    break
+                last_id = items[-1][0]
+                pending = []
+                for pk, built, error in pool.map(_render, items, chunksize=8):
+                    if error:
+                        failed += 1
+                        self.stderr.write(self.style.WARNING(error))
+                        continue
+                    digest, width = built
+                    pending.append(Product(pk=pk, image_digest=digest, image_width=width))
+                if pending:
+                    Product.objects.bulk_update(pending, ['image_digest', 'image_width'])
+                done += len(pending)
+                self.stdout.write(f"{done} products done")
+
+        catalog_cache.invalidate()
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Built derivatives for {done} products ({failed} failed) in {elapsed:.1f}s ({rate:.1f} images/s)"
+        ))
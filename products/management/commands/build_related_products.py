@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import cache as catalog_cache
+from products import related
+
+
+class Command(BaseCommand):
+    help = "Build the 'related products' neighbor table from product names and descriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help=(
+            'Recompute every product. Without it only products changed since the last build are recomputed, '
+            'with the products that list them, would now list them, or lost a deleted neighbor'
+        ))
+        parser.add_argument('--top-k', type=int, default=related.TOP_K, help='Neighbors stored per product')
+        parser.add_argument('--batch-size', type=int, default=related.BATCH_SIZE, help='Products read per query and written per transaction')
+
+    def handle(self, *args, **options):
+        if related.np is None:
+            raise CommandError('numpy is not installed. Install it with: pip install numpy')
+        top_k = options['top_k']
+        if top_k < 1:
+            raise CommandError('--top-k must be at least 1')
+
+        record = related.build(
+            full=options['full'],
+            k=top_k,
+            batch_size=max(1, options['batch_size']),
+            log=self.stdout.write,
+        )
+        # detail pages read the neighbors through the catalog cache
+        catalog_cache.invalidate()
+
+        kind = 'Full' if record.full else 'Incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind} build: {record.products_updated}/{record.products_indexed} products updated "
+            f"in {record.seconds:.1f}s, peak memory {record.peak_memory_mb:.0f} MB"
+        ))
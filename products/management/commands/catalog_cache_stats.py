@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products import cache as catalog_cache
+
+
+class Command(BaseCommand):
+    help = "Show the catalog cache hit/miss counters"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'CATALOG_CACHE_STATS', False):
+            self.stdout.write(self.style.WARNING('CATALOG_CACHE_STATS is off, the counters are not updated'))
+        stats = catalog_cache.stats()
+        self.stdout.write(f"generation: {stats['generation']}")
+        self.stdout.write(f"hits:       {stats['hits']}")
+        self.stdout.write(f"misses:     {stats['misses']}")
+        self.stdout.write(f"hit ratio:  {stats['hit_ratio']:.1%}")
+        if options['reset']:
+            catalog_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
@@ -0,0 +1,167 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from marketPlace.db import write_atomic
+from products import cache as catalog_cache
+from products.forms import ProductForm
+from products.models import STATS_FIELDS, CatalogStats, Product, reserved_stock_error, stats_contribution
+
+
+# columns a feed row may set; anything else is ignored
+FIELDS = ['code', 'name', 'price', 'description', 'in_stock', 'stock_quantity']
+# columns overwritten when a row's code already exists
+UPDATE_FIELDS = ['name', 'price', 'description', 'in_stock', 'stock_quantity', 'updated_at']
+# feed values read as "false" for in_stock
+FALSE_VALUES = {'', '0', 'false', 'no', 'n', 'off'}
+
+
+def read_csv(fh):
+    """Yield (line number, row dict) from a CSV file with a header row"""
+    reader = csv.DictReader(fh)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(fh):
+    """Yield (line number, row dict) from a JSON Lines file, skipping blank lines"""
+    for line_num, line in enumerate(fh, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield line_num, {'__error__': f'Invalid JSON: {exc}'}
+            continue
+        yield line_num, row if isinstance(row, dict) else {'__error__': 'Expected a JSON object'}
+
+
+class RowValidator:
+    """Validate feed rows with the ProductForm rules (a fresh form per row)"""
+
+    def __init__(self):
+        self.code_length = Product._meta.get_field('code').max_length
+
+    def validate(self, row):
+        """Return (product, None) for a valid row or (None, errors)"""
+        if '__error__' in row:
+            return None, {'__all__': [row['__error__']]}
+        code = str(row.get('code') or '').strip()
+        if not code:
+            return None, {'code': ['Product code is required']}
+        if len(code) > self.code_length:
+            return None, {'code': ['Product code is too long']}
+
+        data = {name: row[name] for name in FIELDS[1:] if row.get(name) is not None}
+        in_stock = data.get('in_stock')
+        if isinstance(in_stock, str):
+            data['in_stock'] = in_stock.strip().lower() not in FALSE_VALUES
+        form = ProductForm(data=data)
+        if not form.is_valid():
+            return None, {field: list(messages) for field, messages in form.errors.items()}
+
+        product = form.instance
+        product.code = code
+        if 'in_stock' not in data:
+            # a feed without the column means "available when there are units"
+            product.in_stock = product.stock_quantity > 0
+        return product, None
+
+
+class Command(BaseCommand):
+    help = "Import products from a CSV or JSON Lines file, creating or updating them by code"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or .jsonl file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None, help='File format (default: from the extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows validated and upserted per transaction')
+        parser.add_argument('--rejects', default=None, help='File the invalid rows are written to (default: <path>.rejects.jsonl)')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or ('jsonl' if path.suffix.lower() in ('.jsonl', '.ndjson') else 'csv')
+        batch_size = max(1, options['batch_size'])
+        rejects_path = Path(options['rejects'] or f"{path}.rejects.jsonl")
+
+        validator = RowValidator()
+        imported = rejected = 0
+        started = time.monotonic()
+        # rows are streamed one batch at a time, so memory does not grow with the file
+        with path.open(newline='', encoding='utf-8-sig') as fh, rejects_path.open('w', encoding='utf-8') as rejects:
+            rows = read_jsonl(fh) if fmt == 'jsonl' else read_csv(fh)
+            while batch := list(islice(rows, batch_size)):
+                products = {}
+                for line_num, row in batch:
+                    product, errors = validator.validate(row)
+                    if errors:
+                        rejected += 1
+                        rejects.write(json.dumps({'line': line_num, 'row': row, 'errors': errors}, default=str) + '\n')
+                        continue
+                    # the last row wins when a code repeats within the batch
+                    products[product.code] = (line_num, row, product)
+                if products:
+                    refused = self._upsert(products)
+                    for line_num, row, errors in refused:
+                        rejects.write(json.dumps({'line': line_num, 'row': row, 'errors': errors}, default=str) + '\n')
+                    rejected += len(refused)
+                    imported += len(products) - len(refused)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{imported} imported, {rejected} rejected ({imported / elapsed if elapsed else 0:.0f} rows/s)")
+
+        # bulk_create does not send post_save, drop the cached catalog reads explicitly
+        catalog_cache.invalidate()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} products in {elapsed:.1f}s"))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"{rejected} rows rejected, see {rejects_path}"))
+        else:
+            rejects_path.unlink()
+
+    def _upsert(self, products):
+        """
+        Insert new codes and update existing ones with one statement per batch.
+
+        products maps each code to its (line number, row, product). Rows that
+        would take an existing product's stock below its reserved units are
+        left out and returned as (line number, row, errors).
+        """
+        now = timezone.now()
+        refused = {}
+        with write_atomic():
+            # stored stats of the rows about to be overwritten, for the CatalogStats delta; the
+            # rows stay locked so no reservation can land between this check and the upsert
+            existing = {}
+            rows = Product.objects.select_for_update().filter(code__in=list(products))
+            for code, reserved, *values in rows.values_list('code', 'reserved_quantity', *STATS_FIELDS):
+                line_num, row, product = products[code]
+                if product.stock_quantity < reserved:
+                    refused[code] = (line_num, row, {'stock_quantity': [reserved_stock_error(reserved)]})
+                    continue
+                # in_stock means "units available", reserved ones are not
+                product.in_stock = product.in_stock and product.stock_quantity > reserved
+                existing[code] = stats_contribution(*values)
+            products = [product for code, (_, _, product) in products.items() if code not in refused]
+            for product in products:
+                product.updated_at = now
+            # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target (any unique key matches)
+            conflict_target = {'unique_fields': ['code']} if connection.features.supports_update_conflicts_with_target else {}
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                update_fields=UPDATE_FIELDS,
+                **conflict_target,
+            )
+            CatalogStats.apply_changes(
+                (existing.get(product.code), product.stats_contribution()) for product in products
+            )
+        return list(refused.values())
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from products import cache as catalog_cache
+from products.models import CatalogStats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog statistics row from the products table and report any drift"
+
+    def handle(self, *args, **options):
+        before = CatalogStats.objects.filter(pk=CatalogStats.SINGLETON_ID).first()
+        after = CatalogStats.recompute()
+        catalog_cache.invalidate()
+
+        fields = ['product_count', 'in_stock_count', 'total_units', 'inventory_value']
+        for name in fields:
+            old = getattr(before, name) if before else None
+            new = getattr(after, name)
+            drift = '' if old == new else f"  (was {old})"
+            self.stdout.write(f"{name:<16} {new}{drift}")
+        drifted = before is None or any(getattr(before, name) != getattr(after, name) for name in fields)
+        if drifted:
+            self.stdout.write(self.style.WARNING('Catalog stats were out of date and have been repaired'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Catalog stats were up to date'))
@@ -1,12 +1,19 @@
 import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Q
 from django.utils.text import slugify
 
+from products import cache as catalog_cache
 from products.models import Product
+from products.tasks import build_image_derivatives, collect_media
 
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -16,12 +23,70 @@ except Exception as exc:  # Pillow might not be installed yet
     ImageFont = None  # type: ignore
 
 
+@lru_cache(maxsize=None)
+def load_fonts():
+    """Load the title/subtitle fonts once per process"""
+    try:
+        # Common system font; not guaranteed everywhere
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", 36), ImageFont.truetype("DejaVuSans.ttf", 24)
+    except Exception:
+        return ImageFont.load_default(), ImageFont.load_default()
+
+
+def render_image(img_path, title, subtitle, seed):
+    """Render one placeholder product image to img_path"""
+    rng = random.Random(seed)
+
+    # Generate a pleasant pastel background color
+    base = rng.randint(160, 210)
+    background = (base, base - rng.randint(10, 30), base - rng.randint(0, 20))
+
+    width, height = 800, 600
+    image = Image.new('RGB', (width, height), color=background)
+    drawer = ImageDraw.Draw(image)
+    font_title, font_sub = load_fonts()
+
+    # Compute positions
+    title_bbox = drawer.textbbox((0, 0), title, font=font_title)
+    title_w = title_bbox[2] - title_bbox[0]
+    title_h = title_bbox[3] - title_bbox[1]
+
+    sub_bbox = drawer.textbbox((0, 0), subtitle, font=font_sub)
+    sub_w = sub_bbox[2] - sub_bbox[0]
+
+    # Centered positions
+    title_x = (width - title_w) // 2
+    title_y = height // 2 - title_h
+    sub_x = (width - sub_w) // 2
+    sub_y = title_y + title_h + 16
+
+    # Draw text with a subtle shadow for readability
+    shadow_offset = 2
+    drawer.text((title_x + shadow_offset, title_y + shadow_offset), title, fill=(0, 0, 0), font=font_title)
+    drawer.text((sub_x + shadow_offset, sub_y + shadow_offset), subtitle, fill=(0, 0, 0), font=font_sub)
+    drawer.text((title_x, title_y), title, fill=(255, 255, 255), font=font_title)
+    drawer.text((sub_x, sub_y), subtitle, fill=(255, 255, 255), font=font_sub)
+
+    image.save(img_path, format='PNG')
+
+
+def _render_job(job):
+    # runs in a worker process (or inline with --workers 1)
+    pk, img_path, title, subtitle = job
+    render_image(img_path, title, subtitle, seed=pk)
+    return pk
+
+
 class Command(BaseCommand):
     help = "Generate and assign dummy images for products without images"
 
     def add_arguments(self, parser):
         parser.add_argument('--overwrite', action='store_true', help='Regenerate images even if they exist or product has one')
         parser.add_argument('--count', type=int, default=None, help='Limit how many products to process')
+        parser.add_argument('--workers', type=int, default=1, help='Render images in a pool of N processes')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products rendered and saved per batch')
+        parser.add_argument('--checkpoint', default=None, help='Checkpoint file (default: MEDIA_ROOT/products/.seed_product_images.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start from the first product')
 
     def handle(self, *args, **options):
         if Image is None:
@@ -32,81 +97,88 @@ class Command(BaseCommand):
         target_dir: Path = media_dir / 'products'
         target_dir.mkdir(parents=True, exist_ok=True)
 
-        qs = Product.objects.all().order_by('id')
-        if options['count']:
-            qs = qs[: options['count']]
+        checkpoint = Path(options['checkpoint'] or target_dir / '.seed_product_images.checkpoint')
+        last_id = 0
+        if checkpoint.exists() and not options['restart']:
+            last_id = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(self.style.WARNING(f"Resuming after product id {last_id}"))
+
+        qs = Product.objects.all()
+        if not options['overwrite']:
+            # Skip products that already have images
+            qs = qs.filter(Q(image='') | Q(image__isnull=True))
+        remaining = options['count']
 
         processed = 0
         created_files = 0
-
-        for product in qs:
-            filename_stem = slugify(product.code or product.name) or f"product-{product.pk}"
-            filename = f"{filename_stem}.png"
-            img_path = target_dir / filename
-
-            if product.image and not options['overwrite']:
-                # Skip products that already have images
-                continue
-
-            if img_path.exists() and not options['overwrite']:
-                # Assign existing file without regenerating
-                product.image.name = f"products/{filename}"
-                product.save(update_fields=['image'])
-                processed += 1
-                continue
-
-            # Generate a pleasant pastel background color
-            hue = random.randint(180, 360)
-            base = random.randint(160, 210)
-            background = (base, base - random.randint(10, 30), base - random.randint(0, 20))
-
-            width, height = 800, 600
-            image = Image.new('RGB', (width, height), color=background)
-            drawer = ImageDraw.Draw(image)
-
-            # Title text: product name (fallback to code)
-            title = product.name or product.code
-            subtitle = f"${product.price}"
-
-            # Choose fonts (fallback to default if truetype not available)
-            try:
-                # Common system font; not guaranteed everywhere
-                font_title = ImageFont.truetype("DejaVuSans-Bold.ttf", 36)
-                font_sub = ImageFont.truetype("DejaVuSans.ttf", 24)
-            except Exception:
-                font_title = ImageFont.load_default()
-                font_sub = ImageFont.load_default()
-
-            # Compute positions
-            title_bbox = drawer.textbbox((0, 0), title, font=font_title)
-            title_w = title_bbox[2] - title_bbox[0]
-            title_h = title_bbox[3] - title_bbox[1]
-
-            sub_bbox = drawer.textbbox((0, 0), subtitle, font=font_sub)
-            sub_w = sub_bbox[2] - sub_bbox[0]
-            sub_h = sub_bbox[3] - sub_bbox[1]
-
-            # Centered positions
-            title_x = (width - title_w) // 2
-            title_y = height // 2 - title_h
-            sub_x = (width - sub_w) // 2
-            sub_y = title_y + title_h + 16
-
-            # Draw text with a subtle shadow for readability
-            shadow_offset = 2
-            for dx, dy in [(shadow_offset, shadow_offset)]:
-                drawer.text((title_x + dx, title_y + dy), title, fill=(0, 0, 0), font=font_title)
-                drawer.text((sub_x + dx, sub_y + dy), subtitle, fill=(0, 0, 0), font=font_sub)
-            drawer.text((title_x, title_y), title, fill=(255, 255, 255), font=font_title)
-            drawer.text((sub_x, sub_y), subtitle, fill=(255, 255, 255), font=font_sub)
-
-            image.save(img_path, format='PNG')
-            created_files += 1
-
-            product.image.name = f"products/{filename}"
-            product.save(update_fields=['image'])
-            processed += 1
-
-        self.stdout.write(self.style.SUCCESS(f"Processed {processed} products, created {created_files} image files in {target_dir}"))
-
-
+        started = time.monotonic()
+
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        try:
+            while remaining is None or remaining > 0:
+                size = options['batch_size'] if remaining is None else min(options['batch_size'], remaining)
+                batch = list(
+                    qs.filter(id__gt=last_id).order_by('id').only('id', 'name', 'code', 'price', 'image', 'image_digest', 'image_width')[:size]
+                )
+                if not batch:
+                    break
+
+                jobs = []
+                # files and derivatives the batch stops using, deleted by a worker once it commits
+                replaced = []
+                for product in batch:
+                    if product.image.name or product.image_digest:
+                        replaced.append((product.image.name, product.image_digest))
+                    filename_stem = slugify(product.code or product.name) or f"product-{product.pk}"
+                    filename = f"{filename_stem}.png"
+                    img_path = target_dir / filename
+                    product.image.name = f"products/{filename}"
+                    if img_path.exists() and not options['overwrite']:
+                        # Assign existing file without regenerating
+                        continue
+                    # Title text: product name (fallback to code)
+                    jobs.append((product.pk, str(img_path), product.name or product.code, f"${product.price}"))
+
+                if pool is not None:
+                    created_files += len(list(pool.map(_render_job, jobs, chunksize=8)))
+                else:
+                    created_files += len([_render_job(job) for job in jobs])
+
+                # assign the images of the whole batch in one transaction
+                for product in batch:
+                    product.image_digest = ''
+                    product.image_width = 0
+                with transaction.atomic():
+                    Product.objects.bulk_update(batch, ['image', 'image_digest', 'image_width'])
+                    if replaced:
+                        collect_media.enqueue_on_commit(replaced)
+                    # bulk_update sends no post_save, so queue the derivatives the signal would have
+                    for product in batch:
+                        build_image_derivatives.enqueue_on_commit(
+                            product.pk, product.image.name, dedup_key=f'derivatives:{product.pk}:{product.image.name}',
+                        )
+
+                processed += len(batch)
+                last_id = batch[-1].pk
+                if remaining is not None:
+                    remaining -= len(batch)
+                checkpoint.write_text(str(last_id))
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{processed} products ({created_files / elapsed if elapsed else 0:.1f} images/s)")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        # the run completed, the next one starts from scratch
+        if checkpoint.exists():
+            os.remove(checkpoint)
+        catalog_cache.invalidate()
+
+        elapsed = time.monotonic() - started
+        rate = created_files / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} products, created {created_files} image files in {target_dir} "
+            f"({elapsed:.1f}s, {rate:.1f} images/s)"
+        ))
@@ -1,7 +1,14 @@
 import random
+import time
 from decimal import Decimal
 from django.core.management.base import BaseCommand
-from products.models import Product
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from products import cache as catalog_cache
+from products.models import CatalogStats, Product, RelatedProduct, allocate_codes, stats_contribution
+from products.search import deferred_insert_index
+from products.tasks import collect_media
 
 
 NAMES = [
@@ -65,31 +72,96 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--count', type=int, default=24, help='Number of products to create')
         parser.add_argument('--flush', action='store_true', help='Delete existing products before seeding')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Products inserted per bulk_create/transaction')
 
     def handle(self, *args, **options):
         count = options['count']
+        batch_size = max(1, options['batch_size'])
         if options['flush']:
-            Product.objects.all().delete()
-            self.stdout.write(self.style.WARNING('Deleted existing products'))
+            deleted = self._flush()
+            self.stdout.write(self.style.WARNING(f'Deleted {deleted} existing products'))
 
         created = 0
-        for i in range(count):
-            name = NAMES[i % len(NAMES)]
-            description = DESCRIPTIONS[i % len(DESCRIPTIONS)]
-            price = Decimal(random.randint(20, 300)) + Decimal(random.choice([0, 0.49, 0.99]))
-            stock_quantity = random.randint(0, 120)
+        started = time.monotonic()
+        while created < count:
+            size = min(batch_size, count - created)
+            # one round trip reserves the codes of the whole batch
+            codes = allocate_codes(size)
+            now = connection.ops.adapt_datetimefield_value(timezone.now())
+            rows = []
+            # CatalogStats delta of the batch: products, in stock, units, value
+            delta = [0, 0, 0, Decimal('0')]
+            for offset, code in enumerate(codes):
+                i = created + offset
+                name = NAMES[i % len(NAMES)]
+                description = DESCRIPTIONS[i % len(DESCRIPTIONS)]
+                price = Decimal(random.randint(20, 300)) + Decimal(random.choice(['0', '0.49', '0.99']))
+                stock_quantity = random.randint(0, 120)
+                for index, part in enumerate(stats_contribution(stock_quantity > 0, stock_quantity, price)):
+                    delta[index] += part
+                rows.append((
+                    f"{name} #{i+1}",
+                    description,
+                    connection.ops.adapt_decimalfield_value(price, 10, 2),
+                    stock_quantity > 0,
+                    stock_quantity,
+                    0,
+                    code,
+                    '',
+                    0,
+                    now,
+                    now,
+                ))
+            # each batch is inserted with one executemany in its own transaction
+            with transaction.atomic(), deferred_insert_index():
+                self._insert(rows)
+                CatalogStats.apply_delta(*delta)
+            created += size
 
-            product = Product(
-                name=f"{name} #{i+1}",
-                description=description,
-                price=price,
-                in_stock=stock_quantity > 0,
-                stock_quantity=stock_quantity,
-            )
-            # code auto-generated in model save()
-            product.save()
-            created += 1
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{created}/{count} products ({created / elapsed if elapsed else 0:.0f} rows/s)")
 
-        self.stdout.write(self.style.SUCCESS(f"Created {created} products"))
+        # bulk_create does not send post_save, drop the cached catalog reads explicitly
+        catalog_cache.invalidate()
 
+        elapsed = time.monotonic() - started
+        rate = created / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(f"Created {created} products in {elapsed:.1f}s ({rate:.0f} rows/s)"))
 
+    def _flush(self):
+        """
+        Delete every product with plain DELETE statements.
+
+        QuerySet.delete() sends post_delete per row, which costs a CatalogStats
+        UPDATE and a media cleanup task per product; instead the stats are
+        recomputed, the images collected and the cache invalidated once.
+        """
+        with transaction.atomic():
+            images = [
+                (name or '', digest) for name, digest in
+                Product.objects.filter(Q(image__gt='') | ~Q(image_digest='')).values_list('image', 'image_digest')
+            ]
+            # _raw_delete() does not cascade, the related rows go first
+            RelatedProduct.objects.all()._raw_delete(RelatedProduct.objects.db)
+            deleted = Product.objects.all()._raw_delete(Product.objects.db)
+            CatalogStats.recompute()
+            if images:
+                collect_media.enqueue_on_commit(images)
+            transaction.on_commit(catalog_cache.invalidate)
+        return deleted
+
+    def _insert(self, rows):
+        """
+        Insert prepared rows with a single executemany.
+
+        This skips building a model instance per row (what dominates the cost of
+        bulk_create at this volume); values are already adapted for the backend.
+        """
+        columns = ['name', 'description', 'price', 'in_stock', 'stock_quantity', 'reserved_quantity', 'code', 'image_digest', 'image_width', 'created_at', 'updated_at']
+        table = connection.ops.quote_name(Product._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(connection.ops.quote_name(c) for c in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
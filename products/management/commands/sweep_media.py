@@ -0,0 +1,141 @@
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.images import DERIVATIVES_DIR
+from products.models import Product
+
+
+# storage directory of the uploaded and seeded product images
+IMAGES_DIR = 'products'
+# directory entries stat'ed (and deleted) per worker task
+SCAN_BATCH_SIZE = 500
+# derivative filenames: <digest>-<width>w.<ext>
+DERIVATIVE_RE = re.compile(r'^(?P<digest>[0-9a-f]+)-\d+w\.\w+$')
+
+
+def scan_files(directory):
+    """Yield every regular file below directory, one os.scandir() listing at a time"""
+    pending = [directory]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def _human(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+class Command(BaseCommand):
+    help = "Delete product images and derivatives under MEDIA_ROOT that no product references"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+        parser.add_argument('--workers', type=int, default=8, help='Threads checking and deleting files')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Keep files modified less than this many seconds ago (uploads whose transaction is still open)',
+        )
+
+    def handle(self, *args, **options):
+        root = Path(settings.MEDIA_ROOT)
+        images_dir = root / IMAGES_DIR
+        if not images_dir.is_dir():
+            raise CommandError(f"{images_dir} does not exist")
+        started = time.monotonic()
+
+        # everything the products table points at, read in chunks
+        names, digests = set(), set()
+        for image, digest in Product.objects.values_list('image', 'image_digest').iterator(chunk_size=5000):
+            if image:
+                names.add(image)
+            if digest:
+                digests.add(digest)
+        self.stdout.write(f"{len(names)} referenced images, {len(digests)} referenced derivative sets")
+
+        self.root = root
+        self.derivatives_dir = root / DERIVATIVES_DIR
+        self.names, self.digests = names, digests
+        self.cutoff = time.time() - options['min_age']
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+
+        totals = {'files': 0, 'bytes': 0, 'orphans': 0, 'orphan_bytes': 0, 'errors': 0}
+        workers = max(1, options['workers'])
+        entries = scan_files(images_dir)
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # a bounded window of batches, so the listing is never held in memory at once
+            while batch := list(islice(entries, SCAN_BATCH_SIZE)):
+                in_flight.append(pool.submit(self.sweep_batch, batch))
+                if len(in_flight) >= workers * 2:
+                    self.add(totals, in_flight.popleft().result())
+            while in_flight:
+                self.add(totals, in_flight.popleft().result())
+
+        elapsed = time.monotonic() - started
+        action = 'Would delete' if self.dry_run else 'Deleted'
+        self.stdout.write(
+            f"Scanned {totals['files']} files ({_human(totals['bytes'])}) in {elapsed:.1f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {totals['orphans']} orphaned files ({_human(totals['orphan_bytes'])})"
+        ))
+        if totals['errors']:
+            self.stdout.write(self.style.WARNING(f"{totals['errors']} files could not be deleted"))
+
+    def add(self, totals, result):
+        for key, value in result.items():
+            totals[key] += value
+
+    def is_orphan(self, path):
+        if path.name.startswith('.'):
+            # checkpoints and other bookkeeping files
+            return False
+        if path.parent == self.derivatives_dir:
+            match = DERIVATIVE_RE.match(path.name)
+            return bool(match) and match['digest'] not in self.digests
+        return path.relative_to(self.root).as_posix() not in self.names
+
+    def sweep_batch(self, entries):
+        """Check (and delete) one batch of directory entries, return its counters"""
+        result = {'files': 0, 'bytes': 0, 'orphans': 0, 'orphan_bytes': 0, 'errors': 0}
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            result['files'] += 1
+            result['bytes'] += stat.st_size
+            path = Path(entry.path)
+            if stat.st_mtime > self.cutoff or not self.is_orphan(path):
+                continue
+            if self.verbosity > 1:
+                self.stdout.write(f"  {path.relative_to(self.root).as_posix()} ({_human(stat.st_size)})")
+            if not self.dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                except OSError as exc:
+                    result['errors'] += 1
+                    self.stderr.write(self.style.WARNING(f"{path}: {exc}"))
+                    continue
+            result['orphans'] += 1
+            result['orphan_bytes'] += stat.st_size
+        return result
@@ -0,0 +1,41 @@
+import logging
+
+from django.core.files.storage import default_storage
+
+from .images import derivative_names
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+def collect(files, storage=None):
+    """
+    Delete product images and derivatives that no product references any more.
+
+    files is an iterable of (image name, image digest) pairs, either may be
+    empty. Names and digests still used by some product (another product
+    sharing the file, or the same name written again) are kept. Returns the
+    number of files deleted.
+    """
+    storage = storage or default_storage
+    files = list(files)
+    names = {name for name, _ in files if name}
+    digests = {digest for _, digest in files if digest}
+    if not names and not digests:
+        return 0
+    referenced = set(Product.objects.filter(image__in=names).values_list('image', flat=True)) if names else set()
+    used_digests = set(Product.objects.filter(image_digest__in=digests).values_list('image_digest', flat=True)) if digests else set()
+
+    orphans = list(names - referenced)
+    for digest in digests - used_digests:
+        orphans.extend(derivative_names(digest))
+    deleted = 0
+    for name in orphans:
+        try:
+            if storage.exists(name):
+                storage.delete(name)
+                deleted += 1
+        except OSError:
+            logger.exception('Could not delete orphaned media file %s', name)
+    return deleted
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from products.search import install_index, uninstall_index
+
+
+def forwards(apps, schema_editor):
+    install_index(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    uninstall_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_created_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+from products.search import install_index
+
+
+def reinstall_search_index(apps, schema_editor):
+    # SQLite rebuilt the products table above, which dropped the FTS triggers
+    if schema_editor.connection.vendor == 'sqlite':
+        install_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.RunPython(reinstall_search_index, migrations.RunPython.noop),
+    ]
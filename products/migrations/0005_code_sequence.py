@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_image_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+            options={
+                'db_table': 'products_code_sequence',
+            },
+        ),
+    ]
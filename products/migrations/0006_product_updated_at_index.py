@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_code_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='products_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_reserved_quantity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', '-created_at', '-id'], name='products_stock_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['in_stock', 'price'], name='products_stock_price_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+
+
+def compute_catalog_stats(apps, schema_editor):
+    # the initial row, same aggregate as CatalogStats.recompute()
+    Product = apps.get_model('products', 'Product')
+    CatalogStats = apps.get_model('products', 'CatalogStats')
+    totals = Product.objects.aggregate(
+        product_count=Count('pk'),
+        in_stock_count=Count('pk', filter=Q(in_stock=True)),
+        total_units=Sum('stock_quantity', default=0),
+        inventory_value=Sum(
+            F('price') * F('stock_quantity'), default=Decimal('0'),
+            output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        ),
+    )
+    totals['inventory_value'] = Decimal(totals['inventory_value']).quantize(Decimal('0.01'))
+    CatalogStats.objects.update_or_create(pk=1, defaults=totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStats',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('product_count', models.BigIntegerField(default=0)),
+                ('in_stock_count', models.BigIntegerField(default=0)),
+                ('total_units', models.BigIntegerField(default=0)),
+                ('inventory_value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Catalog stats',
+                'verbose_name_plural': 'Catalog stats',
+                'db_table': 'products_catalog_stats',
+            },
+        ),
+        migrations.RunPython(compute_catalog_stats, migrations.RunPython.noop),
+    ]
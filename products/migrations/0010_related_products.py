@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedIndexBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('full', models.BooleanField(default=False)),
+                ('products_indexed', models.PositiveIntegerField(default=0)),
+                ('products_updated', models.PositiveIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0)),
+                ('peak_memory_mb', models.FloatField(default=0)),
+            ],
+            options={
+                'db_table': 'products_related_build',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+            ],
+            options={
+                'db_table': 'products_related',
+                'ordering': ['product', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='products_related_rank_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+import os
+
+from django.db import migrations
+
+
+def enable_wal(apps, schema_editor):
+    # the journal mode is stored in the database file, so it is set once here
+    # rather than by every connection (SQLITE_JOURNAL_MODE picks another one)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    mode = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode={mode}')
+
+
+class Migration(migrations.Migration):
+
+    # SQLite cannot change the journal mode inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('products', '0010_related_products'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, migrations.RunPython.noop),
+    ]
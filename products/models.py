@@ -1,6 +1,25 @@
+from decimal import Decimal
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
 import uuid
 
+from marketPlace.db import write_atomic
+
+
+# Product fields that feed CatalogStats
+STATS_FIELDS = ('in_stock', 'stock_quantity', 'price')
+
+
+def stats_contribution(in_stock, stock_quantity, price):
+    """(products, in stock, units, inventory value) that one product adds to CatalogStats"""
+    stock_quantity = int(stock_quantity)
+    return (1, int(bool(in_stock)), stock_quantity, Decimal(str(price)) * stock_quantity)
+
+def reserved_stock_error(reserved_quantity):
+    return f'Stock quantity cannot be less than the {reserved_quantity} units reserved by open orders.'
+
 # Product model
 class Product(models.Model):
     
@@ -12,10 +31,16 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     # imagefield to store the image of the product
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # content hash naming the resized derivatives of the image (empty until they are generated)
+    image_digest = models.CharField(max_length=16, blank=True, default='', editable=False)
+    # width (px) of the image the derivatives were built from, set with image_digest (0 = unknown)
+    image_width = models.PositiveIntegerField(default=0, editable=False)
     # booleanfield to store if the product is in stock
     in_stock = models.BooleanField(default=True)
     # positiveintegerfield to store the stock quantity of the product
     stock_quantity = models.PositiveIntegerField(default=0)
+    # positiveintegerfield to store the units held by open reservations (changed only through products.stock)
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
     # datetimefield with auto_now_add to set the date and time when the object is created
     created_at = models.DateTimeField(auto_now_add=True)
     # datetimefield with auto_now to set the date and time when the object is updated
@@ -29,19 +54,246 @@ class Product(models.Model):
         verbose_name_plural = "Products"
         ordering = ['-created_at']
         db_table = 'products'
+        indexes = [
+            # composite index backing the keyset pagination of product_list
+            models.Index(fields=['-created_at', '-id'], name='products_created_id_idx'),
+            # lets max(updated_at) for conditional GETs be answered from the index
+            models.Index(fields=['updated_at'], name='products_updated_at_idx'),
+            # product_list filtered by availability, in keyset order
+            models.Index(fields=['in_stock', '-created_at', '-id'], name='products_stock_created_idx'),
+            # availability + price range filters and the price facet counts
+            models.Index(fields=['in_stock', 'price'], name='products_stock_price_idx'),
+        ]
     
     # __str__ method to return the name of the product
     def __str__(self):
         return self.name
     
+    # from_db remembers the stored image name so save() can tell when it changes,
+    # and the stored stats fields so the CatalogStats delta needs no extra query
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image_name = instance.__dict__.get('image')
+        instance._loaded_stats = instance.stats_contribution()
+        return instance
+
+    # refresh_from_db copies fresh values onto this instance, refresh the remembered ones too
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'image' in fields:
+            self._loaded_image_name = self.__dict__.get('image')
+        if fields is None or set(fields) & set(STATS_FIELDS):
+            self._loaded_stats = self.stats_contribution()
+
+    # clean method to keep the units held by open reservations (products.stock) covered by the stock
+    def clean(self):
+        super().clean()
+        if self.stock_quantity is not None and self.stock_quantity < self.reserved_quantity:
+            raise ValidationError({'stock_quantity': reserved_stock_error(self.reserved_quantity)})
+
+    def stats_contribution(self):
+        """This product's share of CatalogStats, or None when a stats field is deferred"""
+        if any(name not in self.__dict__ for name in STATS_FIELDS):
+            return None
+        return stats_contribution(self.in_stock, self.stock_quantity, self.price)
+
     # save method to generate a unique code for the product
     def save(self, *args, **kwargs):    
         # if the code is not set, generate a unique code for the product
         if not self.code:
             # generate a unique code for the product
             self.code = str(uuid.uuid4())[:8].upper()
+        # a new or replaced image invalidates the derivatives of the old one
+        if 'image' not in self.get_deferred_fields() and self.image.name != getattr(self, '_loaded_image_name', None):
+            # the stored file and its derivatives, for the media garbage collector
+            if getattr(self, '_loaded_image_name', None):
+                self._replaced_image = (self._loaded_image_name, self.image_digest)
+            self.image_digest = ''
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'image' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'image_digest'}
         super().save(*args, **kwargs)
+        if 'image' not in self.get_deferred_fields():
+            self._loaded_image_name = self.image.name
         return self
 
 
+# CodeSequence model: hands out blocks of product codes for bulk inserts
+class CodeSequence(models.Model):
+
+    # charfield to store the name of the sequence
+    name = models.CharField(max_length=50, primary_key=True)
+    # bigintegerfield to store the next value that has not been handed out
+    next_value = models.BigIntegerField(default=1)
+
+    class Meta:
+        db_table = 'products_code_sequence'
+
+    def __str__(self):
+        return f"{self.name} @ {self.next_value}"
+
+    @classmethod
+    def allocate(cls, size, name='product'):
+        """
+        Reserve a block of size consecutive values and return the first one.
+
+        The increment is a single row-locked UPDATE, so concurrent callers
+        always get disjoint blocks.
+        """
+        with write_atomic():
+            cls.objects.get_or_create(name=name)
+            sequence = cls.objects.select_for_update().get(name=name)
+            start = sequence.next_value
+            cls.objects.filter(name=name).update(next_value=models.F('next_value') + size)
+        return start
+
+
+def allocate_codes(size, prefix='P'):
+    """Return size unique product codes from one block of the code sequence"""
+    start = CodeSequence.allocate(size)
+    # the prefix and fixed width keep these apart from the 8-char uuid codes of Product.save()
+    return [f"{prefix}-{value:012d}" for value in range(start, start + size)]
+
+
+# CatalogStats model: catalog totals kept up to date by deltas (a single row)
+class CatalogStats(models.Model):
+
+    # primary key of the only row
+    SINGLETON_ID = 1
+
+    id = models.PositiveSmallIntegerField(primary_key=True, default=SINGLETON_ID)
+    # number of products
+    product_count = models.BigIntegerField(default=0)
+    # number of products flagged in stock
+    in_stock_count = models.BigIntegerField(default=0)
+    # sum of stock_quantity
+    total_units = models.BigIntegerField(default=0)
+    # sum of price * stock_quantity
+    inventory_value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    # datetimefield with auto_now to set the date and time of the last change
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'products_catalog_stats'
+        verbose_name = "Catalog stats"
+        verbose_name_plural = "Catalog stats"
+
+    def __str__(self):
+        return f"{self.product_count} products, {self.total_units} units"
+
+    @property
+    def out_of_stock_count(self):
+        return self.product_count - self.in_stock_count
+
+    @classmethod
+    def current(cls):
+        """The stats row (computed from the products table the first time)"""
+        return cls.objects.filter(pk=cls.SINGLETON_ID).first() or cls.recompute()
+
+    @classmethod
+    def recompute(cls):
+        """Rebuild the row from a full aggregate over the products table (repairs any drift)"""
+        totals = Product.objects.aggregate(
+            product_count=Count('pk'),
+            in_stock_count=Count('pk', filter=Q(in_stock=True)),
+            total_units=Sum('stock_quantity', default=0),
+            inventory_value=Sum(
+                F('price') * F('stock_quantity'), default=Decimal('0'),
+                output_field=models.DecimalField(max_digits=20, decimal_places=2),
+            ),
+        )
+        # SQLite sums decimals as floats
+        totals['inventory_value'] = Decimal(totals['inventory_value']).quantize(Decimal('0.01'))
+        stats, _ = cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=totals)
+        return stats
+
+    @classmethod
+    def apply_delta(cls, products=0, in_stock=0, units=0, value=0):
+        """
+        Add a delta to the totals with one UPDATE.
+
+        Called inside the transaction that changes the products, so a rollback
+        also undoes the delta. Every writer updates this one row, which
+        serialises concurrent product writes on it until they commit.
+        """
+        if not (products or in_stock or units or value):
+            return
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            product_count=F('product_count') + products,
+            in_stock_count=F('in_stock_count') + in_stock,
+            total_units=F('total_units') + units,
+            inventory_value=F('inventory_value') + value,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # no row yet: the first aggregate already includes this change
+            cls.recompute()
+
+    @classmethod
+    def apply_change(cls, old, new):
+        """Apply the difference between two stats_contribution() tuples (None = no product)"""
+        cls.apply_changes([(old, new)])
+
+    @classmethod
+    def apply_changes(cls, changes):
+        """Apply the summed differences of many (old, new) contribution pairs with one UPDATE"""
+        delta = [0, 0, 0, 0]
+        for old, new in changes:
+            old = old or (0, 0, 0, 0)
+            new = new or (0, 0, 0, 0)
+            for index in range(4):
+                delta[index] += new[index] - old[index]
+        cls.apply_delta(*delta)
+
+
+# RelatedProduct model: the precomputed "related products" of a product (built by build_related_products)
+class RelatedProduct(models.Model):
+
+    # foreignkey to the product the row belongs to (the unique constraint below indexes it)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    # position of the neighbor, 0 is the most similar
+    rank = models.PositiveSmallIntegerField()
+    # foreignkey to the similar product
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # cosine similarity of the two products' name and description
+    score = models.FloatField()
+
+    class Meta:
+        db_table = 'products_related'
+        ordering = ['product', 'rank']
+        constraints = [
+            # one neighbor per rank; also the index the detail page reads its neighbors from
+            models.UniqueConstraint(fields=['product', 'rank'], name='products_related_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.2f})"
+
+
+# RelatedIndexBuild model: one run of build_related_products
+class RelatedIndexBuild(models.Model):
+
+    # datetimefields to store when the run started and finished (null while running or after a crash)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # booleanfield to store if every product was recomputed
+    full = models.BooleanField(default=False)
+    # products vectorised and products whose neighbors were rewritten
+    products_indexed = models.PositiveIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+    # build time and peak memory of the process
+    seconds = models.FloatField(default=0)
+    peak_memory_mb = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'products_related_build'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{'full' if self.full else 'incremental'} build at {self.started_at:%Y-%m-%d %H:%M}"
 
+    @classmethod
+    def last_finished(cls):
+        """The latest completed build, or None"""
+        return cls.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
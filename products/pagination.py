@@ -0,0 +1,237 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+
+
+# default number of products per page
+PAGE_SIZE = 12
+# how long (seconds) a cached total count stays valid
+COUNT_CACHE_TIMEOUT = 60
+# filtered result sets are counted up to this many rows
+COUNT_CAP = 10000
+# how long (seconds) an estimated table size stays cached
+ESTIMATE_CACHE_TIMEOUT = 300
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded"""
+
+
+def encode_cursor(product):
+    """Build an opaque cursor token from a product's (created_at, id) key (instance or values() dict)"""
+    if isinstance(product, dict):
+        created_at, pk = product['created_at'], product['id']
+    else:
+        created_at, pk = product.created_at, product.pk
+    payload = json.dumps([created_at.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Turn a cursor token back into a (created_at, id) tuple"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError, json.JSONDecodeError) as exc:
+        raise InvalidCursor(str(exc)) from exc
+
+
+class KeysetPage:
+    """One page of results returned by KeysetPaginator"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, paginator, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+        self._total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def total_count(self):
+        if self._total is None:
+            self._total = self.paginator.total_count()
+        return self._total
+
+
+class KeysetPaginator:
+    """
+    Cursor based paginator keyed on (created_at, id), newest first.
+
+    Each page is a single indexed range scan of ``per_page + 1`` rows, so deep
+    pages cost the same as the first one. The total count is optional and is
+    cached instead of being recomputed on every request, or passed in as
+    ``count`` when the caller already knows it (e.g. from facet counts).
+    """
+
+    def __init__(self, queryset, per_page=PAGE_SIZE, count_cache_key=None, count_timeout=COUNT_CACHE_TIMEOUT, count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_cache_key = count_cache_key
+        self.count_timeout = count_timeout
+        self.count = count
+
+    def get_page(self, after=None, before=None):
+        """Return the page after/before the given cursor tokens (first page if both are empty)"""
+        try:
+            if before:
+                key = decode_cursor(before)
+                page = self._before_page(list(self._before_queryset(key)[:self.per_page + 1]))
+            else:
+                key = decode_cursor(after) if after else None
+                page = self._after_page(key, list(self._after_queryset(key)[:self.per_page + 1]))
+        except InvalidCursor:
+            # a tampered or stale token falls back to the first page
+            return self.get_page()
+        # no full page newer than a "before" cursor, show the first page instead
+        return page if page is not None else self.get_page()
+
+    async def aget_page(self, after=None, before=None, with_total=True):
+        """Async version of get_page(); templates cannot query lazily, so the total is loaded up front"""
+        try:
+            if before:
+                key = decode_cursor(before)
+                page = self._before_page([row async for row in self._before_queryset(key)[:self.per_page + 1]])
+            else:
+                key = decode_cursor(after) if after else None
+                page = self._after_page(key, [row async for row in self._after_queryset(key)[:self.per_page + 1]])
+        except InvalidCursor:
+            return await self.aget_page(with_total=with_total)
+        if page is None:
+            return await self.aget_page(with_total=with_total)
+        if with_total:
+            page._total = await self.atotal_count()
+        return page
+
+    def _after_queryset(self, key):
+        qs = self.queryset.order_by('-created_at', '-id')
+        if key is not None:
+            created_at, pk = key
+            qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        return qs
+
+    def _after_page(self, key, rows):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        next_cursor = encode_cursor(rows[-1]) if rows and has_more else None
+        # anything reached through an "after" cursor has a previous page
+        previous_cursor = encode_cursor(rows[0]) if rows and key is not None else None
+        return KeysetPage(rows, next_cursor, previous_cursor, self)
+
+    def _before_queryset(self, key):
+        created_at, pk = key
+        return self.queryset.order_by('created_at', 'id').filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        )
+
+    def _before_page(self, rows):
+        # reaching the newest row means this is the first page: let the caller load it as such,
+        # so it is full even when rows were added or removed since the cursor was issued
+        if len(rows) <= self.per_page:
+            return None
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(rows, encode_cursor(rows[-1]), encode_cursor(rows[0]), self)
+
+    def total_count(self):
+        """Total number of rows, served from the cache when a key was given"""
+        if self.count is not None:
+            return self.count
+        if self.count_cache_key is None:
+            return self.queryset.count()
+        total = cache.get(self.count_cache_key)
+        if total is None:
+            total = self.queryset.count()
+            cache.set(self.count_cache_key, total, self.count_timeout)
+        return total
+
+    async def atotal_count(self):
+        """Async version of total_count()"""
+        if self.count is not None:
+            return self.count
+        if self.count_cache_key is None:
+            return await self.queryset.acount()
+        total = await cache.aget(self.count_cache_key)
+        if total is None:
+            total = await self.queryset.acount()
+            await cache.aset(self.count_cache_key, total, self.count_timeout)
+        return total
+
+
+def _table_statistics(connection, table):
+    # row count kept by the database's own table statistics, None if unknown
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # filled by ANALYZE; the first number of an index's stat is its row count
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if not cursor.fetchone()[0]:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] is not None else None
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+    return None
+
+
+def estimated_count(model, using='default'):
+    """
+    Approximate number of rows of a model's table, without a COUNT(*).
+
+    Read from the database's table statistics, or from the primary key range
+    (two index lookups) when there are none; cached for a few minutes.
+    """
+    table = model._meta.db_table
+    cache_key = f'estimated_count:{using}:{table}'
+    estimate = cache.get(cache_key)
+    if estimate is None:
+        estimate = _table_statistics(connections[using], table)
+        if estimate is None:
+            bounds = model._default_manager.using(using).aggregate(first=Min('pk'), last=Max('pk'))
+            estimate = bounds['last'] - bounds['first'] + 1 if bounds['last'] is not None else 0
+        cache.set(cache_key, estimate, ESTIMATE_CACHE_TIMEOUT)
+    return estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables that never runs an unbounded COUNT(*).
+
+    An unfiltered queryset is sized from estimated_count(); a filtered one is
+    counted with a LIMIT so at most COUNT_CAP rows are scanned. Page numbers
+    past the real end simply come back empty.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return estimated_count(queryset.model, queryset.db)
+        return queryset.order_by()[:COUNT_CAP].count()
@@ -0,0 +1,421 @@
+"""
+"Related products" similarity index over product name and description.
+
+Each product becomes a 64-dimension vector: the TF-IDF weights of its words
+(hashed into HASH_BUCKETS columns, name words counting NAME_WEIGHT times)
+multiplied by a fixed random projection, then L2-normalised, so a dot product
+is the cosine similarity. The TOP_K most similar products of each product are
+found with blocked matrix products, exactly for small catalogs and through
+random-hyperplane LSH buckets for large ones, and stored in the
+RelatedProduct neighbor table by the build_related_products command.
+
+NumPy is only needed to build the index; pages read the stored table.
+"""
+import re
+import time
+import zlib
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .models import Product, RelatedIndexBuild, RelatedProduct
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None  # type: ignore
+
+try:
+    import numpy as np
+except Exception:  # numpy is optional, only building the index needs it
+    np = None  # type: ignore
+
+
+# number of hashed word columns (memory: HASH_BUCKETS * DIMENSIONS * 4 bytes)
+HASH_BUCKETS = 1 << 18
+# size of the projected product vectors
+DIMENSIONS = 64
+# weight of a word in the name relative to one in the description
+NAME_WEIGHT = 2.0
+# neighbors stored per product
+TOP_K = 6
+# neighbors less similar than this are not stored
+MIN_SCORE = 0.2
+# query x catalog pairs scored exactly before switching to LSH
+EXACT_PAIRS = 200_000_000
+# rows per block of a matrix product
+BLOCK_SIZE = 2048
+# LSH hash tables and hyperplanes (bits) per table
+LSH_TABLES = 4
+LSH_BITS = 14
+# rows compared at a time within one LSH bucket (only near-duplicates fill a bucket beyond this)
+LSH_WINDOW = 512
+# products read per query and neighbor rows written per transaction
+BATCH_SIZE = 2000
+# seed of the random projection and hyperplanes, so vectors are comparable between runs
+SEED = 20240601
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or the to with your you this that'.split()
+)
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError('numpy is not installed. Install it with: pip install numpy')
+
+
+class Vectorizer:
+    """Hashed TF-IDF vectors of product texts, projected to DIMENSIONS dense columns"""
+
+    def __init__(self):
+        require_numpy()
+        rng = np.random.default_rng(SEED)
+        self.projection = (rng.standard_normal((HASH_BUCKETS, DIMENSIONS), dtype=np.float32) / np.sqrt(DIMENSIONS))
+        self.document_frequency = np.zeros(HASH_BUCKETS, dtype=np.int64)
+        self.documents = 0
+        self._buckets = {}
+
+    def bucket(self, word):
+        # crc32 instead of hash(): the same word maps to the same column in every process
+        column = self._buckets.get(word)
+        if column is None:
+            column = self._buckets[word] = zlib.crc32(word.encode()) % HASH_BUCKETS
+        return column
+
+    def tokens(self, name, description):
+        """(columns, weights) of the words of one product"""
+        columns, weights = [], []
+        for text, weight in ((name, NAME_WEIGHT), (description, 1.0)):
+            for word in WORD_RE.findall((text or '').lower()):
+                # bare numbers (sizes, counts, "#12" suffixes) say little about what a product is
+                if word not in STOP_WORDS and not word.isdigit():
+                    columns.append(self.bucket(word))
+                    weights.append(weight)
+        return columns, weights
+
+    def _pairs(self, rows):
+        # unique (document, column) pairs of a chunk of (name, description) rows and their summed weights
+        columns, weights, documents = [], [], []
+        for index, (name, description) in enumerate(rows):
+            doc_columns, doc_weights = self.tokens(name, description)
+            columns.extend(doc_columns)
+            weights.extend(doc_weights)
+            documents.extend([index] * len(doc_columns))
+        keys = np.asarray(documents, dtype=np.int64) * HASH_BUCKETS + np.asarray(columns, dtype=np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        term_weights = np.bincount(inverse, weights=np.asarray(weights, dtype=np.float64))
+        return keys // HASH_BUCKETS, keys % HASH_BUCKETS, term_weights
+
+    def count(self, rows):
+        """First pass: add a chunk of (name, description) rows to the document frequencies"""
+        _, columns, _ = self._pairs(rows)
+        self.document_frequency += np.bincount(columns, minlength=HASH_BUCKETS)
+        self.documents += len(rows)
+
+    def transform(self, rows):
+        """Second pass: the normalised vectors of a chunk of rows, shape (len(rows), DIMENSIONS)"""
+        idf = np.log((1 + self.documents) / (1 + self.document_frequency)).astype(np.float32) + 1
+        documents, columns, term_weights = self._pairs(rows)
+        vectors = np.zeros((len(rows), DIMENSIONS), dtype=np.float32)
+        if len(columns):
+            tfidf = (1 + np.log(term_weights)).astype(np.float32) * idf[columns]
+            weighted = self.projection[columns] * tfidf[:, None]
+            # pairs are sorted by document, so every document is one contiguous run
+            present, starts = np.unique(documents, return_index=True)
+            vectors[present] = np.add.reduceat(weighted, starts, axis=0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+def _merge(best_ids, best_scores, ids, scores, k):
+    # keep the k best distinct neighbors per row of two candidate sets
+    ids = np.concatenate([best_ids, ids], axis=1)
+    scores = np.concatenate([best_scores, scores], axis=1)
+    ids = np.where(np.isneginf(scores), -1, ids)
+    order = np.argsort(ids, axis=1, kind='stable')
+    ids = np.take_along_axis(ids, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    # the same neighbor found twice (several LSH tables) counts once
+    duplicate = np.zeros_like(ids, dtype=bool)
+    duplicate[:, 1:] = (ids[:, 1:] == ids[:, :-1]) & (ids[:, 1:] >= 0)
+    scores = np.where(duplicate | (ids < 0), -np.inf, scores)
+    top = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(ids, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+
+def _best(scores, candidate_index, k):
+    # (ids, scores) of the k best columns of every row of a score block; -inf marks excluded pairs.
+    # k argmax passes: for a small k this beats argpartition, which degrades
+    # badly on the many tied scores of duplicate descriptions
+    rows = np.arange(len(scores))
+    top_ids = np.full((len(scores), k), -1, dtype=np.int64)
+    top_scores = np.full((len(scores), k), -np.inf, dtype=np.float32)
+    for rank in range(min(k, scores.shape[1])):
+        best = scores.argmax(axis=1)
+        top_ids[:, rank] = candidate_index[best]
+        top_scores[:, rank] = scores[rows, best]
+        scores[rows, best] = -np.inf
+    return top_ids, top_scores
+
+
+def top_k(vectors, queries, k=TOP_K):
+    """
+    (ids, scores) of the k nearest rows of vectors for every row index in queries.
+
+    ids are row indexes into vectors, -1 where fewer than k neighbors exist.
+    """
+    require_numpy()
+    queries = np.asarray(queries, dtype=np.int64)
+    total = len(vectors)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    if not len(queries) or total < 2:
+        return best_ids, best_scores
+
+    if len(queries) * total <= EXACT_PAIRS:
+        step = BLOCK_SIZE * 8
+        for q_start in range(0, len(queries), BLOCK_SIZE):
+            rows = slice(q_start, q_start + BLOCK_SIZE)
+            query_index = queries[rows]
+            block_ids, block_scores = best_ids[rows], best_scores[rows]
+            for c_start in range(0, total, step):
+                scores = vectors[query_index] @ vectors[c_start:c_start + step].T
+                # a product is not its own neighbor
+                own = np.flatnonzero((query_index >= c_start) & (query_index < c_start + step))
+                scores[own, query_index[own] - c_start] = -np.inf
+                ids, scores = _best(scores, np.arange(c_start, min(c_start + step, total)), k)
+                block_ids, block_scores = _merge(block_ids, block_scores, ids, scores, k)
+            best_ids[rows], best_scores[rows] = block_ids, block_scores
+        return best_ids, best_scores
+
+    # LSH: rows on the same side of LSH_BITS random hyperplanes share a bucket,
+    # only rows sharing a bucket in some table are compared
+    position = np.full(total, -1, dtype=np.int64)
+    position[queries] = np.arange(len(queries))
+    rng = np.random.default_rng(SEED + 1)
+    powers = (1 << np.arange(LSH_BITS)).astype(np.int64)
+    for _ in range(LSH_TABLES):
+        planes = rng.standard_normal((vectors.shape[1], LSH_BITS), dtype=np.float32)
+        signatures = np.zeros(total, dtype=np.int64)
+        for start in range(0, total, BLOCK_SIZE * 32):
+            chunk = vectors[start:start + BLOCK_SIZE * 32] @ planes > 0
+            signatures[start:start + BLOCK_SIZE * 32] = chunk @ powers
+        order = np.argsort(signatures, kind='stable')
+        labels = signatures[order]
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(labels)) + 1, [total]])
+        start = 0
+        while start < total:
+            # consecutive small buckets share one window, pairs across buckets are masked out;
+            # an oversized bucket (near duplicates) is compared LSH_WINDOW rows at a time
+            end = bounds[np.searchsorted(bounds, start + LSH_WINDOW, side='right') - 1]
+            if end <= start:
+                end = min(start + LSH_WINDOW, total)
+            window = order[start:end]
+            asked = np.flatnonzero(position[window] >= 0)
+            if len(asked):
+                window_labels = labels[start:end]
+                scores = vectors[window[asked]] @ vectors[window].T
+                scores[window_labels[asked][:, None] != window_labels[None, :]] = -np.inf
+                scores[np.arange(len(asked)), asked] = -np.inf
+                ids, scores = _best(scores, window, k)
+                rows = position[window[asked]]
+                best_ids[rows], best_scores[rows] = _merge(best_ids[rows], best_scores[rows], ids, scores, k)
+            start = end
+    return best_ids, best_scores
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB (0 where the platform does not report it)"""
+    if resource is None:
+        return 0.0
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if peak > 1 << 32 else 1024)
+
+
+def _chunks(queryset, batch_size):
+    # (pk, name, description) rows of the queryset, batch_size at a time
+    chunk = []
+    for row in queryset.iterator(chunk_size=batch_size):
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def vectorize(batch_size=BATCH_SIZE):
+    """
+    (product ids, vectors) of the whole catalog, ids ascending.
+
+    Two streaming passes over the products table: document frequencies, then
+    vectors. Only the (products x DIMENSIONS) float32 matrix is kept.
+    """
+    vectorizer = Vectorizer()
+    texts = Product.objects.order_by('pk').values_list('pk', 'name', 'description')
+    last_pk = 0
+    for chunk in _chunks(texts, batch_size):
+        vectorizer.count([(name, description) for _, name, description in chunk])
+        last_pk = chunk[-1][0]
+
+    # products added after the first pass wait for the next build
+    ids = np.zeros(vectorizer.documents, dtype=np.int64)
+    vectors = np.zeros((vectorizer.documents, DIMENSIONS), dtype=np.float32)
+    filled = 0
+    for chunk in _chunks(texts.filter(pk__lte=last_pk), batch_size):
+        chunk = chunk[:len(ids) - filled]
+        ids[filled:filled + len(chunk)] = [pk for pk, _, _ in chunk]
+        vectors[filled:filled + len(chunk)] = vectorizer.transform([(name, description) for _, name, description in chunk])
+        filled += len(chunk)
+    # products deleted between the passes leave unused rows at the end
+    return ids[:filled], vectors[:filled]
+
+
+def _positions(ids, pks):
+    # row indexes of the given product ids (ids that are not in the matrix are dropped)
+    pks = np.unique(np.asarray(list(pks), dtype=np.int64))
+    index = np.searchsorted(ids, pks)
+    found = index < len(ids)
+    found[found] = ids[index[found]] == pks[found]
+    return index[found]
+
+
+def _stored(ids, k, batch_size):
+    """
+    What the stored neighbor lists say about the products of ids.
+
+    Returns the score a new neighbor must reach to enter each product's list
+    (MIN_SCORE where fewer than k are stored) and the positions of products
+    that lost a neighbor: deleting a product cascades to the rows that list
+    it and leaves a gap in their ranks.
+    """
+    threshold = np.full(len(ids), MIN_SCORE, dtype=np.float32)
+    gaps = [np.zeros(0, dtype=np.int64)]
+    if not len(ids):
+        return threshold, gaps[0]
+    lists = RelatedProduct.objects.order_by().values_list('product_id').annotate(Count('pk'), Max('rank'), Min('score'))
+    for chunk in _chunks(lists, batch_size):
+        pks, counts, last_ranks, lowest = (np.asarray(column) for column in zip(*chunk))
+        index = np.minimum(np.searchsorted(ids, pks), len(ids) - 1)
+        found = ids[index] == pks
+        full = found & (counts >= k)
+        threshold[index[full]] = lowest[full]
+        gaps.append(index[found & (last_ranks >= counts)])
+    return threshold, np.concatenate(gaps)
+
+
+def _reverse(vectors, changed, threshold):
+    """Positions of the products one of the changed rows scores at least threshold against"""
+    affected = [np.zeros(0, dtype=np.int64)]
+    if not len(changed):
+        return affected[0]
+    step = BLOCK_SIZE * 8
+    for start in range(0, len(vectors), BLOCK_SIZE):
+        block = vectors[start:start + BLOCK_SIZE]
+        best = np.full(len(block), -np.inf, dtype=np.float32)
+        for c_start in range(0, len(changed), step):
+            candidates = changed[c_start:c_start + step]
+            scores = block @ vectors[candidates].T
+            # a product is not its own neighbor
+            own = np.flatnonzero((candidates >= start) & (candidates < start + len(block)))
+            scores[candidates[own] - start, own] = -np.inf
+            best = np.maximum(best, scores.max(axis=1))
+        affected.append(np.flatnonzero(best >= threshold[start:start + len(block)]) + start)
+    return np.concatenate(affected)
+
+
+def _write(ids, positions, neighbor_ids, neighbor_scores, batch_size):
+    # replace the neighbor rows of the products at positions, one transaction per batch
+    table = connection.ops.quote_name(RelatedProduct._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(c) for c in ('product_id', 'rank', 'related_id', 'score'))
+    sql = f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s)"
+    written = 0
+    for start in range(0, len(positions), batch_size):
+        product_ids = ids[positions[start:start + batch_size]]
+        block_ids = neighbor_ids[start:start + batch_size]
+        block_scores = neighbor_scores[start:start + batch_size]
+        # neighbors are sorted by score, so the kept ones are a prefix and the column is the rank
+        row, rank = np.nonzero((block_ids >= 0) & (block_scores >= MIN_SCORE))
+        rows = list(zip(
+            product_ids[row].tolist(), rank.tolist(),
+            ids[block_ids[row, rank]].tolist(), block_scores[row, rank].tolist(),
+        ))
+        product_ids = product_ids.tolist()
+        # prepared rows and one executemany, like seed_products: millions of rows at catalog scale
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        written += len(rows)
+    return written
+
+
+def build(full=False, k=TOP_K, batch_size=BATCH_SIZE, log=None):
+    """
+    Rebuild the RelatedProduct rows and return the RelatedIndexBuild record.
+
+    A full build recomputes the neighbors of every product. Otherwise only
+    products whose updated_at changed since the last finished build are
+    recomputed, together with the products that listed one of them as a
+    neighbor, the products one of them now scores high enough to enter the
+    list of, and the products whose list lost a deleted neighbor. The vectors
+    of the whole catalog are still computed, and every changed product is
+    compared against all of them in both directions.
+
+    log, if given, is called with a message after every phase.
+    """
+    require_numpy()
+    log = log or (lambda message: None)
+    previous = RelatedIndexBuild.last_finished()
+    full = full or previous is None
+    record = RelatedIndexBuild.objects.create(started_at=timezone.now(), full=full)
+    started = time.monotonic()
+    phase = started
+
+    def done(message):
+        nonlocal phase
+        now = time.monotonic()
+        log(f"{message} in {now - phase:.1f}s (peak memory {peak_memory_mb():.0f} MB)")
+        phase = now
+
+    ids, vectors = vectorize(batch_size)
+    done(f"Vectorised {len(ids)} products ({vectors.nbytes / (1024 * 1024):.1f} MB matrix)")
+
+    if full:
+        positions = np.arange(len(ids), dtype=np.int64)
+        neighbor_ids, neighbor_scores = top_k(vectors, positions, k)
+    else:
+        changed = Product.objects.filter(updated_at__gte=previous.started_at).values_list('pk', flat=True)
+        changed = _positions(ids, changed)
+        neighbor_ids, neighbor_scores = top_k(vectors, changed, k)
+        # products whose stored neighbors include a changed product: it may have moved away
+        changed_ids = ids[changed].tolist()
+        listing = set()
+        for start in range(0, len(changed_ids), batch_size):
+            listing.update(RelatedProduct.objects.filter(
+                related_id__in=changed_ids[start:start + batch_size],
+            ).values_list('product_id', flat=True))
+        # products a changed product now beats the weakest stored neighbor of, and lists with a deleted neighbor
+        threshold, gaps = _stored(ids, k, batch_size)
+        others = np.union1d(_positions(ids, listing), np.union1d(_reverse(vectors, changed, threshold), gaps))
+        others = np.setdiff1d(others, changed)
+        other_ids, other_scores = top_k(vectors, others, k)
+        positions = np.concatenate([changed, others])
+        neighbor_ids = np.concatenate([neighbor_ids, other_ids])
+        neighbor_scores = np.concatenate([neighbor_scores, other_scores])
+    done(f"Found the {k} nearest neighbors of {len(positions)} products")
+
+    rows = _write(ids, positions, neighbor_ids, neighbor_scores, batch_size)
+    done(f"Wrote {rows} neighbor rows")
+
+    record.finished_at = timezone.now()
+    record.products_indexed = len(ids)
+    record.products_updated = len(positions)
+    record.seconds = time.monotonic() - started
+    record.peak_memory_mb = peak_memory_mb()
+    record.save()
+    return record
@@ -0,0 +1,201 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+# name of the SQLite FTS5 table mirroring products(name, code, description)
+FTS_TABLE = 'products_fts'
+# name of the MySQL FULLTEXT index over products(name, code, description)
+FULLTEXT_INDEX = 'products_fulltext'
+# upper bound on the number of ranked ids a single search can return
+MAX_RESULTS = 1000
+
+# SQLite trigger indexing every inserted product
+SQLITE_INSERT_TRIGGER = f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON products BEGIN
+    INSERT INTO {FTS_TABLE}(rowid, name, code, description)
+    VALUES (new.id, new.name, new.code, new.description);
+END"""
+
+# SQL used to create the SQLite FTS5 index and the triggers that keep it in sync
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, code, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    SQLITE_INSERT_TRIGGER,
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, code, description)
+        VALUES ('delete', old.id, old.name, old.code, old.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name, code, description ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, code, description)
+        VALUES ('delete', old.id, old.name, old.code, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, code, description)
+        VALUES (new.id, new.name, new.code, new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+MYSQL_INSTALL = [
+    f"ALTER TABLE products ADD FULLTEXT INDEX {FULLTEXT_INDEX} (name, code, description)",
+]
+
+MYSQL_UNINSTALL = [
+    f"ALTER TABLE products DROP INDEX {FULLTEXT_INDEX}",
+]
+
+
+def install_index(schema_editor):
+    """
+    Create the full-text index for the current database vendor.
+
+    SQLite rebuilds a table (and drops its triggers) on some schema changes,
+    so migrations that alter the products table call this again afterwards.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_INSTALL
+    elif vendor == 'mysql':
+        statements = MYSQL_INSTALL
+    else:
+        statements = []
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def uninstall_index(schema_editor):
+    """Drop the full-text index created by install_index"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_UNINSTALL
+    elif vendor == 'mysql':
+        statements = MYSQL_UNINSTALL
+    else:
+        statements = []
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+@contextmanager
+def deferred_insert_index():
+    """
+    Index rows inserted inside the block with one set-based statement.
+
+    On SQLite the per-row insert trigger costs more than the insert itself, so
+    bulk loaders drop it for the duration of the block and index the new rows
+    in a single INSERT ... SELECT afterwards. Must be used inside
+    transaction.atomic() so a failure also restores the trigger.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT coalesce(max(id), 0) FROM products")
+        last_id = cursor.fetchone()[0]
+        cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai")
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, code, description) "
+            "SELECT id, name, code, description FROM products WHERE id > %s",
+            [last_id],
+        )
+        cursor.execute(SQLITE_INSERT_TRIGGER)
+
+
+def tokenize(query):
+    """Split a user query into plain word tokens (drops operators and quotes)"""
+    return re.findall(r'\w+', query or '')[:16]
+
+
+def _fts5_query(tokens):
+    # every token must match, and each one is also matched as a prefix
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _mysql_query(tokens):
+    return ' '.join(f'+{token}*' for token in tokens)
+
+
+def filter_queryset(queryset, query):
+    """Restrict a Product queryset to rows matching the full-text query (unranked)"""
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts5_query(tokens)])
+        )
+    if vendor == 'mysql':
+        return queryset.filter(
+            pk__in=RawSQL(
+                "SELECT id FROM products WHERE MATCH(name, code, description) AGAINST (%s IN BOOLEAN MODE)",
+                [_mysql_query(tokens)],
+            )
+        )
+    # other backends have no index here, fall back to a substring scan
+    condition = Q()
+    for token in tokens:
+        condition &= Q(name__icontains=token) | Q(code__icontains=token) | Q(description__icontains=token)
+    return queryset.filter(condition)
+
+
+def ranked_ids(query, limit=20, offset=0):
+    """Return (ids, total) for the best matching products, best match first"""
+    tokens = tokenize(query)
+    if not tokens:
+        return [], 0
+    limit = max(0, min(limit, MAX_RESULTS - offset))
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            match = _fts5_query(tokens)
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+            total = cursor.fetchone()[0]
+            # bm25 weights: name matches count more than code, code more than description
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 1.0) LIMIT %s OFFSET %s",
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()], min(total, MAX_RESULTS)
+        if vendor == 'mysql':
+            match = _mysql_query(tokens)
+            cursor.execute(
+                "SELECT count(*) FROM products WHERE MATCH(name, code, description) AGAINST (%s IN BOOLEAN MODE)",
+                [match],
+            )
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT id FROM products WHERE MATCH(name, code, description) AGAINST (%s IN BOOLEAN MODE) "
+                "ORDER BY MATCH(name, code, description) AGAINST (%s IN BOOLEAN MODE) DESC LIMIT %s OFFSET %s",
+                [match, match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()], min(total, MAX_RESULTS)
+    queryset = filter_queryset(Product.objects.all(), query).order_by('name')
+    total = min(queryset.count(), MAX_RESULTS)
+    return list(queryset.values_list('pk', flat=True)[offset:offset + limit]), total
+
+
+def search_products(query, limit=20, offset=0):
+    """Return (products, total) for a query, ordered by relevance"""
+    ids, total = ranked_ids(query, limit=limit, offset=offset)
+    products = Product.objects.in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products], total
@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache as catalog_cache
+from .models import STATS_FIELDS, CatalogStats, Product, stats_contribution
+from .tasks import build_image_derivatives, collect_media
+
+
+# invalidate the catalog cache once the change is committed
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, **kwargs):
+    transaction.on_commit(catalog_cache.invalidate)
+
+
+# generate the resized derivatives once per uploaded image, in a worker
+@receiver(post_save, sender=Product)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image or instance.image_digest:
+        return
+    image_name = instance.image.name
+    build_image_derivatives.enqueue_on_commit(
+        instance.pk, image_name, dedup_key=f'derivatives:{instance.pk}:{image_name}',
+    )
+
+
+# the stored stats fields of a product that was not loaded from the database
+@receiver(pre_save, sender=Product)
+def remember_stored_stats(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None or getattr(instance, '_loaded_stats', None) is not None:
+        return
+    row = Product.objects.filter(pk=instance.pk).values_list(*STATS_FIELDS).first()
+    instance._loaded_stats = stats_contribution(*row) if row else None
+
+
+# keep CatalogStats in step with every saved product
+@receiver(post_save, sender=Product)
+def update_catalog_stats(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(STATS_FIELDS):
+        return
+    new = instance.stats_contribution()
+    if new is None:
+        # loaded with some stats fields deferred: read what the save left in the row
+        row = Product.objects.filter(pk=instance.pk).values_list(*STATS_FIELDS).first()
+        new = stats_contribution(*row) if row else None
+    CatalogStats.apply_change(None if created else getattr(instance, '_loaded_stats', None), new)
+    instance._loaded_stats = new
+
+
+# and with every deleted one
+@receiver(post_delete, sender=Product)
+def remove_from_catalog_stats(sender, instance, **kwargs):
+    stored = getattr(instance, '_loaded_stats', None) or instance.stats_contribution()
+    CatalogStats.apply_change(stored, None)
+
+
+# delete a replaced image (and its derivatives) in a worker once the new one is committed
+@receiver(post_save, sender=Product)
+def collect_replaced_image(sender, instance, raw=False, **kwargs):
+    replaced = instance.__dict__.pop('_replaced_image', None)
+    if raw or replaced is None:
+        return
+    collect_media.enqueue_on_commit([replaced])
+
+
+# and the image of a deleted product
+@receiver(post_delete, sender=Product)
+def collect_deleted_image(sender, instance, **kwargs):
+    if 'image' in instance.get_deferred_fields():
+        return
+    digest = instance.__dict__.get('image_digest', '')
+    if instance.image or digest:
+        collect_media.enqueue_on_commit([(instance.image.name or '', digest)])
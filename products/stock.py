@@ -0,0 +1,164 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from marketPlace.db import write_atomic
+
+from . import cache as catalog_cache
+from .models import CatalogStats, Product, stats_contribution
+
+
+# Stock changes as single conditional UPDATE statements.
+#
+# Every operation is one "UPDATE ... WHERE <enough units>" built from F()
+# expressions, so the check and the write happen atomically in the database
+# and concurrent checkouts can never oversell or lose an update. in_stock is
+# recomputed in the same statement and always means "units available", i.e.
+# stock_quantity - reserved_quantity > 0. CatalogStats gets the matching delta
+# in the same transaction.
+#
+# That delta is a write to the single CatalogStats row, so checkouts of
+# different products still queue on it until they commit. SQLite allows one
+# writer at a time anyway, so it costs nothing there; on MySQL it is the price
+# of exact totals without an aggregate, kept small by writing the row after
+# the product row, as the last statement of each operation. A site where that
+# lock shows up under load should drop the delta from _apply() and run
+# `manage.py recompute_stats` periodically instead.
+
+
+class InsufficientStock(Exception):
+    """Raised when a product does not have enough units for the operation"""
+
+    def __init__(self, product_id, quantity):
+        self.product_id = product_id
+        self.quantity = quantity
+        super().__init__(f"Not enough stock for product {product_id} (requested {quantity})")
+
+
+def _in_stock(stock, reserved):
+    # in_stock after the update, from expressions over the row values before it
+    return Case(When(GreaterThan(stock, reserved), then=Value(True)), default=Value(False))
+
+
+def _apply(product_id, quantity, condition, in_stock, stock_delta=0, reserved_delta=0, **counters):
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+    with write_atomic():
+        # the row as it is before the update, locked until commit
+        before = (
+            Product.objects.select_for_update()
+            .filter(pk=product_id)
+            .values_list('in_stock', 'stock_quantity', 'reserved_quantity', 'price')
+            .first()
+        )
+        if before is None:
+            raise Product.DoesNotExist(f"Product {product_id} does not exist")
+        # in_stock is assigned first: MySQL evaluates SET assignments left to right, so an
+        # expression after the counters would see their new values instead of the current ones
+        updated = Product.objects.filter(pk=product_id, **condition).update(
+            in_stock=in_stock, **counters, updated_at=timezone.now(),
+        )
+        if not updated:
+            raise InsufficientStock(product_id, quantity)
+        in_stock, stock, reserved, price = before
+        # the same values the UPDATE wrote: in_stock always ends up as stock > reserved
+        stock_after, reserved_after = stock + stock_delta, reserved + reserved_delta
+        CatalogStats.apply_change(
+            stats_contribution(in_stock, stock, price),
+            stats_contribution(stock_after > reserved_after, stock_after, price),
+        )
+    # queryset.update() sends no signals, drop the cached catalog reads ourselves
+    transaction.on_commit(catalog_cache.invalidate)
+
+
+def reserve(product_id, quantity):
+    """Hold quantity units for an order in progress"""
+    _apply(
+        product_id, quantity,
+        {'stock_quantity__gte': F('reserved_quantity') + quantity},
+        in_stock=_in_stock(F('stock_quantity'), F('reserved_quantity') + quantity),
+        reserved_delta=quantity,
+        reserved_quantity=F('reserved_quantity') + quantity,
+    )
+
+
+def release(product_id, quantity):
+    """Give back units held by reserve() (cancelled or expired order)"""
+    _apply(
+        product_id, quantity,
+        {'reserved_quantity__gte': quantity},
+        # stock > reserved - n  <=>  stock + n > reserved
+        in_stock=_in_stock(F('stock_quantity') + quantity, F('reserved_quantity')),
+        reserved_delta=-quantity,
+        reserved_quantity=F('reserved_quantity') - quantity,
+    )
+
+
+def commit(product_id, quantity):
+    """Turn units held by reserve() into a sale"""
+    _apply(
+        product_id, quantity,
+        {'reserved_quantity__gte': quantity, 'stock_quantity__gte': quantity},
+        # (stock - n) - (reserved - n) > 0  <=>  stock > reserved
+        in_stock=_in_stock(F('stock_quantity'), F('reserved_quantity')),
+        stock_delta=-quantity,
+        reserved_delta=-quantity,
+        stock_quantity=F('stock_quantity') - quantity,
+        reserved_quantity=F('reserved_quantity') - quantity,
+    )
+
+
+def decrement(product_id, quantity):
+    """Sell quantity unreserved units directly"""
+    _apply(
+        product_id, quantity,
+        {'stock_quantity__gte': F('reserved_quantity') + quantity},
+        # stock - n > reserved  <=>  stock > reserved + n
+        in_stock=_in_stock(F('stock_quantity'), F('reserved_quantity') + quantity),
+        stock_delta=-quantity,
+        stock_quantity=F('stock_quantity') - quantity,
+    )
+
+
+def restock(product_id, quantity):
+    """Add quantity units to the stock"""
+    _apply(
+        product_id, quantity,
+        {},
+        in_stock=_in_stock(F('stock_quantity') + quantity, F('reserved_quantity')),
+        stock_delta=quantity,
+        stock_quantity=F('stock_quantity') + quantity,
+    )
+
+
+def _batch(operation, items):
+    # merge repeated products and lock rows in id order so concurrent batches cannot deadlock
+    totals = Counter()
+    for product_id, quantity in items:
+        totals[product_id] += quantity
+    with write_atomic():
+        for product_id in sorted(totals):
+            operation(product_id, totals[product_id])
+
+
+def reserve_many(items):
+    """
+    Reserve every (product_id, quantity) pair of a multi-item order, or none.
+
+    Raises InsufficientStock (and rolls back the earlier reservations) as soon
+    as one product cannot be reserved.
+    """
+    _batch(reserve, items)
+
+
+def release_many(items):
+    """Release every (product_id, quantity) pair reserved by reserve_many()"""
+    _batch(release, items)
+
+
+def commit_many(items):
+    """Commit every (product_id, quantity) pair reserved by reserve_many()"""
+    _batch(commit, items)
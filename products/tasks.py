@@ -0,0 +1,28 @@
+import logging
+
+from taskqueue.queue import task
+
+from . import cache as catalog_cache
+from .images import generate_derivatives
+from .media_gc import collect
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+
+@task(max_attempts=3, retry_delay=30)
+def build_image_derivatives(pk, image_name):
+    """Generate the derivatives of a product image and record their digest and the image width"""
+    digest, width = generate_derivatives(image_name)
+    # only record the digest if the image was not replaced in the meantime
+    if Product.objects.filter(pk=pk, image=image_name).update(image_digest=digest, image_width=width):
+        catalog_cache.invalidate()
+
+
+@task(max_attempts=5, retry_delay=60)
+def collect_media(files):
+    """Delete the given [image name, digest] pairs no product references any more"""
+    deleted = collect(files)
+    if deleted:
+        logger.info('Deleted %d orphaned media files', deleted)
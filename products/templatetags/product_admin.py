@@ -0,0 +1,76 @@
+import hashlib
+from datetime import date, datetime
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+
+from products import cache as catalog_cache
+
+
+register = template.Library()
+
+
+class _CachedDateQueries:
+    """
+    Stands in for cl.queryset in date_hierarchy(): its MIN/MAX aggregate and
+    dates()/datetimes() bucket queries are answered from the catalog cache,
+    which holds them as ISO strings; links and labels are still built per request.
+    """
+
+    def __init__(self, queryset, key):
+        self.queryset = queryset
+        self.key = key
+
+    def aggregate(self, **aggregates):
+        def load():
+            values = self.queryset.aggregate(**aggregates)
+            return {name: value.isoformat() if value else None for name, value in values.items()}
+        cached = catalog_cache.get_or_set(f'{self.key}:range', load)
+        return {name: datetime.fromisoformat(value) if value else None for name, value in cached.items()}
+
+    def datetimes(self, field_name, kind):
+        cached = catalog_cache.get_or_set(
+            f'{self.key}:{kind}', lambda: [value.isoformat() for value in self.queryset.datetimes(field_name, kind)],
+        )
+        return [datetime.fromisoformat(value) for value in cached]
+
+    def dates(self, field_name, kind):
+        cached = catalog_cache.get_or_set(
+            f'{self.key}:{kind}', lambda: [value.isoformat() for value in self.queryset.dates(field_name, kind)],
+        )
+        return [date.fromisoformat(value) for value in cached]
+
+
+class _CachedDateChangeList:
+    # the changelist as date_hierarchy() sees it, with the cached date queries
+    def __init__(self, cl, key):
+        self._cl = cl
+        self.queryset = _CachedDateQueries(cl.queryset, key)
+
+    def __getattr__(self, name):
+        return getattr(self._cl, name)
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def cached_date_hierarchy(cl):
+    """
+    The admin date hierarchy, with its date buckets cached per changelist URL.
+
+    Building the buckets runs a MIN/MAX and a DISTINCT dates scan over the
+    filtered table; the cached dates are versioned by the catalog generation,
+    so any product change rebuilds them.
+    Usage: {% cached_date_hierarchy cl %}
+    """
+    if not cl.model_admin.is_large_table():
+        return date_hierarchy(cl)
+    query = hashlib.md5(cl.get_query_string().encode()).hexdigest()
+    return date_hierarchy(_CachedDateChangeList(cl, f'admin:date_hierarchy:{query}'))
+
+
+@register.simple_tag
+def catalog_stats():
+    """
+    The incrementally maintained catalog totals, for the admin index.
+    Usage: {% catalog_stats as stats %}
+    """
+    return catalog_cache.catalog_stats()
@@ -0,0 +1,37 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from products.images import WIDTHS, derivative_name, srcsets
+
+
+register = template.Library()
+
+# default sizes hint for the product card grid
+CARD_SIZES = '(max-width: 600px) 100vw, 320px'
+
+
+@register.simple_tag
+def product_picture(product, sizes=CARD_SIZES, style=''):
+    """
+    Render a product image as a <picture> with WebP and JPEG srcsets.
+
+    Falls back to the original upload while the derivatives are not built yet.
+    Usage: {% product_picture product sizes="(max-width: 600px) 100vw, 320px" %}
+    """
+    if not product.image:
+        return ''
+    if not product.image_digest:
+        return format_html(
+            '<img src="{}" alt="{}" loading="lazy" style="{}">',
+            product.image.url, product.name, style,
+        )
+    sets = srcsets(product.image_digest, product.image_width)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async" style="{}">'
+        '</picture>',
+        sets['image/webp'], sizes,
+        default_storage.url(derivative_name(product.image_digest, WIDTHS[0], 'jpg')), sets['image/jpeg'], sizes, product.name, style,
+    )
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext, override_script_prefix
+from django.urls import resolve, reverse
+
+from marketPlace import static_assets
+from marketPlace.instrumentation import QueryBudgetExceeded
+from taskqueue.models import Task
+
+from . import cache as catalog_cache
+from . import images, related, search, stock, tasks
+from .admin import ProductAdmin
+from .facets import PRICE_BUCKETS, CatalogFilter, facet_counts
+from .forms import ProductFilterForm
+from .management.commands import seed_product_images
+from .media_gc import collect
+from .models import CatalogStats, Product, RelatedProduct
+from .pagination import KeysetPaginator
+from .templatetags.product_images import product_picture
+from .uploads import Image, ImageUploadHandler, RejectedUpload
+
+
+def staff_user(*permissions, username='staff'):
+    """A signed-in user with the given products permissions"""
+    user = User.objects.create_user(username, password='x')
+    user.user_permissions.set(Permission.objects.filter(content_type__app_label='products', codename__in=permissions))
+    return user
+
+
+def stored_and_recounted_stats():
+    """The CatalogStats totals as stored, then as rebuilt by recompute()"""
+    fields = ('product_count', 'in_stock_count', 'total_units', 'inventory_value')
+    stored = CatalogStats.objects.values_list(*fields).get()
+    recounted = CatalogStats.recompute()
+    return stored, tuple(getattr(recounted, field) for field in fields)
+
+
+class StockTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+
+    def assertStock(self, stock_quantity, reserved_quantity, in_stock):
+        self.product.refresh_from_db()
+        self.assertEqual(
+            (self.product.stock_quantity, self.product.reserved_quantity, self.product.in_stock),
+            (stock_quantity, reserved_quantity, in_stock),
+        )
+
+    def test_reserve_commit_release(self):
+        stock.reserve(self.product.pk, 3)
+        self.assertStock(5, 3, True)
+        stock.commit(self.product.pk, 2)
+        self.assertStock(3, 1, True)
+        stock.release(self.product.pk, 1)
+        self.assertStock(3, 0, True)
+
+    def test_oversell_is_refused(self):
+        stock.reserve(self.product.pk, 4)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve(self.product.pk, 2)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.decrement(self.product.pk, 2)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.release(self.product.pk, 5)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.commit(self.product.pk, 5)
+        self.assertStock(5, 4, True)
+
+    def test_many_checkouts_never_oversell(self):
+        sold = 0
+        for _ in range(200):
+            try:
+                stock.reserve(self.product.pk, 1)
+            except stock.InsufficientStock:
+                continue
+            stock.commit(self.product.pk, 1)
+            sold += 1
+        self.assertEqual(sold, 5)
+        self.assertStock(0, 0, False)
+
+    def test_reserve_many_is_all_or_nothing(self):
+        other = Product.objects.create(name='Laptop Stand', price='20.00', stock_quantity=1)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve_many([(self.product.pk, 2), (other.pk, 2)])
+        self.assertStock(5, 0, True)
+
+    def test_in_stock_transitions(self):
+        stock.reserve(self.product.pk, 5)
+        self.assertStock(5, 5, False)
+        stock.release(self.product.pk, 1)
+        self.assertStock(5, 4, True)
+        stock.decrement(self.product.pk, 1)
+        self.assertStock(4, 4, False)
+        stock.restock(self.product.pk, 2)
+        self.assertStock(6, 4, True)
+        stock.commit(self.product.pk, 4)
+        self.assertStock(2, 0, True)
+        stock.decrement(self.product.pk, 2)
+        self.assertStock(0, 0, False)
+
+    def test_in_stock_is_assigned_before_the_counters(self):
+        # MySQL evaluates SET assignments left to right
+        with CaptureQueriesContext(connection) as queries:
+            stock.reserve(self.product.pk, 1)
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE "products"'))
+        assignments = update.split(' SET ', 1)[1]
+        self.assertLess(assignments.index('"in_stock"'), assignments.index('"reserved_quantity" ='))
+
+    def test_catalog_stats_follow(self):
+        stock.reserve(self.product.pk, 5)
+        stock.commit(self.product.pk, 5)
+        stats = CatalogStats.objects.get()
+        self.assertEqual((stats.in_stock_count, stats.total_units), (0, 0))
+
+    def test_missing_product(self):
+        with self.assertRaises(Product.DoesNotExist):
+            stock.reserve(self.product.pk + 1, 1)
+
+    def test_update_cannot_drop_stock_below_reservations(self):
+        stock.reserve(self.product.pk, 3)
+        self.client.force_login(staff_user('change_product'))
+        response = self.client.post(reverse('products:product_update', args=[self.product.pk]), {
+            'name': 'Gaming Mouse', 'price': '10.00', 'description': '', 'in_stock': 'on', 'stock_quantity': 2,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stock_quantity', response.context['form'].errors)
+        self.assertStock(5, 3, True)
+
+
+class ConcurrentStockTests(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        product = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+        other = Product.objects.create(name='Ring Light', price='20.00', stock_quantity=50)
+        barrier = threading.Barrier(8)
+
+        def checkout(_):
+            sold = 0
+            barrier.wait()
+            try:
+                for _ in range(10):
+                    try:
+                        stock.reserve_many([(product.pk, 1), (other.pk, 1)])
+                    except stock.InsufficientStock:
+                        continue
+                    stock.commit_many([(product.pk, 1), (other.pk, 1)])
+                    sold += 1
+            finally:
+                connections.close_all()
+            return sold
+
+        with ThreadPoolExecutor(8) as pool:
+            sold = sum(pool.map(checkout, range(8)))
+        self.assertEqual(sold, 5)
+        product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((product.stock_quantity, product.reserved_quantity, product.in_stock), (0, 0, False))
+        self.assertEqual((other.stock_quantity, other.reserved_quantity, other.in_stock), (45, 0, True))
+        # the deltas written under the row locks add up to a full recount
+        self.assertEqual(*stored_and_recounted_stats())
+
+
+class CatalogStatsTests(TestCase):
+    def assertStatsMatch(self):
+        self.assertEqual(*stored_and_recounted_stats())
+
+    def test_every_write_path_keeps_the_totals(self):
+        mouse = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+        keyboard = Product.objects.create(name='Gaming Keyboard', price='40.50', stock_quantity=2, code='KB-1')
+        Product.objects.create(name='Ring Light', price='20.00', stock_quantity=0, in_stock=False)
+        self.assertStatsMatch()
+
+        mouse.price, mouse.stock_quantity = '12.00', 7
+        mouse.save()
+        keyboard.stock_quantity = 0
+        keyboard.in_stock = False
+        keyboard.save(update_fields=['stock_quantity', 'in_stock'])
+        # an instance loaded without the stats fields
+        partial = Product.objects.only('id', 'name').get(pk=mouse.pk)
+        partial.price, partial.stock_quantity = Decimal('15.00'), 1
+        partial.save()
+        self.assertStatsMatch()
+
+        stock.reserve(mouse.pk, 1)
+        stock.commit(mouse.pk, 1)
+        stock.restock(keyboard.pk, 3)
+        stock.decrement(keyboard.pk, 1)
+        self.assertStatsMatch()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.csv')
+            with open(path, 'w') as fh:
+                fh.write('code,name,price,stock_quantity\nKB-1,Gaming Keyboard,45.00,9\nNEW-1,Studio Microphone,150.00,4\n')
+            call_command('import_products', path, stdout=StringIO())
+        self.assertStatsMatch()
+
+        call_command('seed_products', '--count', '25', stdout=StringIO())
+        self.assertStatsMatch()
+
+        Product.objects.get(code='NEW-1').delete()
+        Product.objects.filter(price__lt=30).delete()
+        self.assertStatsMatch()
+
+        call_command('seed_products', '--flush', '--count', '3', stdout=StringIO())
+        self.assertStatsMatch()
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        caches['fragments'].clear()
+        self.product = Product.objects.create(name='Gaming Mouse', price='10.00')
+
+    def test_links_follow_permissions(self):
+        update_url = reverse('products:product_update', args=[self.product.pk])
+        delete_url = reverse('products:product_delete', args=[self.product.pk])
+        self.client.force_login(staff_user())
+        response = self.client.get(reverse('products:products_index'))
+        self.assertNotContains(response, update_url)
+        self.assertNotContains(response, delete_url)
+        self.assertEqual(self.client.get(update_url).status_code, 403)
+        self.assertEqual(self.client.get(delete_url).status_code, 403)
+
+        self.client.force_login(staff_user('change_product', username='editor'))
+        response = self.client.get(reverse('products:products_index'))
+        self.assertContains(response, update_url)
+        self.assertNotContains(response, delete_url)
+        self.assertEqual(self.client.get(update_url).status_code, 200)
+
+    def test_cards_are_cached_per_product_version(self):
+        url = reverse('products:products_index')
+        self.client.force_login(staff_user())
+        self.assertContains(self.client.get(url), 'Gaming Mouse')
+        # a write that keeps updated_at is not seen, the card comes from the cache
+        Product.objects.filter(pk=self.product.pk).update(name='Wireless Mouse')
+        self.assertContains(self.client.get(url), 'Gaming Mouse')
+        # a save moves updated_at and so the key
+        self.product.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertContains(self.client.get(url), 'Wireless Mouse')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, PAGE_CACHE_TIMEOUT=0)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        # cold catalog cache: every read reaches the database
+        cache.clear()
+        self.product = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+        Product.objects.create(name='Gaming Keyboard', price='40.00', stock_quantity=2)
+        self.urls = [
+            reverse('home'),
+            reverse('products:home'),
+            reverse('products:product_list'),
+            reverse('products:product_list') + '?in_stock=1&min_price=5',
+            reverse('products:product_detail', args=[self.product.pk]),
+            reverse('products:product_search') + '?q=gaming',
+            reverse('api:product_list'),
+        ]
+
+    def test_anonymous_requests_stay_within_budget(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_signed_in_requests_stay_within_budget(self):
+        self.client.force_login(User.objects.create_user('staff', password='x'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_product_detail_queries(self):
+        # the product and its related products, then nothing once cached
+        url = reverse('products:product_detail', args=[self.product.pk])
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    @override_settings(QUERY_BUDGETS={'products:product_list': 0})
+    def test_strict_mode_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('products:product_list'))
+
+class ApiFilterTests(TestCase):
+    def test_bad_filters_are_400(self):
+        url = reverse('api:product_list')
+        for params in (
+            {'min_price': 'NaN'}, {'min_price': 'sNaN'}, {'max_price': 'Infinity'}, {'max_price': '-inf'},
+            {'min_price': 'abc'}, {'in_stock': 'maybe'}, {'fields': 'name,secret'}, {'limit': 'ten'},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_bad_limit_message(self):
+        # the message names the parameter, never the int() error text
+        for limit in ('ten', '1e3', ''):
+            with self.subTest(limit=limit):
+                response = self.client.get(reverse('api:product_list'), {'limit': limit})
+                self.assertEqual(response.json(), {'error': 'limit must be an integer'})
+
+    def test_price_range(self):
+        Product.objects.create(name='Cheap Cable', price='5.00')
+        Product.objects.create(name='Studio Microphone', price='150.00')
+        response = self.client.get(reverse('api:product_list'), {'min_price': '10', 'fields': 'name'})
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Studio Microphone'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.mouse = Product.objects.create(name='Gaming Mouse', price='10.00', description='wireless')
+        self.pad = Product.objects.create(name='Mouse Pad', price='5.00', description='for any gaming mouse')
+        Product.objects.create(name='Ring Light', price='20.00')
+
+    def matching(self, query):
+        return sorted(search.filter_queryset(Product.objects.all(), query).values_list('pk', flat=True))
+
+    def test_ranked_ids(self):
+        ids, total = search.ranked_ids('gaming')
+        # the name match ranks above the description match
+        self.assertEqual((ids, total), ([self.mouse.pk, self.pad.pk], 2))
+        self.assertEqual(search.ranked_ids('gaming', limit=1, offset=1), ([self.pad.pk], 2))
+        self.assertEqual(search.ranked_ids('  '), ([], 0))
+
+    def test_filter_queryset(self):
+        self.assertEqual(self.matching('mouse'), [self.mouse.pk, self.pad.pk])
+        self.assertEqual(self.matching('gam wire'), [self.mouse.pk])
+        self.assertEqual(self.matching('"*'), [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 triggers are SQLite only')
+    def test_index_follows_writes(self):
+        self.mouse.name = 'Trackball'
+        self.mouse.save()
+        self.assertEqual(self.matching('trackball'), [self.mouse.pk])
+        self.assertEqual(self.matching('mouse'), [self.pad.pk])
+        Product.objects.filter(pk=self.pad.pk).update(description='')
+        self.assertEqual(self.matching('gaming'), [])
+        self.pad.delete()
+        self.assertEqual(self.matching('pad'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('integrity-check')")
+
+    def test_page_is_clamped(self):
+        url = reverse('products:product_search')
+        for page in ('abc', '0', '-3', '9' * 40):
+            with self.subTest(page=page):
+                response = self.client.get(url, {'q': 'mouse', 'page': page})
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, {'q': 'mouse', 'page': '9' * 40}).context['page'], 84)
+
+    def test_admin_search_box(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        response = self.client.get(reverse('admin:products_product_changelist'), {'q': 'gaming'})
+        self.assertEqual(sorted(product.pk for product in response.context['cl'].result_list), [self.mouse.pk, self.pad.pk])
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        # three groups of ten products sharing a created_at, so pages split inside a group
+        for group in range(3):
+            for index in range(10):
+                product = Product.objects.create(name=f'Product {group}-{index}', price='10.00')
+                Product.objects.filter(pk=product.pk).update(created_at=f'2025-0{group + 1}-01T00:00:00Z')
+        self.ordered = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(Product.objects.all(), per_page=7)
+
+    def ids(self, page):
+        return [product.pk for product in page]
+
+    def test_walk_forward_and_back(self):
+        pages = [self.paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.get_page(after=pages[-1].next_cursor))
+        self.assertEqual([self.ids(page) for page in pages], [self.ordered[i:i + 7] for i in range(0, 30, 7)])
+        self.assertFalse(pages[0].has_previous())
+        for index in range(len(pages) - 1, 0, -1):
+            with self.subTest(page=index):
+                previous = self.paginator.get_page(before=pages[index].previous_cursor)
+                self.assertEqual(self.ids(previous), self.ids(pages[index - 1]))
+                self.assertEqual(previous.has_previous(), index > 1)
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        tampered = base64.urlsafe_b64encode(b'["yesterday",1]').decode()
+        for token in ('garbage', '!!', tampered, base64.urlsafe_b64encode(b'{}').decode()):
+            with self.subTest(token=token):
+                for params in ({'after': token}, {'before': token}):
+                    page = self.paginator.get_page(**params)
+                    self.assertEqual(self.ids(page), self.ordered[:7])
+                    self.assertFalse(page.has_previous())
+
+    def test_short_before_page_loads_the_first_page(self):
+        second = self.paginator.get_page(after=self.paginator.get_page().next_cursor)
+        # most of the first page is deleted meanwhile: only 2 rows are newer than the cursor
+        Product.objects.filter(pk__in=self.ordered[:5]).delete()
+        page = self.paginator.get_page(before=second.previous_cursor)
+        self.assertEqual(self.ids(page), self.ordered[5:12])
+        self.assertFalse(page.has_previous())
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, price, in_stock in (
+            ('Cheap Cable', '5.00', True), ('Gaming Mouse', '30.00', True), ('Gaming Keyboard', '60.00', False),
+            ('Studio Microphone', '150.00', True), ('Laptop', '900.00', False),
+        ):
+            Product.objects.create(name=name, price=price, in_stock=in_stock, stock_quantity=int(in_stock))
+
+    def test_counts_in_one_query(self):
+        catalog_filter = CatalogFilter({'in_stock': '1', 'min_price': '20'})
+        with self.assertNumQueries(1):
+            counts = facet_counts(catalog_filter)
+        # each facet is counted under the other filters only
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual((counts['stock_in'], counts['stock_out']), (2, 2))
+        self.assertEqual([counts[f'price_{index}'] for index in range(len(PRICE_BUCKETS))], [1, 1, 0, 1, 0])
+        facets = catalog_filter.facets(counts)
+        self.assertEqual([entry['selected'] for entry in facets['stock']], [True, False])
+
+    def test_cached_until_the_generation_moves(self):
+        catalog_filter = CatalogFilter({})
+        self.assertEqual(facet_counts(catalog_filter)['total'], 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(facet_counts(catalog_filter)['total'], 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Ring Light', price='20.00')
+        with self.assertNumQueries(1):
+            counts = facet_counts(catalog_filter)
+        self.assertEqual((counts['total'], counts['price_0']), (6, 2))
+
+    def test_filter_form_ranges(self):
+        for params, values in (
+            ({'min_price': '10', 'max_price': '50'}, {'min_price': Decimal('10'), 'max_price': Decimal('50')}),
+            ({'min_price': '50', 'max_price': '50'}, {'min_price': Decimal('50'), 'max_price': Decimal('50')}),
+            # an inverted range keeps its lower bound, a bad value is dropped
+            ({'min_price': '50', 'max_price': '10'}, {'min_price': Decimal('50')}),
+            ({'min_price': '-1', 'max_price': 'abc'}, {}),
+            ({'created_from': '2025-03-01', 'created_to': '2025-02-01'}, {'created_from': datetime.date(2025, 3, 1)}),
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(CatalogFilter(params).values, values)
+        form = ProductFilterForm({'min_price': '50', 'max_price': '10'})
+        self.assertEqual(form.errors, {'max_price': ['Max price cannot be below the min price.']})
+
+
+class ImportProductsTests(TestCase):
+    def import_csv(self, text):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.csv')
+            with open(path, 'w') as fh:
+                fh.write(text)
+            call_command('import_products', path, stdout=StringIO())
+            rejects = os.path.join(directory, 'feed.csv.rejects.jsonl')
+            return open(rejects).read() if os.path.exists(rejects) else ''
+
+    def test_upsert_by_code(self):
+        Product.objects.create(name='Old Name', price='1.00', code='A-1')
+        rejects = self.import_csv(
+            'code,name,price,stock_quantity\n'
+            'A-1,Smart Watch,99.00,4\n'
+            'B-2,Ring Light,25.00,0\n'
+            'C-3,X,-1,2\n'
+        )
+        self.assertEqual(Product.objects.get(code='A-1').name, 'Smart Watch')
+        self.assertFalse(Product.objects.get(code='B-2').in_stock)
+        self.assertFalse(Product.objects.filter(code='C-3').exists())
+        # every rejected row keeps its own errors (a fresh form per row)
+        self.assertIn('"line": 4', rejects)
+        self.assertIn('name', rejects)
+        self.assertEqual(CatalogStats.objects.get().product_count, 2)
+
+    def test_stock_below_reserved_is_rejected(self):
+        held = Product.objects.create(name='Gaming Mouse', price='10.00', code='A-1', stock_quantity=5)
+        partly = Product.objects.create(name='Ring Light', price='20.00', code='B-2', stock_quantity=5)
+        stock.reserve(held.pk, 3)
+        stock.reserve(partly.pk, 2)
+        rejects = self.import_csv(
+            'code,name,price,stock_quantity\n'
+            'A-1,Gaming Mouse,12.00,2\n'
+            'B-2,Ring Light,25.00,2\n'
+        )
+        self.assertIn('"line": 2', rejects)
+        self.assertIn('reserved by open orders', rejects)
+        self.assertNotIn('"line": 3', rejects)
+        held.refresh_from_db()
+        partly.refresh_from_db()
+        self.assertEqual((held.stock_quantity, held.reserved_quantity, held.price), (5, 3, Decimal('10.00')))
+        # every unit left is reserved
+        self.assertEqual((partly.stock_quantity, partly.reserved_quantity, partly.in_stock), (2, 2, False))
+        self.assertEqual(*stored_and_recounted_stats())
+
+
+class CatalogCacheTests(TestCase):
+    def test_invalidate_moves_past_cached_reads(self):
+        product = Product.objects.create(name='Gaming Mouse', price='10.00')
+        self.assertEqual(catalog_cache.product(product.pk).name, 'Gaming Mouse')
+        Product.objects.filter(pk=product.pk).update(name='Wireless Mouse')
+        catalog_cache.invalidate()
+        self.assertEqual(catalog_cache.product(product.pk).name, 'Wireless Mouse')
+
+    def test_hit_counters_are_opt_in(self):
+        catalog_cache.reset_stats()
+        catalog_cache.get_or_set('answer', lambda: 42)
+        self.assertEqual(catalog_cache.get_or_set('answer', lambda: 0), 42)
+        self.assertEqual((catalog_cache.stats()['hits'], catalog_cache.stats()['misses']), (0, 0))
+        with override_settings(CATALOG_CACHE_STATS=True):
+            catalog_cache.get_or_set('answer', lambda: 0)
+            self.assertEqual(catalog_cache.stats()['hits'], 1)
+
+    def test_lost_counter_never_reuses_a_generation(self):
+        before = catalog_cache.generation()
+        cache.delete(catalog_cache.GENERATION_KEY)
+        self.assertGreater(catalog_cache.generation(), before)
+
+
+@override_settings(ROOT_URLCONF='marketPlace.urls_async')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+
+    def test_head_is_allowed(self):
+        for url in ('/', '/list/', f'/{self.product.pk}/', '/api/products/', f'/api/products/{self.product.pk}/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.head(url).status_code, 200)
+                self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_routes_keep_the_sync_names(self):
+        for url, view_name in (
+            ('/', 'home'), ('/list/', 'products:product_list'), (f'/{self.product.pk}/', 'products:product_detail'),
+            ('/api/products/', 'api:product_list'), (f'/{self.product.pk}/edit/', 'products:product_update'),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(resolve(url).view_name, view_name)
+
+    def test_bad_limit_message(self):
+        self.assertEqual(self.client.get('/api/products/', {'limit': 'ten'}).json(), {'error': 'limit must be an integer'})
+
+    @override_settings(QUERY_BUDGET_STRICT=True, PAGE_CACHE_TIMEOUT=0)
+    def test_budgets_apply(self):
+        self.client.force_login(User.objects.create_user('staff', password='x'))
+        for url in ('/', '/list/', f'/{self.product.pk}/', '/api/products/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        with override_settings(QUERY_BUDGETS={'home': -3}), self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/')
+
+
+class StaticFilesMiddlewareTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        css = b'body { color: #333; }\n' * 40
+        for name in ('styles.3b1f0e9c7a2d.css', 'plain.css'):
+            (root / name).write_bytes(css)
+            static_assets.compress_file(root / name)
+        # the middleware only checks that a variant exists, brotli itself is optional
+        (root / 'styles.3b1f0e9c7a2d.css.br').write_bytes(b'brotli bytes')
+        self.gzip_size = (root / 'plain.css.gz').stat().st_size
+        with override_settings(DEBUG=False, STATIC_ROOT=root), \
+                mock.patch.object(staticfiles_storage, 'hashed_files', {'styles.css': 'styles.3b1f0e9c7a2d.css'}):
+            self.middleware = static_assets.StaticFilesMiddleware(lambda request: HttpResponse('app'))
+
+    def get(self, path, accept_encoding='', method='get', headers=None):
+        request = getattr(RequestFactory(), method)(path, headers={'Accept-Encoding': accept_encoding, **(headers or {})})
+        return self.middleware(request)
+
+    def test_variant_selection(self):
+        for accept_encoding, encoding in (
+            ('gzip, deflate, br', 'br'), ('gzip', 'gzip'), ('br;q=0, gzip', 'gzip'), ('br;q=0.5, gzip', 'gzip'),
+            ('*', 'br'), ('*;q=0', None), ('gzip;q=0', None), ('identity', None), ('', None),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get('/static/styles.3b1f0e9c7a2d.css', accept_encoding)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_cache_control(self):
+        response = self.get('/static/styles.3b1f0e9c7a2d.css')
+        self.assertEqual(response['Cache-Control'], static_assets.IMMUTABLE_CACHE_CONTROL)
+        response = self.get('/static/plain.css')
+        self.assertEqual(response['Cache-Control'], static_assets.REVALIDATE_CACHE_CONTROL)
+        self.assertEqual(self.get('/static/plain.css', headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+    def test_head(self):
+        response = self.get('/static/plain.css', 'gzip', method='head')
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual((response['Content-Encoding'], response['Content-Length']), ('gzip', str(self.gzip_size)))
+
+    def test_missing_manifest_entry_is_logged_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = static_assets.CompressedManifestStaticFilesStorage(location=directory)
+            storage.hashed_files = {'styles.css': 'styles.3b1f0e9c7a2d.css'}
+            with self.assertLogs('marketPlace.static_assets', 'WARNING') as logs:
+                self.assertEqual(storage.stored_name('new.css'), 'new.css')
+                self.assertEqual(storage.stored_name('new.css'), 'new.css')
+            self.assertEqual(len(logs.output), 1)
+
+    def test_other_requests_pass_through(self):
+        self.assertEqual(self.get('/static/missing.css').content, b'app')
+        self.assertEqual(self.get('/static/plain.css', method='post').content, b'app')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['pages'].clear()
+        Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/?utm_source=mail')['X-Page-Cache'], 'HIT')
+        self.assertFalse(self.client.get('/?page=x').has_header('X-Page-Cache'))
+
+    def test_if_none_match(self):
+        etag = self.client.get('/')['ETag']
+        for header in (etag, f'"other", {etag}', f'W/{etag}', '*'):
+            with self.subTest(header=header):
+                response = self.client.get('/', HTTP_IF_NONE_MATCH=header)
+                self.assertEqual((response.status_code, response['X-Page-Cache']), (304, 'HIT'))
+                self.assertEqual(response['ETag'], etag)
+        response = self.client.get('/', HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual((response.status_code, response['X-Page-Cache']), (200, 'HIT'))
+
+    @override_script_prefix('/shop/')
+    def test_script_prefix(self):
+        # reverse() and request.path both carry the prefix
+        self.assertEqual(self.client.get('/', SCRIPT_NAME='/shop')['X-Page-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/', SCRIPT_NAME='/shop')['X-Page-Cache'], 'HIT')
+
+    def test_product_change_purges(self):
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Gaming Keyboard', price='40.00', stock_quantity=2)
+        response = self.client.get('/')
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'Gaming Keyboard')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5)
+        self.urls = [reverse('products:product_list'), reverse('products:product_detail', args=[self.product.pk])]
+
+    def test_not_modified_until_the_product_changes(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.product.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_signed_in_pages_are_always_rendered(self):
+        anonymous_etag = self.client.get(self.urls[1])['ETag']
+        self.client.force_login(staff_user('delete_product'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                for headers in ({'If-None-Match': anonymous_etag}, {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}):
+                    response = self.client.get(url, headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(response.has_header('ETag') or response.has_header('Last-Modified'))
+        # the flash message survives a revalidating browser
+        other = Product.objects.create(name='Ring Light', price='20.00')
+        response = self.client.post(reverse('products:product_delete', args=[other.pk]), HTTP_IF_NONE_MATCH='*', follow=True)
+        self.assertContains(response, 'Product deleted successfully')
+
+
+class SeedProductsTests(TestCase):
+    def test_flush_deletes_in_bulk(self):
+        first = Product.objects.create(name='Gaming Mouse', price='10.00', stock_quantity=5, image='products/mouse.jpg')
+        second = Product.objects.create(name='Gaming Keyboard', price='40.00', stock_quantity=2)
+        RelatedProduct.objects.create(product=first, related=second, score=0.5, rank=1)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with CaptureQueriesContext(connection) as queries:
+                call_command('seed_products', '--flush', '--count', '0', stdout=StringIO())
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertFalse(Product.objects.exists())
+        self.assertEqual(CatalogStats.objects.get().product_count, 0)
+        # one media cleanup task for every deleted image, one cache invalidation
+        self.assertEqual(len(callbacks), 2)
+
+
+def png_header(width, height):
+    return b'\x89PNG\r\n\x1a\n\x00\x00\x00\x0dIHDR' + struct.pack('>II', width, height) + b'\x08\x02\x00\x00\x00'
+
+
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', password='x'))
+
+    def post_image(self, content, name='photo.png'):
+        response = self.client.post(reverse('products:product_create'), {
+            'name': 'Ring Light', 'price': '25.00', 'description': '', 'stock_quantity': 1,
+            'image': SimpleUploadedFile(name, content),
+        })
+        self.assertFalse(Product.objects.exists())
+        return response.context['form'].errors.get('image', [''])[0]
+
+    def test_rejections(self):
+        jpeg_bomb = b'\xff\xd8\xff\xc0\x00\x11\x08' + struct.pack('>HH', 20000, 20000) + b'\x03' + b'\x00' * 64
+        for content, error in (
+            (b'GIF89a' + struct.pack('<HH', 6000, 6000) + b'\x00' * 64, 'too large (6000x6000 pixels)'),
+            (jpeg_bomb, 'too large (20000x20000 pixels)'),
+            (png_header(0, 0) + b'\x00' * 64, 'no pixels (0x0)'),
+            (png_header(10, 0) + b'\x00' * 64, 'no pixels (10x0)'),
+            (b'%PDF-1.7 not an image at all', 'valid image file'),
+            (b'\x89PNG\r\n\x1a\n\x00\x00', 'valid image file'),
+            (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'valid image file'),
+        ):
+            with self.subTest(error=error):
+                self.assertIn(error, self.post_image(content))
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_oversize(self):
+        self.assertIn('less than', self.post_image(png_header(10, 10) + b'\x00' * 4096))
+
+    def test_rejected_bytes_are_dropped(self):
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'bomb.png', 'image/png', None)
+        self.assertIsNone(handler.receive_data_chunk(png_header(100000, 100000), 0))
+        self.assertIsNone(handler.receive_data_chunk(b'\x00' * 1024, 25))
+        upload = handler.file_complete(1049)
+        self.assertIsInstance(upload, RejectedUpload)
+        self.assertEqual(upload.size, 0)
+
+    @skipUnless(Image is not None, 'Pillow is not installed')
+    def test_valid_image_is_stored(self):
+        output = BytesIO()
+        Image.new('RGB', (4, 3), 'red').save(output, format='PNG')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse('products:product_create'), {
+                'name': 'Ring Light', 'price': '25.00', 'description': '', 'stock_quantity': 1,
+                'image': SimpleUploadedFile('light.png', output.getvalue()),
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(Product.objects.get().image.height, 3)
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_image(self, width, height, name='products/photo.png'):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, format='PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def stored_widths(self, digest):
+        widths = {}
+        for name in images.derivative_names(digest):
+            if default_storage.exists(name):
+                with default_storage.open(name) as fh, Image.open(fh) as derivative:
+                    widths[name.rsplit('/', 1)[1]] = derivative.width
+        return widths
+
+    def test_never_upscaled(self):
+        digest, width = images.generate_derivatives(self.stored_image(500, 250))
+        self.assertEqual(width, 500)
+        # no 960 file: the 640 one already holds the image at its own width
+        self.assertEqual(self.stored_widths(digest), {
+            f'{digest}-320w.webp': 320, f'{digest}-320w.jpg': 320, f'{digest}-640w.webp': 500, f'{digest}-640w.jpg': 500,
+        })
+        self.assertEqual(images.generate_derivatives(self.stored_image(500, 250, 'products/copy.png')), (digest, 500))
+        self.assertEqual(images.derivative_widths(200), [320])
+        self.assertEqual(images.derivative_widths(640), [320, 640])
+        self.assertEqual(images.derivative_widths(5000), [320, 640, 960])
+
+    def test_task_records_digest_and_width(self):
+        product = Product.objects.create(name='Ring Light', price='25.00', image=self.stored_image(1200, 600))
+        tasks.build_image_derivatives(product.pk, product.image.name)
+        product.refresh_from_db()
+        self.assertEqual((len(product.image_digest), product.image_width), (16, 1200))
+        self.assertEqual(len(self.stored_widths(product.image_digest)), 6)
+
+    def test_picture_markup(self):
+        product = Product(pk=1, name='Ring Light', image='products/photo.png', image_digest='0123456789abcdef', image_width=500)
+        html = product_picture(product)
+        url = default_storage.url('products/derivatives/0123456789abcdef')
+        self.assertIn(f'<source type="image/webp" srcset="{url}-320w.webp 320w, {url}-640w.webp 500w"', html)
+        self.assertIn(f'<img src="{url}-320w.jpg" srcset="{url}-320w.jpg 320w, {url}-640w.jpg 500w"', html)
+        self.assertNotIn('960w', html)
+        product.image_width = 200
+        self.assertIn(f'srcset="{url}-320w.webp 200w"', product_picture(product))
+        product.image_digest = ''
+        self.assertHTMLEqual(
+            product_picture(product), f'<img src="{default_storage.url("products/photo.png")}" alt="Ring Light" loading="lazy" style="">'
+        )
+        self.assertEqual(product_picture(Product(name='Ring Light')), '')
+
+
+class ProductAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        for name, in_stock, day in (('Gaming Mouse', True, 1), ('Gaming Keyboard', False, 2), ('Ring Light', True, 3)):
+            product = Product.objects.create(name=name, price='10.00', in_stock=in_stock, stock_quantity=int(in_stock))
+            Product.objects.filter(pk=product.pk).update(created_at=f'2025-0{day}-15T12:00:00Z')
+
+    def export(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:products_product_export_csv'), params)
+            body = b''.join(response.streaming_content).decode() if response.streaming else response.content.decode()
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        return response, body
+
+    def test_export_applies_filters_and_ordering(self):
+        response, body = self.export(in_stock__exact='1', o='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(body.index('Gaming Mouse'), body.index('Ring Light'))
+        self.assertNotIn('Gaming Keyboard', body)
+        _, body = self.export(created_at__month='2', created_at__year='2025')
+        self.assertIn('Gaming Keyboard', body)
+        self.assertNotIn('Ring Light', body)
+
+    def test_export_rejects_bad_lookups(self):
+        self.assertEqual(self.client.get(reverse('admin:products_product_export_csv'), {'created_at__year': 'x'}).status_code, 400)
+
+    @override_settings(ADMIN_LARGE_TABLE_ROWS=0)
+    def test_date_hierarchy_caches_plain_dates(self):
+        url = reverse('admin:products_product_changelist')
+        first = self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertFalse([query for query in queries if 'MIN(' in query['sql'] or 'DISTINCT' in query['sql']])
+        self.assertEqual(first.context['choices'], second.context['choices'])
+        self.assertEqual([choice['title'] for choice in second.context['choices']], ['January 2025', 'February 2025', 'March 2025'])
+        # only ISO date strings are cached, never the rendered context
+        key = catalog_cache.key(f'admin:date_hierarchy:{hashlib.md5(b"?").hexdigest()}')
+        self.assertEqual([value[:7] for value in cache.get(f'{key}:month')], ['2025-01', '2025-02', '2025-03'])
+        self.assertEqual(sorted(cache.get(f'{key}:range')), ['first', 'last'])
+
+    def list_edit(self, **changes):
+        # the list_editable formset of the changelist page, with some values changed
+        products = Product.objects.order_by('-created_at')
+        data = {'form-TOTAL_FORMS': len(products), 'form-INITIAL_FORMS': len(products), '_save': 'Save'}
+        for index, product in enumerate(products):
+            values = {'price': product.price, 'in_stock': product.in_stock, 'stock_quantity': product.stock_quantity}
+            values.update(changes.get(product.name, {}))
+            data[f'form-{index}-id'] = product.pk
+            data[f'form-{index}-price'] = values['price']
+            data[f'form-{index}-stock_quantity'] = values['stock_quantity']
+            if values['in_stock']:
+                data[f'form-{index}-in_stock'] = 'on'
+        return self.client.post(reverse('admin:products_product_changelist'), data, follow=True)
+
+    def test_list_editable_save(self):
+        self.list_edit(**{'Gaming Keyboard': {'stock_quantity': 4, 'in_stock': True}, 'Ring Light': {'price': '12.50'}})
+        self.assertEqual(Product.objects.get(name='Gaming Keyboard').stock_quantity, 4)
+        self.assertEqual(Product.objects.get(name='Ring Light').price, Decimal('12.50'))
+        self.assertEqual(*stored_and_recounted_stats())
+
+    def test_list_editable_rechecks_reserved_units(self):
+        ring = Product.objects.get(name='Ring Light')
+        stock.restock(ring.pk, 4)
+        save_model = ProductAdmin.save_model
+
+        def reserve_meanwhile(admin, request, obj, form, change):
+            # an order reserves units after the formset was validated against the old row
+            if obj.pk == ring.pk:
+                stock.reserve(ring.pk, 4)
+            save_model(admin, request, obj, form, change)
+
+        with mock.patch.object(ProductAdmin, 'save_model', reserve_meanwhile):
+            response = self.list_edit(**{'Ring Light': {'stock_quantity': 2}, 'Gaming Keyboard': {'stock_quantity': 3}})
+        self.assertContains(response, 'Ring Light was not changed')
+        ring.refresh_from_db()
+        self.assertEqual((ring.stock_quantity, ring.reserved_quantity), (5, 4))
+        self.assertEqual(Product.objects.get(name='Gaming Keyboard').stock_quantity, 3)
+        self.assertEqual(*stored_and_recounted_stats())
+
+
+@skipUnless(related.np is not None, 'numpy is not installed')
+class RelatedProductsTests(TestCase):
+    WORDS = (
+        'leather wool cotton steel bamboo ceramic boots scarf kettle lamp wallet jacket mug tent '
+        'trail alpine garden kitchen desk travel vintage compact waterproof heated'
+    ).split()
+
+    def random_texts(self, rng, count):
+        return [
+            (' '.join(rng.choice(self.WORDS, 3)), ' '.join(rng.choice(self.WORDS, 6)))
+            for _ in range(count)
+        ]
+
+    def stored_lists(self):
+        # {product id: {rank: (related id, score)}}
+        lists = {}
+        for product_id, rank, related_id, score in RelatedProduct.objects.values_list('product_id', 'rank', 'related_id', 'score'):
+            lists.setdefault(product_id, {})[rank] = (related_id, score)
+        return lists
+
+    def test_top_k_matches_brute_force(self):
+        np = related.np
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((300, related.DIMENSIONS)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = np.arange(0, 300, 7)
+        ids, scores = related.top_k(vectors, queries, k=4)
+        expected = vectors[queries] @ vectors.T
+        expected[np.arange(len(queries)), queries] = -np.inf
+        self.assertEqual(ids.tolist(), np.argsort(-expected, axis=1, kind='stable')[:, :4].tolist())
+        self.assertTrue(np.allclose(scores, np.sort(expected, axis=1)[:, ::-1][:, :4]))
+
+    def test_lsh_finds_near_duplicates(self):
+        np = related.np
+        rng = np.random.default_rng(2)
+        originals = rng.standard_normal((200, related.DIMENSIONS)).astype(np.float32)
+        vectors = np.concatenate([originals, originals + 0.01 * rng.standard_normal(originals.shape, dtype=np.float32)])
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        with mock.patch.object(related, 'EXACT_PAIRS', 0):
+            ids, scores = related.top_k(vectors, np.arange(400), k=3)
+        # every row's twin comes first, and nobody is their own neighbor
+        self.assertEqual(ids[:, 0].tolist(), list(range(200, 400)) + list(range(200)))
+        self.assertFalse((ids == np.arange(400)[:, None]).any())
+        self.assertTrue((scores[:, 0] > 0.99).all())
+
+    def test_incremental_build_follows_edits_and_deletes(self):
+        np = related.np
+        rng = np.random.default_rng(3)
+        products = [
+            Product.objects.create(name=name, description=description, price='1.00')
+            for name, description in self.random_texts(rng, 60)
+        ]
+        related.build(full=True, k=3)
+        # edited products: a product they now beat the weakest neighbor of must list them
+        edited = products[:6]
+        for product, (name, description) in zip(edited, self.random_texts(rng, 6)):
+            product.name, product.description = name, description
+            product.save()
+        listed = RelatedProduct.objects.values_list('related_id', flat=True)
+        deleted = Product.objects.filter(pk__in=listed).exclude(pk__in=[product.pk for product in edited]).first()
+        deleted.delete()
+        record = related.build(k=3)
+        self.assertFalse(record.full)
+
+        ids, vectors = related.vectorize()
+        lists = self.stored_lists()
+        for product_id, ranks in lists.items():
+            # deleted neighbors were replaced: ranks stay contiguous
+            self.assertEqual(sorted(ranks), list(range(len(ranks))))
+            self.assertNotIn(deleted.pk, [related_id for related_id, _ in ranks.values()])
+        position = {pk: index for index, pk in enumerate(ids.tolist())}
+        for product in edited:
+            scores = vectors @ vectors[position[product.pk]]
+            for other, score in zip(ids.tolist(), scores.tolist()):
+                stored = lists.get(other, {}).values()
+                # the score an edited product had to beat to enter the other product's list
+                weakest = min(value for _, value in stored) if len(stored) == 3 else related.MIN_SCORE
+                if other != product.pk and score > weakest + 1e-6:
+                    self.assertIn(product.pk, [related_id for related_id, _ in stored], f'{other} should list {product.pk}')
+
+
+@skipUnless(Image is not None, 'Pillow is not installed')
+class SeedProductImagesTests(TransactionTestCase):
+    # the command closes the database connections before forking its render pool
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.checkpoint = Path(media.name) / 'products' / '.seed_product_images.checkpoint'
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.products = [Product.objects.create(name=f'Desk Lamp {index}', price='15.00') for index in range(5)]
+
+    def seed(self, *args, fail_at=None):
+        rendered = []
+        render = seed_product_images._render_job
+
+        def render_or_crash(job):
+            if job[0] == fail_at:
+                raise RuntimeError('killed')
+            rendered.append(render(job))
+            return rendered[-1]
+
+        with mock.patch.object(seed_product_images, '_render_job', render_or_crash):
+            output = StringIO()
+            try:
+                call_command('seed_product_images', '--batch-size', '2', *args, stdout=output)
+            except RuntimeError:
+                pass
+        return rendered, output.getvalue()
+
+    def test_resumes_after_the_last_saved_batch(self):
+        pks = [product.pk for product in self.products]
+        rendered, _ = self.seed('--overwrite', fail_at=pks[3])
+        self.assertEqual(rendered, pks[:3])
+        # only the first, complete batch was saved and checkpointed
+        self.assertEqual(self.checkpoint.read_text(), str(pks[1]))
+        self.assertEqual(Product.objects.exclude(image='').count(), 2)
+
+        rendered, output = self.seed('--overwrite')
+        self.assertIn(f'Resuming after product id {pks[1]}', output)
+        self.assertEqual(rendered, pks[2:])
+        self.assertFalse(self.checkpoint.exists())
+        self.assertFalse(Product.objects.filter(image='').exists())
+
+    def test_queues_the_derivatives_of_new_images(self):
+        Product.objects.filter(pk=self.products[0].pk).update(
+            image='products/old.png', image_digest='0123456789abcdef', image_width=800,
+        )
+        self.seed('--overwrite')
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertNotEqual(product.image.name, 'products/old.png')
+        self.assertEqual((product.image_digest, product.image_width), ('', 0))
+        queued = Task.objects.filter(name=tasks.build_image_derivatives.name)
+        self.assertEqual(
+            sorted(queued.values_list('dedup_key', flat=True)),
+            sorted(f'derivatives:{product.pk}:{product.image.name}' for product in Product.objects.all()),
+        )
+        # the replaced image and derivatives go to the media collector
+        self.assertEqual(Task.objects.filter(name=tasks.collect_media.name).get().args, [[['products/old.png', '0123456789abcdef']]])
+
+
+class MediaGarbageCollectionTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.root = Path(media.name)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        lamp = Product.objects.create(name='Desk Lamp', price='15.00', image='products/lamp.png')
+        Product.objects.filter(pk=lamp.pk).update(image_digest='aaaa')
+
+    def store(self, name, age=7200):
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'x')
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+        return path
+
+    def sweep(self, *args):
+        output = StringIO()
+        call_command('sweep_media', '--workers', '2', *args, stdout=output)
+        return output.getvalue()
+
+    def test_sweep_keeps_referenced_recent_and_bookkeeping_files(self):
+        kept = [
+            self.store('products/lamp.png'),
+            self.store('products/derivatives/aaaa-320w.webp'),
+            self.store('products/.seed_product_images.checkpoint'),
+            # an upload whose transaction may still be open
+            self.store('products/fresh.png', age=10),
+        ]
+        orphans = [self.store('products/old.png'), self.store('products/derivatives/bbbb-320w.webp')]
+
+        self.assertIn('Would delete 2 orphaned files', self.sweep('--dry-run'))
+        self.assertTrue(all(path.exists() for path in kept + orphans))
+
+        self.assertIn('Deleted 2 orphaned files', self.sweep())
+        self.assertTrue(all(path.exists() for path in kept))
+        self.assertFalse(any(path.exists() for path in orphans))
+
+        self.assertIn('Deleted 1 orphaned files', self.sweep('--min-age', '0'))
+        self.assertFalse(kept[3].exists())
+
+    def test_collect_keeps_what_a_product_still_uses(self):
+        fan = Product.objects.create(name='Desk Fan', price='25.00', image='products/shared.png')
+        Product.objects.filter(pk=fan.pk).update(image_digest='cccc')
+        files = [
+            self.store(name, age=0) for name in (
+                'products/shared.png', 'products/gone.png',
+                'products/derivatives/cccc-320w.webp', 'products/derivatives/dddd-320w.webp', 'products/derivatives/dddd-640w.jpg',
+            )
+        ]
+        deleted = collect([('products/shared.png', 'cccc'), ('products/gone.png', 'dddd'), ('', '')])
+        self.assertEqual(deleted, 3)
+        self.assertEqual([path.exists() for path in files], [True, False, True, False, False])
+        self.assertEqual(collect([('', '')]), 0)
@@ -0,0 +1,223 @@
+"""
+Product image uploads checked while they stream in.
+
+ImageUploadHandler (first in FILE_UPLOAD_HANDLERS) looks at every file posted
+as one of IMAGE_UPLOAD_FIELDS. It reads the format from the magic bytes and
+the dimensions from the image header before passing any byte on to Django's
+memory/temporary file handlers. A file that is not a JPEG/PNG/GIF, is larger
+than IMAGE_UPLOAD_MAX_BYTES, has a zero width or height or more than
+IMAGE_UPLOAD_MAX_PIXELS pixels is dropped on the spot: the rest of its body is read and discarded chunk by
+chunk, never buffered or decoded, and the form gets a RejectedUpload carrying
+the reason, which ValidatedImageField turns into a field error.
+
+Settings:
+    IMAGE_UPLOAD_MAX_BYTES   largest accepted image file (default 5 MB)
+    IMAGE_UPLOAD_MAX_PIXELS  largest accepted width * height (default 25 megapixels)
+    IMAGE_UPLOAD_REENCODE    Pillow format every accepted image is re-encoded to,
+                             e.g. 'WEBP' (default '' keeps the upload as it is)
+"""
+import os
+import struct
+from io import BytesIO
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # Pillow might not be installed yet
+    Image = None  # type: ignore
+    ImageOps = None  # type: ignore
+
+
+# multipart field names whose files are checked
+IMAGE_UPLOAD_FIELDS = {'image'}
+# accepted formats and their file extensions
+IMAGE_EXTENSIONS = {'JPEG': ('.jpg', '.jpeg'), 'PNG': ('.png',), 'GIF': ('.gif',)}
+# bytes read while looking for the dimensions (JPEG metadata can come before them)
+HEADER_MAX_BYTES = 256 * 1024
+# JPEG start-of-frame markers, the segments holding the dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD8, *range(0xD0, 0xD8)}
+# (mime type, file extension, save options) of the re-encode formats
+REENCODE_FORMATS = {
+    'WEBP': ('image/webp', '.webp', {'quality': 85, 'method': 4}),
+    'JPEG': ('image/jpeg', '.jpg', {'quality': 88, 'optimize': True}),
+    'PNG': ('image/png', '.png', {'optimize': True}),
+}
+
+
+def max_bytes():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 25_000_000)
+
+
+def allowed_extensions():
+    """File extensions a stored product image may have"""
+    extensions = [ext for group in IMAGE_EXTENSIONS.values() for ext in group]
+    image_format = getattr(settings, 'IMAGE_UPLOAD_REENCODE', '').upper()
+    if image_format in REENCODE_FORMATS:
+        extensions.append(REENCODE_FORMATS[image_format][1])
+    return extensions
+
+
+class UnsupportedImage(ValueError):
+    """The bytes are not an image in one of the accepted formats"""
+
+
+def _jpeg_size(header):
+    # walk the marker segments up to the first start-of-frame
+    i = 2
+    while True:
+        if i + 4 > len(header):
+            return None
+        if header[i] != 0xFF:
+            raise UnsupportedImage('Corrupt JPEG header')
+        marker = header[i + 1]
+        if marker == 0xFF:
+            i += 1  # fill byte
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(header):
+                return None
+            height, width = struct.unpack('>HH', header[i + 5:i + 9])
+            return width, height
+        if marker == 0xD9:
+            raise UnsupportedImage('JPEG has no image data')
+        i += 2 + struct.unpack('>H', header[i + 2:i + 4])[0]
+
+
+def sniff(header):
+    """
+    (format, width, height) read from the first bytes of an image.
+
+    Returns None when more bytes are needed, raises UnsupportedImage when the
+    bytes are not a JPEG, PNG or GIF.
+    """
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(header) < 24:
+            return None
+        if header[12:16] != b'IHDR':
+            raise UnsupportedImage('Corrupt PNG header')
+        width, height = struct.unpack('>II', header[16:24])
+        return 'PNG', width, height
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        if len(header) < 10:
+            return None
+        width, height = struct.unpack('<HH', header[6:10])
+        return 'GIF', width, height
+    if header.startswith(b'\xff\xd8'):
+        size = _jpeg_size(header)
+        return None if size is None else ('JPEG', *size)
+    if len(header) < 8:
+        return None
+    raise UnsupportedImage('Please upload a valid image file (JPG, PNG, GIF).')
+
+
+class RejectedUpload(UploadedFile):
+    """Stand-in for an upload ImageUploadHandler dropped, with the reason"""
+
+    def __init__(self, name, error):
+        super().__init__(BytesIO(), name=name, content_type=None, size=0)
+        self.error = error
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Check product image uploads from their first bytes and drop bad ones without buffering them"""
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.active = field_name in IMAGE_UPLOAD_FIELDS
+        self.header = b''
+        self.info = None
+        self.received = 0
+        self.error = None
+        if self.active and content_length and content_length > max_bytes():
+            self.reject(self.size_error())
+
+    def size_error(self):
+        return f'Image file size must be less than {max_bytes() // (1024 * 1024)}MB.'
+
+    def reject(self, error):
+        # keep reading (and discarding) the body; the next handlers get nothing
+        self.error = error
+        self.header = b''
+        return None
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error:
+            return None
+        self.received += len(raw_data)
+        if self.received > max_bytes():
+            return self.reject(self.size_error())
+        if self.info is not None:
+            return raw_data
+
+        self.header += raw_data
+        try:
+            info = sniff(self.header)
+        except UnsupportedImage as exc:
+            return self.reject(str(exc))
+        if info is None:
+            if len(self.header) >= HEADER_MAX_BYTES:
+                return self.reject('Could not read the image dimensions.')
+            return None
+        image_format, width, height = info
+        if not width or not height:
+            return self.reject(f'Image has no pixels ({width}x{height}).')
+        if width * height > max_pixels():
+            return self.reject(f'Image is too large ({width}x{height} pixels).')
+        self.info = info
+        # everything held back so far goes to the next handler in one piece
+        data, self.header = self.header, b''
+        return data
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.info is None and not self.error:
+            # the file ended before its header did
+            self.reject('Please upload a valid image file (JPG, PNG, GIF).')
+        if self.error:
+            return RejectedUpload(self.file_name, self.error)
+        return None
+
+
+def reencode(upload, image_format):
+    """The upload re-encoded to image_format, with EXIF orientation applied and metadata dropped"""
+    mime, extension, options = REENCODE_FORMATS[image_format]
+    upload.seek(0)
+    with Image.open(upload) as source:
+        image = ImageOps.exif_transpose(source)
+        if image_format == 'JPEG':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        output = BytesIO()
+        image.save(output, format=image_format, **options)
+    name = os.path.splitext(os.path.basename(upload.name))[0] + extension
+    return SimpleUploadedFile(name, output.getvalue(), content_type=mime)
+
+
+class ValidatedImageField(forms.ImageField):
+    """ImageField reporting ImageUploadHandler rejections, optionally re-encoding accepted images"""
+
+    def to_python(self, data):
+        if isinstance(data, RejectedUpload):
+            raise forms.ValidationError(data.error, code='invalid_image')
+        upload = super().to_python(data)
+        image_format = getattr(settings, 'IMAGE_UPLOAD_REENCODE', '')
+        if upload is not None and image_format and Image is not None:
+            upload = reencode(upload, image_format.upper())
+        return upload
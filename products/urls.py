@@ -2,6 +2,7 @@ from django.urls import path
 from .views import (
     home,
     product_list,
+    product_search,
     product_create,
     product_detail,
     product_update,
@@ -14,6 +15,7 @@ app_name = 'products'
 urlpatterns = [
     path('', home, name='home'),  # Home page
     path('list/', product_list, name='product_list'),  # Product list
+    path('search/', product_search, name='product_search'),  # Product search
     path('create/', product_create, name='product_create'),  # Product create
     path('<int:pk>/', product_detail, name='product_detail'),  # Product detail
     path('<int:pk>/edit/', product_update, name='product_update'),  # Product update
@@ -1,30 +1,74 @@
+from math import ceil
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.contrib.auth.decorators import login_required
-from .models import Product
+from django.contrib.auth.decorators import login_required, permission_required
+from django.http import Http404
+from django.views.decorators.http import condition
+from marketPlace.db import write_atomic
+from . import cache as catalog_cache
+from .conditional import catalog_etag, catalog_last_modified, product_etag, product_last_modified
+from .facets import CatalogFilter, facet_counts
+from .models import Product, reserved_stock_error
 from .forms import ProductForm
+from .pagination import KeysetPaginator
+from .search import MAX_RESULTS, search_products
 
 
 # product_list view
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def product_list(request):
-    # get all products from the database with proper ordering
-    products = Product.objects.all().order_by('-created_at')
-    # create a paginator with 12 products per page
-    paginator = Paginator(products, 12)
-    # get the page number from the request
-    page_number = request.GET.get('page')
-    # get the page object
-    page_obj = paginator.get_page(page_number)
-    # render the product_list template with the page object
-    return render(request, 'products/product_list.html', {'page_obj': page_obj})
+    # availability, price and date filters from the query string
+    catalog_filter = CatalogFilter(request.GET)
+    # facet counts and the filtered total, from one aggregate query
+    counts = facet_counts(catalog_filter)
+    # keyset paginator with 12 products per page, newest first
+    paginator = KeysetPaginator(catalog_filter.apply(Product.objects.all()), per_page=12, count=counts['total'])
+    # get the page after/before the opaque cursor tokens from the request
+    page_obj = paginator.get_page(after=request.GET.get('after'), before=request.GET.get('before'))
+    # render the product_list template with the page object, the filter form and the facets
+    return render(request, 'products/product_list.html', {
+        'page_obj': page_obj,
+        'filter_form': catalog_filter.form,
+        'filter_query': catalog_filter.querystring(),
+        'facets': catalog_filter.facets(counts),
+    })
+
+# product_search view
+def product_search(request):
+    # get the query and the page number from the request
+    query = request.GET.get('q', '').strip()
+    per_page = 12
+    # clamp the page to the range the ranked results can fill
+    last_page = max(1, ceil(MAX_RESULTS / per_page))
+    try:
+        page = min(max(1, int(request.GET.get('page', 1))), last_page)
+    except ValueError:
+        page = 1
+    # ranked lookup against the full-text index
+    products, total = search_products(query, limit=per_page, offset=(page - 1) * per_page)
+    context = {
+        'query': query,
+        'products': products,
+        'total': total,
+        'page': page,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if page * per_page < total else None,
+    }
+    # render the search template with the ranked products
+    return render(request, 'products/search.html', context)
 
 # product_detail view
+@condition(etag_func=product_etag, last_modified_func=product_last_modified)
 def product_detail(request, pk):
-    # get the product by the primary key
-    product = get_object_or_404(Product, pk=pk)
-    # render the product_detail template with the product
-    return render(request, 'products/product_detail.html', {'product': product})
+    # get the product by the primary key (served from the catalog cache)
+    product = catalog_cache.product(pk)
+    if product is None:
+        raise Http404('No Product matches the given query.')
+    # precomputed related products (one indexed query, cached like the product)
+    related = catalog_cache.related_products(pk)
+    # render the product_detail template with the product and its related products
+    return render(request, 'products/product_detail.html', {'product': product, 'related': related})
 
 # product_create view
 @login_required
@@ -41,24 +85,36 @@ def product_create(request):
         form = ProductForm()
     return render(request, 'products/product_form.html', {'form': form})
 
-# product_update view
+# product_update view (the Edit links are shown only with this permission too)
 @login_required
+@permission_required('products.change_product', raise_exception=True)
 def product_update(request, pk):
     product = get_object_or_404(Product, pk=pk)
     if request.method == 'POST':
         form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            product = form.save()
-            messages.success(request, 'Product updated successfully')
-            return redirect('products:product_detail', pk=product.pk)
-        else:
+            # write only the fields the user changed, so concurrent stock updates are not overwritten
+            product = form.save(commit=False)
+            with write_atomic():
+                if 'stock_quantity' in form.changed_data:
+                    # reservations made since the form was loaded count too: check against the locked row
+                    reserved = Product.objects.select_for_update().values_list('reserved_quantity', flat=True).get(pk=pk)
+                    if product.stock_quantity < reserved:
+                        form.add_error('stock_quantity', reserved_stock_error(reserved))
+                if form.changed_data and not form.errors:
+                    product.save(update_fields=[*form.changed_data, 'updated_at'])
+            if not form.errors:
+                messages.success(request, 'Product updated successfully')
+                return redirect('products:product_detail', pk=product.pk)
+        if form.errors:
             messages.error(request, 'Please correct the errors below.')
     else:
         form = ProductForm(instance=product)
     return render(request, 'products/product_form.html', {'form': form})    
 
-# product_delete view
+# product_delete view (the Delete links are shown only with this permission too)
 @login_required
+@permission_required('products.delete_product', raise_exception=True)
 def product_delete(request, pk):
     # get the product by the primary key
     product = get_object_or_404(Product, pk=pk)
@@ -70,19 +126,22 @@ def product_delete(request, pk):
     return redirect('products:product_list')
 
 # home view
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
 def home(request):
-    # get the 6 products that are in stock and order them by the created_at field in descending order
-    products = Product.objects.filter(in_stock=True).order_by('-created_at')[:6]
+    # get the 6 newest products that are in stock (served from the catalog cache)
+    products = catalog_cache.latest_in_stock(6)
     # render the home template with the products
     return render(request, 'products/home.html', {'products': products})
 
 # index view
 @login_required
 def index(request):
-    # get the 6 products that are in stock and order them by the created_at field in descending order
-    products = Product.objects.filter(in_stock=True).order_by('-created_at')[:6]
-    # render the index template with the products
-    return render(request, 'products/index.html', {'products': products})
+    # get the 6 newest products that are in stock (served from the catalog cache)
+    products = catalog_cache.latest_in_stock(6)
+    # catalog totals, maintained incrementally (no aggregate over the products table)
+    stats = catalog_cache.catalog_stats()
+    # render the index template with the products and the totals
+    return render(request, 'products/index.html', {'products': products, 'stats': stats})
 
 
 
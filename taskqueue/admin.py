@@ -0,0 +1,35 @@
+from django.contrib import admin
+
+from .models import Task
+from .queue import retry_failed
+
+
+class TaskAdmin(admin.ModelAdmin):
+    # list_display to show the task, its state and when it runs
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'finished_at']
+    # list_filter to filter by status and task name
+    list_filter = ['status', 'name']
+    # search_fields to find tasks by name or dedup key
+    search_fields = ['name', 'dedup_key']
+    # tasks are written by the queue only
+    readonly_fields = [
+        'name', 'args', 'kwargs', 'dedup_key', 'status', 'attempts', 'max_attempts', 'run_at',
+        'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at',
+    ]
+    ordering = ['-id']
+    list_per_page = 50
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Run the selected failed tasks again')
+    def retry(self, request, queryset):
+        queued, skipped = retry_failed(queryset)
+        message = f"{queued} tasks queued again"
+        if skipped:
+            message += f", {skipped} skipped (a task with the same dedup key is already queued)"
+        self.message_user(request, message)
+
+
+admin.site.register(Task, TaskAdmin)
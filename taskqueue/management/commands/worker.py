@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from taskqueue.queue import claim, execute, purge, requeue_stale
+
+
+# seconds between checks for stale tasks and purges of old done tasks
+MAINTENANCE_INTERVAL = 60
+# seconds between the parent's checks for worker processes that died
+SUPERVISE_INTERVAL = 1.0
+# seconds before restarting a worker that crashed, doubled for every crash in a row
+RESTART_DELAY = 1.0
+# upper bound on that delay
+RESTART_DELAY_MAX = 60.0
+# a worker that ran at least this many seconds before crashing starts over from RESTART_DELAY
+RESTART_RESET_AFTER = 60.0
+
+
+def restart_delay(crashes):
+    """Seconds to wait before restarting a worker that crashed crashes times in a row"""
+    return min(RESTART_DELAY_MAX, RESTART_DELAY * 2 ** (max(1, crashes) - 1))
+
+
+def work(worker_id, options, stop):
+    """Claim and run tasks until stop is set (or the queue is empty with --once)"""
+    done = failed = 0
+    last_maintenance = 0.0
+    while not stop.is_set():
+        close_old_connections()
+        if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+            requeue_stale()
+            if options['purge_after']:
+                purge(options['purge_after'])
+            last_maintenance = time.monotonic()
+        tasks = claim(worker_id, options['batch_size'])
+        if not tasks:
+            if options['once']:
+                break
+            stop.wait(options['poll_interval'])
+            continue
+        for task_row in tasks:
+            if execute(task_row):
+                done += 1
+            else:
+                failed += 1
+    connections.close_all()
+    return done, failed
+
+
+def _stop_on(stop, *signals):
+    # finish the running task, then exit
+    for signum in signals:
+        signal.signal(signum, lambda *_: stop.set())
+
+
+def _child(options):
+    # Ctrl-C reaches the whole process group, the parent decides when to stop
+    # and sends SIGTERM; no lock is shared with the parent, so a killed worker
+    # cannot leave one held
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    stop = threading.Event()
+    _stop_on(stop, signal.SIGTERM)
+    work(f'{socket.gethostname()}:{os.getpid()}', options, stop)
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes (1 runs in this process)')
+        parser.add_argument('--batch-size', type=int, default=1, help='Tasks claimed per query')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit when no task is due instead of polling')
+        parser.add_argument(
+            '--purge-after', type=int, default=7 * 24 * 3600,
+            help='Delete done tasks this many seconds after they finished (0 keeps them)',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] <= 1:
+            stop = threading.Event()
+            _stop_on(stop, signal.SIGTERM, signal.SIGINT)
+            worker_id = f'{socket.gethostname()}:{os.getpid()}'
+            self.stdout.write(f"Worker {worker_id} started")
+            done, failed = work(worker_id, options, stop)
+            self.stdout.write(self.style.SUCCESS(f"{done} tasks done, {failed} failed attempts"))
+            return
+
+        # forked workers must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+
+        def start(index):
+            process = context.Process(target=_child, args=(options,), name=f'worker-{index}')
+            process.start()
+            return process
+
+        processes = [start(index) for index in range(options['processes'])]
+        self.stdout.write(f"Started {len(processes)} worker processes")
+        # per slot: when its process started, its crashes in a row, when it is due for a restart
+        started = [time.monotonic()] * len(processes)
+        crashes = [0] * len(processes)
+        restart_at = [None] * len(processes)
+
+        stop = threading.Event()
+        _stop_on(stop, signal.SIGTERM, signal.SIGINT)
+        # a worker that exits cleanly is done (--once found the queue empty); one that
+        # crashed or was killed is replaced, its task is requeued after the lock timeout.
+        # A worker crashing at startup (bad settings, database down) is restarted with a
+        # growing delay instead of every SUPERVISE_INTERVAL
+        while not stop.is_set() and any(process.exitcode != 0 for process in processes):
+            now = time.monotonic()
+            for index, process in enumerate(processes):
+                if process.exitcode in (None, 0):
+                    continue
+                if restart_at[index] is None:
+                    crashes[index] = 1 if now - started[index] >= RESTART_RESET_AFTER else crashes[index] + 1
+                    delay = restart_delay(crashes[index])
+                    restart_at[index] = now + delay
+                    self.stderr.write(f"{process.name} exited with code {process.exitcode}, restarting it in {delay:.0f}s")
+                elif now >= restart_at[index]:
+                    processes[index] = start(index)
+                    started[index], restart_at[index] = now, None
+            time.sleep(SUPERVISE_INTERVAL)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
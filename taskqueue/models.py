@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+# Task model: one unit of background work, stored until a worker has run it
+class Task(models.Model):
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    # registered name of the task function (its dotted path)
+    name = models.CharField(max_length=200)
+    # jsonfields to store the positional and keyword arguments
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # while a task with this key is queued, enqueueing the same key again is a no-op
+    dedup_key = models.CharField(max_length=255, blank=True, null=True)
+    # charfield to store the state of the task
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # runs started so far, and how many are allowed before the task is marked failed
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # earliest time a worker may pick the task up (pushed back after a failed attempt)
+    run_at = models.DateTimeField(default=timezone.now)
+    # worker holding the task and since when, to requeue tasks of crashed workers
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(blank=True, null=True)
+    # traceback of the last failed attempt
+    last_error = models.TextField(blank=True, default='')
+    # datetimefields to store when the task was created and when it finished
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'taskqueue_task'
+        ordering = ['run_at', 'id']
+        indexes = [
+            # the worker's claim query: due queued tasks, oldest first
+            models.Index(fields=['status', 'run_at', 'id'], name='taskqueue_due_idx'),
+        ]
+        constraints = [
+            # one queued task per dedup key (enforced where partial indexes exist, checked in enqueue() too)
+            models.UniqueConstraint(
+                fields=['dedup_key'], condition=Q(status='queued'), name='taskqueue_queued_dedup_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    def retry_at(self, base_delay):
+        """When the next attempt may run: base_delay seconds, doubled after every failed attempt"""
+        return timezone.now() + timedelta(seconds=base_delay * 2 ** max(0, self.attempts - 1))
@@ -0,0 +1,217 @@
+"""
+A task queue stored in the database, run by ``manage.py worker``.
+
+Register a function with @task, then enqueue calls to it; arguments must be
+JSON serialisable. Enqueueing writes one row, a worker process picks it up::
+
+    from taskqueue.queue import task
+
+    @task(max_attempts=5, retry_delay=30)
+    def send_receipt(order_id):
+        ...
+
+    send_receipt.enqueue_on_commit(order.pk, dedup_key=f'receipt:{order.pk}')
+
+Failed runs are retried with exponential backoff until max_attempts, then the
+task is marked failed with its traceback. While a task with a dedup_key is
+queued, enqueueing the same key again returns the queued task; a failed run
+whose retry would clash with such a task is marked failed and leaves the work
+to it.
+
+Settings:
+    TASK_QUEUE_EAGER         run tasks inline instead of storing them, logging their errors (no worker needed, default False)
+    TASK_QUEUE_LOCK_TIMEOUT  seconds after which a running task of a dead worker is requeued (default 600)
+"""
+import logging
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from marketPlace.db import write_atomic
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# registered name -> TaskFunction
+REGISTRY = {}
+# default seconds before the first retry (doubled for each further one)
+RETRY_DELAY = 10
+# last_error note of a task that was not queued again because a newer task holds its dedup key
+SUPERSEDED = 'Not queued again: a newer task with the same dedup key is queued.'
+
+
+class TaskFunction:
+    """A registered task; call it directly or enqueue it"""
+
+    def __init__(self, func, name, max_attempts, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def enqueue(self, *args, dedup_key=None, delay=0, **kwargs):
+        """Store a call to run in a worker (run it now with TASK_QUEUE_EAGER), return the Task or None"""
+        if getattr(settings, 'TASK_QUEUE_EAGER', False):
+            try:
+                self.func(*args, **kwargs)
+            except Exception:
+                # as under a worker, a failing task never breaks the code that queued it
+                # (enqueue_on_commit runs this after the caller's transaction has committed)
+                logger.exception('Task %s failed', self.name)
+            return None
+        if dedup_key is not None:
+            queued = Task.objects.filter(dedup_key=dedup_key, status=Task.QUEUED).first()
+            if queued is not None:
+                return queued
+        try:
+            with transaction.atomic():
+                return Task.objects.create(
+                    name=self.name,
+                    args=list(args),
+                    kwargs=kwargs,
+                    dedup_key=dedup_key,
+                    max_attempts=self.max_attempts,
+                    run_at=timezone.now() + timedelta(seconds=delay),
+                )
+        except IntegrityError:
+            # another process queued the same key in the meantime
+            return Task.objects.filter(dedup_key=dedup_key, status=Task.QUEUED).first()
+
+    def enqueue_on_commit(self, *args, **kwargs):
+        """enqueue() once the current transaction commits, so workers never see uncommitted data"""
+        transaction.on_commit(lambda: self.enqueue(*args, **kwargs))
+
+
+def task(func=None, *, name=None, max_attempts=3, retry_delay=RETRY_DELAY):
+    """Register a function as a task (usable as @task or @task(...))"""
+    def register(func):
+        registered = TaskFunction(func, name or f'{func.__module__}.{func.__qualname__}', max_attempts, retry_delay)
+        REGISTRY[registered.name] = registered
+        return registered
+    return register(func) if func is not None else register
+
+
+def resolve(name):
+    """The TaskFunction registered under name, importing its module if needed"""
+    if name not in REGISTRY:
+        module, _, _ = name.rpartition('.')
+        import_module(module)
+    return REGISTRY[name]
+
+
+def claim(worker_id, limit=1):
+    """Mark up to limit due tasks as running for worker_id and return them"""
+    now = timezone.now()
+    with write_atomic():
+        due = Task.objects.filter(status=Task.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+        # row locks where the database has them; the status check below covers SQLite
+        ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        Task.objects.filter(pk__in=ids, status=Task.QUEUED).update(
+            status=Task.RUNNING, locked_by=worker_id, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(pk__in=ids, status=Task.RUNNING, locked_by=worker_id, locked_at=now))
+
+
+def execute(task_row):
+    """Run one claimed task and record the outcome; returns True on success"""
+    try:
+        function = resolve(task_row.name)
+        function.func(*task_row.args, **task_row.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        retry_delay = REGISTRY[task_row.name].retry_delay if task_row.name in REGISTRY else RETRY_DELAY
+        if task_row.attempts < task_row.max_attempts:
+            logger.warning('Task %s failed (attempt %d/%d), retrying', task_row, task_row.attempts, task_row.max_attempts)
+            changes = {'status': Task.QUEUED, 'run_at': task_row.retry_at(retry_delay)}
+        else:
+            logger.error('Task %s failed permanently:\n%s', task_row, error)
+            changes = {'status': Task.FAILED, 'finished_at': timezone.now()}
+        _finish(task_row, last_error=error, **changes)
+        return False
+    _finish(task_row, status=Task.DONE, finished_at=timezone.now(), last_error='')
+    return True
+
+
+def _finish(task_row, **changes):
+    # only if the task is still ours (not requeued after a lock timeout)
+    changes.setdefault('locked_by', '')
+    changes.setdefault('locked_at', None)
+    try:
+        # a savepoint, so the failed UPDATE leaves a surrounding transaction usable
+        with transaction.atomic():
+            Task.objects.filter(pk=task_row.pk, status=Task.RUNNING, locked_by=task_row.locked_by).update(**changes)
+    except IntegrityError:
+        # a retry would duplicate a dedup key that was queued again meanwhile: this attempt
+        # failed and the newer queued task does the work
+        Task.objects.filter(pk=task_row.pk, status=Task.RUNNING, locked_by=task_row.locked_by).update(
+            status=Task.FAILED, finished_at=timezone.now(), locked_by='', locked_at=None,
+            last_error=f"{changes.get('last_error', '')}\n{SUPERSEDED}",
+        )
+
+
+def requeue_stale():
+    """Put running tasks whose worker stopped answering back in the queue, return how many"""
+    timeout = getattr(settings, 'TASK_QUEUE_LOCK_TIMEOUT', 600)
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout))
+    requeued = 0
+    for task_row in stale.only('pk', 'dedup_key'):
+        try:
+            with transaction.atomic():
+                requeued += Task.objects.filter(pk=task_row.pk, status=Task.RUNNING).update(
+                    status=Task.QUEUED, locked_by='', locked_at=None,
+                )
+        except IntegrityError:
+            # the same key was queued again meanwhile, that task covers this one
+            Task.objects.filter(pk=task_row.pk, status=Task.RUNNING).update(
+                status=Task.FAILED, finished_at=timezone.now(), locked_by='', locked_at=None,
+                last_error=f'The worker stopped answering.\n{SUPERSEDED}',
+            )
+    return requeued
+
+
+def retry_failed(tasks):
+    """Queue the failed tasks among tasks again, return (queued, skipped)
+
+    At most one task per dedup key can be queued: a failed task whose key is
+    already queued, or is requeued here for a newer task, is skipped.
+    """
+    with write_atomic():
+        failed = list(tasks.filter(status=Task.FAILED).order_by('-id').values_list('pk', 'dedup_key'))
+        taken = set(
+            Task.objects.filter(status=Task.QUEUED, dedup_key__in={key for _, key in failed if key is not None})
+            .values_list('dedup_key', flat=True)
+        )
+        ids = []
+        for pk, dedup_key in failed:
+            if dedup_key is not None:
+                if dedup_key in taken:
+                    continue
+                taken.add(dedup_key)
+            ids.append(pk)
+        queued = Task.objects.filter(pk__in=ids, status=Task.FAILED).update(
+            status=Task.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None,
+        )
+    return queued, len(failed) - queued
+
+
+def purge(older_than):
+    """Delete done tasks finished more than older_than seconds ago, return how many"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    deleted, _ = Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()
+    return deleted
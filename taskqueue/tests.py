@@ -0,0 +1,154 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Task
+from .management.commands.worker import RESTART_DELAY_MAX, restart_delay
+from .queue import SUPERSEDED, claim, execute, requeue_stale, retry_failed, task
+
+
+# calls made by the test tasks
+CALLS = []
+
+
+@task(max_attempts=3, retry_delay=10)
+def record(value):
+    CALLS.append(value)
+
+
+@task(max_attempts=2, retry_delay=10)
+def fail(value):
+    raise ValueError(value)
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_and_run(self):
+        queued = record.enqueue('a')
+        self.assertEqual((queued.name, queued.args, queued.status), ('taskqueue.tests.record', ['a'], Task.QUEUED))
+        claimed = claim('test')
+        self.assertEqual([task_row.pk for task_row in claimed], [queued.pk])
+        self.assertTrue(execute(claimed[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.DONE, 1))
+        self.assertEqual(CALLS, ['a'])
+
+    def test_dedup_while_queued(self):
+        first = record.enqueue('a', dedup_key='k')
+        self.assertEqual(record.enqueue('b', dedup_key='k').pk, first.pk)
+        execute(claim('test')[0])
+        self.assertNotEqual(record.enqueue('c', dedup_key='k').pk, first.pk)
+        self.assertEqual(Task.objects.filter(dedup_key='k').count(), 2)
+
+    def test_claim_skips_running_and_future_tasks(self):
+        record.enqueue('now')
+        record.enqueue('later', delay=60)
+        self.assertEqual(len(claim('one', limit=5)), 1)
+        self.assertEqual(claim('two', limit=5), [])
+
+    def test_retry_with_backoff_then_fail(self):
+        queued = fail.enqueue('boom')
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            self.assertFalse(execute(claim('test')[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertIn('ValueError: boom', queued.last_error)
+        self.assertAlmostEqual((queued.run_at - timezone.now()).total_seconds(), 10, delta=2)
+
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        with self.assertLogs('taskqueue.queue', 'ERROR'):
+            self.assertFalse(execute(claim('test')[0]))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_retry_leaves_the_work_to_a_newer_queued_task(self):
+        first = fail.enqueue('boom', dedup_key='k')
+        claimed = claim('test')[0]
+        # queued while the first one runs
+        newer = fail.enqueue('again', dedup_key='k')
+        self.assertNotEqual(newer.pk, first.pk)
+        with self.assertLogs('taskqueue.queue', 'WARNING'):
+            self.assertFalse(execute(claimed))
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.locked_by), (Task.FAILED, ''))
+        self.assertIn('ValueError: boom', first.last_error)
+        self.assertIn(SUPERSEDED, first.last_error)
+        self.assertEqual(Task.objects.get(pk=newer.pk).status, Task.QUEUED)
+
+    def test_stale_task_superseded_by_a_queued_one(self):
+        first = record.enqueue('a', dedup_key='k')
+        claim('dead')
+        newer = record.enqueue('b', dedup_key='k')
+        Task.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 0)
+        first.refresh_from_db()
+        self.assertEqual(first.status, Task.FAILED)
+        self.assertIn(SUPERSEDED, first.last_error)
+        self.assertEqual(claim('alive')[0].pk, newer.pk)
+
+    def test_backoff_doubles(self):
+        task_row = Task(attempts=3)
+        self.assertAlmostEqual((task_row.retry_at(10) - timezone.now()).total_seconds(), 40, delta=2)
+
+    def test_requeue_stale(self):
+        record.enqueue('a')
+        claimed = claim('dead')[0]
+        Task.objects.filter(pk=claimed.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(claim('alive')[0].pk, claimed.pk)
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_eager_errors_do_not_reach_the_caller(self):
+        with self.assertLogs('taskqueue.queue', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    fail.enqueue_on_commit('boom')
+                    record.enqueue_on_commit('after')
+        self.assertEqual(CALLS, ['after'])
+        self.assertFalse(Task.objects.exists())
+
+
+class RetryFailedTests(TestCase):
+    def failed(self, dedup_key=None):
+        return Task.objects.create(name=record.name, args=['a'], dedup_key=dedup_key, status=Task.FAILED, attempts=3)
+
+    def test_requeues_failed_tasks_only(self):
+        failed = self.failed()
+        done = Task.objects.create(name=record.name, status=Task.DONE)
+        self.assertEqual(retry_failed(Task.objects.all()), (1, 0))
+        failed.refresh_from_db()
+        done.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts, done.status), (Task.QUEUED, 0, Task.DONE))
+
+    def test_skips_keys_already_queued(self):
+        record.enqueue('a', dedup_key='k')
+        failed = self.failed('k')
+        self.assertEqual(retry_failed(Task.objects.filter(pk=failed.pk)), (0, 1))
+        self.assertEqual(Task.objects.filter(dedup_key='k', status=Task.QUEUED).count(), 1)
+
+    def test_one_task_per_key(self):
+        self.failed('k')
+        newest = self.failed('k')
+        self.assertEqual(retry_failed(Task.objects.all()), (1, 1))
+        self.assertEqual(Task.objects.get(status=Task.QUEUED).pk, newest.pk)
+
+    def test_admin_action(self):
+        record.enqueue('a', dedup_key='k')
+        failed = [self.failed('k'), self.failed()]
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        response = self.client.post(reverse('admin:taskqueue_task_changelist'), {
+            'action': 'retry', '_selected_action': [task_row.pk for task_row in failed],
+        }, follow=True)
+        self.assertContains(response, '1 tasks queued again, 1 skipped')
+
+
+class WorkerTests(TestCase):
+    def test_restart_delay_backs_off(self):
+        self.assertEqual([restart_delay(crashes) for crashes in range(1, 6)], [1, 2, 4, 8, 16])
+        self.assertEqual(restart_delay(100), RESTART_DELAY_MAX)